@@ -0,0 +1,246 @@
+"""
+SymphonyAgents Benchmark
+以離線 mock LLM 重複執行 ConductorAgent.compose，量測流程本身的效能
+
+輸出內容：
+1. 每個階段（design_framework … evaluate_and_revise）的 p50/p95/p99 牆鐘時間
+2. 樂譜轉換（_json_to_part、_part_to_json、匯出時的 to_music21 與 MusicXML 寫入）的 CPU 時間
+3. 峰值 RSS
+4. 各階段每次執行的平均 LLM 呼叫次數與 token 數
+5. 串流模式（--stream）下各聲部首個音符與首個小節完成的時間
+
+結果寫成 JSON，可在不同 commit 之間比對，藉此區分流程本身的退化與提供者的延遲。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from music21 import stream
+
+from src.composer.composer import ConductorAgent
+from src.llm.mock import configure_mock
+from src.llm.tokens import use_ledger
+from src.music.musician_agent import MusicianAgent
+from src.tracing import configure_tracing
+
+# 預設編制，與 main.py 的 INSTRUMENT_CONFIG 相同再加上鋼琴
+DEFAULT_INSTRUMENTS = ["violin", "viola", "cello", "flute", "clarinet", "trumpet", "timpani", "piano"]
+
+# 需要量測 CPU 時間的 music21 轉換函式
+CONVERSIONS = ["_json_to_part", "_part_to_json"]
+
+
+def percentile(values, q: float) -> float:
+    """線性內插的百分位數"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values) -> dict:
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+@contextlib.contextmanager
+def cpu_timers(samples: dict):
+    """暫時包裝 MusicianAgent 的轉換函式，累計每次呼叫的 CPU 時間"""
+    originals = {name: getattr(MusicianAgent, name) for name in CONVERSIONS}
+
+    def wrap(name, func):
+        def timed(self, *args, **kwargs):
+            started = time.process_time()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                samples[name].append(time.process_time() - started)
+        return timed
+
+    for name, func in originals.items():
+        setattr(MusicianAgent, name, wrap(name, func))
+    try:
+        yield
+    finally:
+        for name, func in originals.items():
+            setattr(MusicianAgent, name, func)
+
+
+def peak_rss_mb() -> float:
+    """峰值 RSS（MB）；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes，Windows 改用 psutil"""
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def tokens_per_run(usages: list, runs: int) -> dict:
+    """每次執行的平均 token 數；沒有呼叫該階段的執行（例如本地檢查未通過而略過 LLM 評估）以 0 計入"""
+    padded = usages + [dict.fromkeys(usages[0], 0)] * (runs - len(usages))
+    averages = {field: sum(u[field] for u in padded) / len(padded) for field in usages[0]}
+    averages["runs_with_calls"] = len(usages)
+    return averages
+
+
+def run_once(args, stage_samples: dict, cpu_samples: dict, token_samples: dict, stream_samples: dict):
+    """執行一次完整流程並記錄各階段時間"""
+    conductor = ConductorAgent(api_provider="mock", num_measures=args.measures)
+    for name in args.instruments:
+        conductor.add_instrument(name, "melody")
+
+    scores = conductor.compose(parallel=args.parallel, max_concurrency=args.max_concurrency, stream=args.stream, ensemble=args.ensemble)
+    for stage, seconds in conductor.stage_timings.items():
+        stage_samples[stage].append(seconds)
+    for metrics in conductor.stream_metrics.values():
+        for name in ("time_to_first_note", "time_to_first_measure"):
+            if metrics.get(name) is not None:
+                stream_samples[name].append(metrics[name])
+
+    # 評估階段目前在 compose 中停用，這裡單獨量測一次評估
+    started = time.perf_counter()
+    with use_ledger(conductor.token_ledger):
+        conductor.score_evaluator.evaluate_score(scores, conductor.musicians, args.measures,
+                                                       conductor.params["time_signature"])
+    stage_samples["evaluate_and_revise"].append(time.perf_counter() - started)
+    for stage, usage in conductor.token_ledger.totals().items():
+        token_samples[stage].append(usage)
+
+    started = time.process_time()
+    score = stream.Score()
+    for part in scores.values():
+        score.insert(0, part.to_music21())
+    cpu_samples["to_music21"].append(time.process_time() - started)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        started = time.process_time()
+        score.write("musicxml", fp=os.path.join(temp_dir, "benchmark.musicxml"))
+        cpu_samples["musicxml_write"].append(time.process_time() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以 mock LLM 量測 ConductorAgent.compose 的各階段效能")
+    parser.add_argument("--runs", type=int, default=10, help="執行次數")
+    parser.add_argument("--instruments", nargs="+", default=DEFAULT_INSTRUMENTS, help="樂器編制")
+    parser.add_argument("--measures", type=int, default=4, help="小節數")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock 首個 token 延遲中位數（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="mock 延遲的對數常態 sigma")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="mock 輸出速度，0 表示瞬間完成")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="mock 失敗機率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="mock 格式錯誤機率")
+    parser.add_argument("--parallel", action="store_true", help="同時生成所有聲部")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="平行生成的請求上限")
+    parser.add_argument("--stream", action="store_true", help="以串流方式生成樂譜並量測首個小節時間")
+    parser.add_argument("--ensemble", action="store_true", help="以一次請求生成所有聲部")
+    parser.add_argument("--seed", type=int, default=0, help="mock 亂數種子")
+    parser.add_argument("--output", default=os.path.join(".cache", "bench_results.json"), help="結果 JSON 路徑")
+    parser.add_argument("--verbose", action="store_true", help="保留 compose 的終端輸出")
+    parser.add_argument("--trace", default=None, help="將追蹤 span 寫入此 JSONL 檔")
+    args = parser.parse_args()
+
+    configure_tracing(jsonl_path=args.trace)
+
+    configure_mock(
+        latency_mean=args.latency, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, failure_rate=args.failure_rate,
+        malformed_rate=args.malformed_rate, measures=args.measures, seed=args.seed,
+    )
+
+    stage_samples = defaultdict(list)
+    cpu_samples = defaultdict(list)
+    token_samples = defaultdict(list)
+    stream_samples = defaultdict(list)
+    started = time.perf_counter()
+    with cpu_timers(cpu_samples):
+        for run in range(args.runs):
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                run_once(args, stage_samples, cpu_samples, token_samples, stream_samples)
+            print(f"run {run + 1}/{args.runs} 完成", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    stages = ConductorAgent.STAGES
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "instruments": args.instruments,
+            "measures": args.measures,
+            "parallel": args.parallel,
+            "max_concurrency": args.max_concurrency,
+            "stream": args.stream,
+            "ensemble": args.ensemble,
+            "mock": {
+                "latency": args.latency, "latency_sigma": args.latency_sigma,
+                "tokens_per_second": args.tokens_per_second,
+                "failure_rate": args.failure_rate, "malformed_rate": args.malformed_rate,
+                "seed": args.seed,
+            },
+        },
+        "wall_seconds": {stage: summarize(stage_samples[stage]) for stage in stages if stage in stage_samples},
+        "cpu_seconds": {
+            name: dict(summarize(samples), total=sum(samples)) for name, samples in cpu_samples.items()
+        },
+        "stream_seconds": {name: summarize(samples) for name, samples in stream_samples.items()},
+        # 依流程順序排列，不屬於任何階段的呼叫（other）在後，合計最後；不依各次執行首次出現的順序
+        "tokens_per_run": {
+            stage: tokens_per_run(token_samples[stage], args.runs)
+            for stage in [s for s in stages if s in token_samples]
+            + sorted(s for s in token_samples if s not in stages and s != "total")
+            + (["total"] if "total" in token_samples else [])
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "total_seconds": elapsed,
+    }
+
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    for stage, summary in results["wall_seconds"].items():
+        print(f"{stage:<24} p50={summary['p50']:.4f}s p95={summary['p95']:.4f}s p99={summary['p99']:.4f}s")
+    for name, summary in results["cpu_seconds"].items():
+        print(f"{name:<24} cpu total={summary['total']:.4f}s p50={summary['p50']:.5f}s")
+    for name, summary in results["stream_seconds"].items():
+        print(f"{name:<24} p50={summary['p50']:.4f}s p95={summary['p95']:.4f}s")
+    for stage, usage in results["tokens_per_run"].items():
+        print(f"{stage:<24} tokens/run prompt={usage['prompt_tokens']:.0f} completion={usage['completion_tokens']:.0f}")
+    print(f"peak RSS {results['peak_rss_mb']:.1f} MB，結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# 標準函式庫
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Optional
+
+__all__ = ["CheckpointStore", "params_key"]
+
+DEFAULT_CHECKPOINT_DIR = "temp"
+
+def params_key(params: Dict) -> str:
+    """
+    將作曲參數正規化後計算雜湊，作為檢查點目錄名稱。
+    只納入影響生成結果的參數，structure、plan 等由流程產生的欄位不列入。
+
+    Args:
+        params (Dict): ConductorAgent 的 params。
+
+    Returns:
+        str: 16 位十六進位雜湊字串。
+    """
+    normalized = {
+        "style": str(params.get("style", "")).strip().lower(),
+        "tempo": int(params.get("tempo", 0)),
+        "key": str(params.get("key", "")).strip().lower(),
+        "time_signature": str(params.get("time_signature", "")).strip(),
+        "num_measures": int(params.get("num_measures", 0)),
+        "instruments": sorted(params.get("instruments", [])),
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CheckpointStore:
+    """
+    以參數雜湊為鍵的階段檢查點。
+
+    每組參數有自己的目錄 `<root>/<params_key>/`，每個完成的階段存成一個 JSON 檔，
+    逐樂器完成的結果另存於 `<stage>/<樂器>.json`。所有檔案先寫入暫存檔再以
+    os.replace 原子替換，中途崩潰不會留下半個檔案。
+    樂譜以 JSON 音符列表保存，不再 pickle music21 物件。
+
+    Attributes:
+        key (str): 參數雜湊。
+        directory (str): 此組參數的檢查點目錄。
+    """
+
+    def __init__(self, params: Dict, root: str = DEFAULT_CHECKPOINT_DIR):
+        self.key = params_key(params)
+        self.directory = os.path.join(root, self.key)
+
+    def _path(self, stage: str) -> str:
+        return os.path.join(self.directory, f"{stage}.json")
+
+    def _write(self, path: str, record: Dict) -> str:
+        """先寫入同目錄的暫存檔再原子替換"""
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+
+    def _read(self, path: str) -> Optional[Dict]:
+        """讀取檢查點紀錄；不存在、損毀或屬於其他參數時返回 None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(record, dict) or record.get("params_key") != self.key:
+            return None
+        return record
+
+    def save(self, stage: str, data) -> str:
+        """
+        原子地保存某階段的結果。
+
+        Args:
+            stage (str): 階段名稱。
+            data: 可 JSON 序列化的階段結果。
+
+        Returns:
+            str: 檢查點檔案路徑。
+        """
+        record = {"stage": stage, "params_key": self.key, "saved_at": time.time(), "data": data}
+        return self._write(self._path(stage), record)
+
+    def load(self, stage: str) -> Optional[object]:
+        """
+        載入某階段的結果。
+
+        Returns:
+            Optional[object]: 階段結果；檔案不存在、損毀或屬於其他參數時返回 None。
+        """
+        record = self._read(self._path(stage))
+        if record is None or record.get("stage") != stage:
+            return None
+        return record.get("data")
+
+    def save_item(self, stage: str, name: str, data) -> str:
+        """
+        保存階段中單一樂器的結果，讓失敗的聲部重跑時不必重新生成已完成的聲部。
+
+        Args:
+            stage (str): 階段名稱。
+            name (str): 樂器名稱。
+            data: 可 JSON 序列化的結果。
+
+        Returns:
+            str: 檢查點檔案路徑。
+        """
+        record = {"stage": stage, "name": name, "params_key": self.key, "saved_at": time.time(), "data": data}
+        return self._write(os.path.join(self.directory, stage, f"{name}.json"), record)
+
+    def load_items(self, stage: str) -> Dict[str, object]:
+        """
+        載入階段中所有已完成樂器的結果。
+
+        Returns:
+            Dict[str, object]: 樂器名稱對應的結果，沒有任何結果時為空字典。
+        """
+        items = {}
+        item_dir = os.path.join(self.directory, stage)
+        if not os.path.isdir(item_dir):
+            return items
+        for file_name in sorted(os.listdir(item_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            record = self._read(os.path.join(item_dir, file_name))
+            if record is None or record.get("stage") != stage or "name" not in record:
+                continue
+            items[record["name"]] = record.get("data")
+        return items
+
+    def discard(self, stage: str, name: Optional[str] = None):
+        """
+        刪除階段的檢查點；指定 name 時只刪除該樂器的結果。
+        上游結果重新生成後，下游的檢查點就不再有效，需先刪除。
+        """
+        if name is not None:
+            paths = [os.path.join(self.directory, stage, f"{name}.json")]
+        else:
+            paths = [self._path(stage)]
+            item_dir = os.path.join(self.directory, stage)
+            if os.path.isdir(item_dir):
+                shutil.rmtree(item_dir)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear(self):
+        """刪除此組參數的所有檢查點"""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
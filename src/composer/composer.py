@@ -1,5 +1,7 @@
 # 標準庫導入
+import asyncio
 import json
+import time
 
 # 第三方庫導入
 from music21 import *
@@ -9,23 +11,28 @@ from rich.table import Table
 from rich.prompt import Confirm
 from rich import box
 
-# LangChain 相關
-from langchain_google_genai import ChatGoogleGenerativeAI
+# LLM 客戶端
+from src.llm.client import get_llm
+from src.llm.tokens import TokenLedger, use_ledger
 
 # 內部模組導入
 # Composer 相關模組
 from src.composer.composition_planner import CompositionPlanner
+from src.composer.ensemble_generator import EnsembleGenerator
 from src.composer.instruction_generator import InstructionGenerator
 from src.composer.music_theory_database import MusicTheoryDatabase
+from src.composer.section_planner import SectionPlanner
 from src.composer.score_evaluator import ScoreEvaluator
 from src.composer.style_analyzer import StyleAnalyzer
 
 # 音樂相關模組
-from src.music.agent import *
+from src.music import agent as music_agents
 from src.music.music_player import MusicPlayer
+from src.instrument_configs import instrument_configs
 
 # 工具模組
-from src.tool import save_to_temp, load_from_temp
+from src.checkpoint import CheckpointStore
+from src.tracing import tracer
 
 class ConductorAgent:
     STAGES = [
@@ -41,32 +48,27 @@ class ConductorAgent:
                  time_signature: str = "4/4", 
                  num_measures: int = 4,
                  musescore_path: str = "/Applications/MuseScore 4.app/Contents/MacOS/mscore",
-                 api_provider: str = "gemini",  # 可選 "openai" 或 "gemini"
+                 api_provider: str = "gemini",  # 可選 "openai"、"gemini" 或離線的 "mock"
                  api_key: str = None,
                  temperature: float = 0.7,
-                 top_p: float = 0.9):
+                 top_p: float = 0.9,
+                 llm_cache=None,
+                 token_budgets: dict = None):
         
         self.api_provider = api_provider
         self.api_key = api_key
         self.temperature = temperature
         self.top_p = top_p
+        # 可選的 LLM 回應快取（例如 DiskLLMCache），相同提示重跑時直接命中
+        self.llm_cache = llm_cache
         
-        # 初始化選擇的 LLM
-        if api_provider == "gemini":
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash", 
-                temperature=self.temperature, top_p=self.top_p, api_key= self.api_key)
-        elif api_provider == "openai":
-            if not api_key:
-                
-                raise ValueError("OpenAI 需要提供 API 金鑰")
-            from langchain_openai import ChatOpenAI
-            self.llm = ChatOpenAI(api_key=api_key, top_p=self.top_p , temperature=self.temperature)
-        else:
-            raise ValueError("不支援的 API 提供者，請選擇 'gemini' 或 'openai'")
-        
+        # 指揮家、規劃器與評估器共用同一個 LLM 客戶端
+        self.llm = get_llm(api_provider, api_key=api_key, temperature=self.temperature, top_p=self.top_p,
+                           cache=self.llm_cache)
         
-        self.player = MusicPlayer(musescore_path=musescore_path)
+        # 播放器在第一次使用時才建立，作曲流程本身不需要 MuseScore
+        self.musescore_path = musescore_path
+        self._player = None
         self.params = {
             "style": style,
             "tempo": tempo,
@@ -78,65 +80,264 @@ class ConductorAgent:
         }
         
         
-        self.musicians = {
-            "violin": ViolinAgent("Violinist",api_provider=api_provider, api_key=api_key,),
-            "viola": ViolaAgent("Violaist", api_provider=api_provider, api_key=api_key,),
-            "cello": CelloAgent("Cellist", api_provider=api_provider, api_key=api_key,),
-            "flute": FluteAgent("Flutist", api_provider=api_provider, api_key=api_key,),
-            "clarinet": ClarinetAgent("Clarinetist", api_provider=api_provider,api_key=api_key, ),
-            "trumpet": TrumpetAgent("Trumpeter", api_provider=api_provider, api_key=api_key,),
-            "timpani": TimpaniAgent("Timpanist", api_provider=api_provider, api_key=api_key,),
-            "paino": PianistAgent("Pianist", api_provider=api_provider, api_key=api_key,)
-        }
+        # 樂器代理在 add_instrument 時才依 instrument_configs 建立
+        self.musicians = {}
         self.score_drafts = {}
         self.instructions = {}
+        # 最近一次 compose 各階段的耗時（秒），串流模式下另有各聲部的首個音符/小節時間
+        self.stage_timings = {}
+        self.stream_metrics = {}
+        # 最近一次 compose 每次 LLM 呼叫的 token 數；token_budgets 為各階段單次請求的提示 token 上限
+        self.token_ledger = TokenLedger(token_budgets)
         
         # 初始化輔助類
         self.style_analyzer = StyleAnalyzer(style)
         self.theory_db = MusicTheoryDatabase()
         self.composition_planner = CompositionPlanner(self.llm, self.params, self.style_analyzer, self.theory_db)
-        self.instruction_generator = InstructionGenerator(self.llm, self.params, self.musicians)
-        self.score_evaluator = ScoreEvaluator(self.llm)
+        self.instruction_generator = InstructionGenerator(
+            self.llm, self.params, self.musicians, max_prompt_tokens=self.token_ledger.budget("generate_instructions"))
+        self.section_planner = SectionPlanner(self.params, self.theory_db)
+        self.ensemble_generator = EnsembleGenerator(self.llm, self.params, self.musicians)
+        self.sections = []
+        self.score_evaluator = ScoreEvaluator(self.llm, max_prompt_tokens=self.token_ledger.budget("evaluate_and_revise"))
+
+    @property
+    def player(self) -> MusicPlayer:
+        if self._player is None:
+            self._player = MusicPlayer(musescore_path=self.musescore_path)
+        return self._player
 
     def add_instrument(self, instrument_type: str, role: str):
-        if instrument_type not in self.musicians:
+        config = instrument_configs.get(instrument_type)
+        agent_class = getattr(music_agents, config["agent_class"], None) if config else None
+        if agent_class is None:
             raise ValueError(f"Unsupported instrument: {instrument_type}")
+        if instrument_type in self.musicians:
+            return
+        self.musicians[instrument_type] = agent_class(
+            config["performer"], api_provider=self.api_provider, api_key=self.api_key,
+            llm_cache=self.llm_cache, time_signature=self.params["time_signature"], key=self.params["key"]
+        )
         self.params["instruments"].append(instrument_type)
 
-    def compose(self, output_file: str = "symphony", dev_mode: bool = False, start_from: str = None) -> dict:
+    async def _agenerate_scores(self, progress, task, max_concurrency: int, pending: list, on_result=None,
+                                stream: bool = False, on_note=None) -> dict:
+        """同時生成所有聲部，以 semaphore 限制同時進行的請求數，完成一個聲部就更新進度"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def generate(inst, agent):
+            async with semaphore:
+                try:
+                    if stream:
+                        part = await agent.astream_score(self.params, self.instructions[inst],
+                                                         self._note_progress(progress, task, inst, on_note))
+                    else:
+                        part = await agent.agenerate_score(self.params, self.instructions[inst])
+                    return inst, part, None
+                except Exception as e:
+                    return inst, None, e
+
+        jobs = [generate(inst, self.musicians[inst]) for inst in pending]
+        for finished in asyncio.as_completed(jobs):
+            inst, part, error = await finished
+            self._record_score(progress, task, inst, part, error, on_result)
+        return self.score_drafts
+
+    async def _agenerate_sectioned(self, progress, task, max_concurrency: int, pending: list, on_result=None) -> dict:
+        """所有聲部的所有段落同時生成（以 semaphore 限制請求數），每個聲部的段落到齊後接合"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def generate_section(inst, agent, section):
+            instruction = self.section_planner.section_instruction(
+                self.instructions[inst], section, self.sections, agent)
+            async with semaphore:
+                with tracer.span("section", section=section["name"]):
+                    return await agent.agenerate_score(self.params, instruction)
+
+        async def generate(inst, agent):
+            try:
+                parts = await asyncio.gather(*(generate_section(inst, agent, s) for s in self.sections))
+                agent.part = self.section_planner.stitch(parts, self.sections)
+                return inst, agent.part, None
+            except Exception as e:
+                return inst, None, e
+
+        jobs = [generate(inst, self.musicians[inst]) for inst in pending]
+        for finished in asyncio.as_completed(jobs):
+            inst, part, error = await finished
+            self._record_score(progress, task, inst, part, error, on_result)
+        return self.score_drafts
+
+    def _note_progress(self, progress, task, inst: str, on_note=None):
+        """串流模式下每收到一個音符就更新進度說明，並把部分樂譜交給 on_note"""
+        received = [0]
+
+        def callback(part, element):
+            received[0] += 1
+            progress.update(task, description=f"[cyan]{inst}: {received[0]} 個音符")
+            if on_note:
+                on_note(inst, part, element)
+        return callback
+
+    def revise_scores(self, evaluation: dict) -> list:
+        """
+        依評估反饋修改目標聲部。
+
+        MusicPlayer 以聲部內容的雜湊快取 MIDI 音軌與音訊音軌，之後的 generate_midi / generate_mp3
+        只會重新算繪返回的這些聲部，其餘聲部直接重新混音。
+
+        Args:
+            evaluation (dict): ScoreEvaluator.evaluate_score 的結果。
+
+        Returns:
+            list: 實際修改的樂器。
+        """
         console = Console()
-        STAGES = ["design_framework", "plan_composition", "generate_instructions", "generate_scores", "evaluate_and_revise"]
+        revised = []
+        with tracer.span("revise_scores", stage="evaluate_and_revise") as span:
+            for feedback in evaluation["feedback"]:
+                target_inst = feedback["target"]
+                if target_inst in self.musicians and target_inst in self.score_drafts:
+                    console.log(f"正在修正 -> {target_inst}")
+                    self.score_drafts[target_inst] = self.musicians[target_inst].revise_score(
+                        self.params, feedback, self.score_drafts[target_inst]
+                    )
+                    if target_inst not in revised:
+                        revised.append(target_inst)
+                else:
+                    console.print(f"[yellow]忽略無效目標 '{target_inst}' 的反饋[/yellow]")
+            span.set_attribute("revised", ",".join(revised))
+        return revised
 
-        # 如果啟用了開發模式並指定了起始階段，嘗試加載之前的結果
-        if dev_mode and start_from:
-            for stage in STAGES:
-                if stage == start_from:
+    def _record_score(self, progress, task, inst: str, part, error, on_result=None):
+        """記錄單一聲部的生成結果；失敗的聲部留待下次重跑"""
+        if error is not None:
+            progress.update(task, advance=1, description=f"[red]錯誤: {inst} - {str(error)}")
+            progress.console.print(f"[red]生成 {inst} 樂譜失敗：{str(error)}[/red]")
+            return
+        self.score_drafts[inst] = part
+        if on_result:
+            on_result(inst, part)
+        progress.update(task, advance=1, description=f"[green]已完成: {inst}")
+
+    def _scores_to_json(self, scores: dict) -> dict:
+        """將樂譜草案轉為 JSON 音符列表，供檢查點保存"""
+        return {inst: self.musicians[inst]._part_to_json(part) for inst, part in scores.items()}
+
+    def _restore_stage(self, stage: str, data):
+        """將檢查點資料還原到對應的狀態"""
+        if stage == "design_framework":
+            self.params["structure"] = data
+        elif stage == "plan_composition":
+            self.params["plan"] = data
+        elif stage == "generate_instructions":
+            self.instructions = data
+        elif stage == "generate_scores":
+            self.score_drafts = self._scores_from_json(data)
+
+    def _scores_from_json(self, data: dict) -> dict:
+        """由檢查點的 JSON 音符列表重建樂譜草案"""
+        return {inst: self.musicians[inst]._json_to_part(part) for inst, part in data.items()}
+
+    def compose(self, output_file: str = "symphony", dev_mode: bool = False, start_from: str = None,
+                parallel: bool = False, max_concurrency: int = 4, checkpoint_dir: str = "temp",
+                stream: bool = False, on_note=None, max_section_measures: int = None,
+                ensemble: bool = False, batched_instructions: bool = False) -> dict:
+        """
+        執行完整的作曲流程。
+
+        Args:
+            output_file (str): 輸出檔名。
+            dev_mode (bool): 開發模式，將各階段結果保存為以參數雜湊區分的檢查點。
+            start_from (str): 開發模式下的起始階段；None 時自動從最後一個有效檢查點續跑。
+            parallel (bool): 是否同時生成所有聲部的樂譜。
+            max_concurrency (int): 平行生成時同時進行的 LLM 請求上限。
+            checkpoint_dir (str): 檢查點根目錄。
+            stream (bool): 以串流方式生成樂譜，LLM 輸出時就逐音符組裝 Part。
+            on_note (callable): 串流模式下每加入一個音符就以 (樂器, CompactPartBuilder, 音符資料) 呼叫。
+            max_section_measures (int): 設定後將樂曲切分為不超過此小節數的段落，所有聲部的所有段落
+                同時生成後再接合，延遲取決於段落長度而非全曲長度（此模式不使用串流）。
+            ensemble (bool): 合奏模式，以一次請求生成所有聲部，未通過驗證的聲部再改用逐聲部請求；
+                適合小編制與短曲，分段模式下不使用。
+            batched_instructions (bool): 以一次請求生成所有聲部指令，超過 generate_instructions 的
+                token 預算時自動分批，缺少的樂器再逐一補發請求。
+
+        Returns:
+            dict: 各聲部的樂譜草案。
+        """
+        # 整次作曲為一個根 span，各階段與 LLM 呼叫都是它的子 span，token 數記錄到 token_ledger
+        self.token_ledger.reset()
+        with tracer.span("compose", instruments=",".join(self.params["instruments"]), parallel=parallel), \
+                use_ledger(self.token_ledger):
+            scores = self._compose(output_file, dev_mode, start_from, parallel, max_concurrency, checkpoint_dir,
+                                   stream, on_note, max_section_measures, ensemble, batched_instructions)
+        self._print_token_usage()
+        return scores
+
+    def _print_token_usage(self):
+        """以表格列出各階段的 LLM 呼叫次數與 token 數"""
+        totals = self.token_ledger.totals()
+        if not totals:
+            return
+        table = Table(title="Token 使用量", box=box.SIMPLE)
+        table.add_column("階段")
+        table.add_column("呼叫", justify="right")
+        table.add_column("提示 tokens", justify="right")
+        table.add_column("輸出 tokens", justify="right")
+        # 依流程順序列出階段，不屬於任何階段的呼叫（other）在後，合計最後
+        stages = [s for s in self.STAGES if s in totals] + [s for s in totals if s not in self.STAGES and s != "total"]
+        for stage in stages + ["total"]:
+            usage = totals[stage]
+            table.add_row(stage, str(usage["calls"]), str(usage["prompt_tokens"]), str(usage["completion_tokens"]))
+        Console().print(table)
+
+    def _compose(self, output_file: str, dev_mode: bool, start_from: str, parallel: bool,
+                 max_concurrency: int, checkpoint_dir: str, stream: bool, on_note,
+                 max_section_measures: int, ensemble: bool, batched_instructions: bool) -> dict:
+        """compose 的實作"""
+        console = Console()
+        self.stage_timings = {}
+        checkpoints = CheckpointStore(self.params, root=checkpoint_dir) if dev_mode else None
+        # 拍號或調號可能在加入樂器後才修改；之後建立（包含從檢查點載入）的聲部都使用目前的設定
+        for agent in self.musicians.values():
+            agent.use_params(self.params)
+
+        # 開發模式下載入起始階段之前的檢查點；未指定 start_from 時自動從最後一個有效階段續跑
+        start_index = 0
+        if dev_mode:
+            start_index = self.STAGES.index(start_from) if start_from else len(self.STAGES)
+            for index, stage in enumerate(self.STAGES[:start_index]):
+                loaded_data = checkpoints.load(stage)
+                if loaded_data is None:
+                    if start_from:
+                        console.print(f"[red]錯誤：無法找到 {stage} 的檢查點（{checkpoints.directory}）[/red]")
+                        return {}
+                    start_index = index
                     break
-                loaded_data = load_from_temp(stage)
-                if loaded_data:
-                    console.print(Panel(
-                        f"已載入 [bold cyan]{stage}[/bold cyan]...",
-                        border_style="green",
-                        padding=(0, 1)
-                    ))
-                    if stage == "design_framework":
-                        self.params["structure"] = loaded_data
-                    elif stage == "plan_composition":
-                        self.params["plan"] = loaded_data
-                    elif stage == "generate_instructions":
-                        self.instructions = loaded_data
-                    elif stage == "generate_scores":
-                        self.score_drafts = loaded_data
-                else:
-                    console.print(f"[red]錯誤：無法找到 {stage} 的臨時文件[/red]")
-                    return {}
+                self._restore_stage(stage, loaded_data)
+                console.print(Panel(
+                    f"已載入 [bold cyan]{stage}[/bold cyan]...",
+                    border_style="green",
+                    padding=(0, 1)
+                ))
+
+        # 明確指定 start_from 時從該階段起全部重新生成；自動續跑時只有重新生成框架或計畫，
+        # 之後各階段（包含逐樂器）的檢查點才過期，否則保留逐樂器的結果只補缺少的部分
+        if dev_mode and start_from:
+            for stage in self.STAGES[start_index:]:
+                checkpoints.discard(stage)
+        elif dev_mode and start_index <= self.STAGES.index("plan_composition"):
+            for stage in self.STAGES[start_index + 1:]:
+                checkpoints.discard(stage)
 
         # 階段 1：設計框架
-        if not dev_mode or start_from == "design_framework":
+        if start_index <= self.STAGES.index("design_framework"):
+            stage_started = time.perf_counter()
+            stage_span = tracer.start_span("stage", stage="design_framework")
             framework = self.composition_planner.design_framework()
             self.params["structure"] = framework
             if dev_mode:
-                save_to_temp("design_framework", framework)  # 保存結果
+                checkpoints.save("design_framework", framework)  # 保存結果
             
             # 生成音樂結構，使用 Panel 展示理由
             console.print(Panel(
@@ -145,6 +346,8 @@ class ConductorAgent:
                 border_style="yellow",
                 padding=(0, 1)
             ))
+            self.stage_timings["design_framework"] = time.perf_counter() - stage_started
+            stage_span.end()
         elif "structure" in self.params and dev_mode:
             console.print(Panel(
                 f"載入 [bold cyan]design_framework[/bold cyan] 所以 pass 通過",
@@ -153,11 +356,13 @@ class ConductorAgent:
             ))
 
         # 階段 2：作曲計畫
-        if not dev_mode or start_from in ["design_framework", "plan_composition"]:
+        if start_index <= self.STAGES.index("plan_composition"):
+            stage_started = time.perf_counter()
+            stage_span = tracer.start_span("stage", stage="plan_composition")
             plan = self.composition_planner.plan_composition()
             self.params["plan"] = plan
             if dev_mode:
-                save_to_temp("plan_composition", plan)  # 保存結果
+                checkpoints.save("plan_composition", plan)  # 保存結果
             
             # 使用 Table 展示作曲計畫
             table = Table(box=box.SIMPLE, border_style="yellow")
@@ -179,6 +384,8 @@ class ConductorAgent:
                 border_style="yellow",
                 padding=(0, 1)
             ))
+            self.stage_timings["plan_composition"] = time.perf_counter() - stage_started
+            stage_span.end()
         elif "plan" in self.params and dev_mode:
             console.print(Panel(
                 f"載入 [bold cyan]plan_composition[/bold cyan] 所以 pass 通過",
@@ -187,10 +394,25 @@ class ConductorAgent:
             ))
 
         # 階段 3：生成聲部指令
-        if not dev_mode or start_from in ["design_framework", "plan_composition", "generate_instructions"]:
-            self.instructions = self.instruction_generator.generate_part_instructions()
-            if dev_mode:
-                save_to_temp("generate_instructions", self.instructions)  # 保存結果
+        if start_index <= self.STAGES.index("generate_instructions"):
+            stage_started = time.perf_counter()
+            stage_span = tracer.start_span("stage", stage="generate_instructions")
+            # 開發模式下逐樂器保存，重跑時只為缺少或失敗的樂器呼叫 LLM
+            finished = checkpoints.load_items("generate_instructions") if dev_mode else {}
+
+            def save_instruction(inst, data):
+                checkpoints.save_item("generate_instructions", inst, data)
+                # 新的指令會讓該樂器先前的樂譜草案失效
+                checkpoints.discard("generate_scores", inst)
+
+            self.instructions = self.instruction_generator.generate_part_instructions(
+                existing=finished, on_result=save_instruction if dev_mode else None, batched=batched_instructions
+            )
+            missing = [inst for inst in self.params["instruments"] if inst not in self.instructions]
+            if missing:
+                console.print(f"[red]以下樂器的指令生成失敗，將略過其樂譜：{', '.join(missing)}[/red]")
+            elif dev_mode:
+                checkpoints.save("generate_instructions", self.instructions)  # 保存結果
             
             # 展示各聲部演奏指令
             console.print(Panel(
@@ -213,6 +435,8 @@ class ConductorAgent:
                     padding=(0, 1)
                 ))
                 break  # 只展示一個作為範例
+            self.stage_timings["generate_instructions"] = time.perf_counter() - stage_started
+            stage_span.end()
         elif self.instructions and dev_mode:
             console.print(Panel(
                 f"載入 [bold cyan]generate_instructions[/bold cyan] 所以 pass 通過",
@@ -221,22 +445,74 @@ class ConductorAgent:
             ))
 
         # 階段 4：生成樂譜草案
-        if not dev_mode or start_from in ["design_framework", "plan_composition", "generate_instructions", "generate_scores"]:
+        if start_index <= self.STAGES.index("generate_scores"):
+            stage_started = time.perf_counter()
+            stage_span = tracer.start_span("stage", stage="generate_scores")
             console.print("[bold yellow]🎼 開始生成樂譜草案...[/bold yellow]")
             
+            # 先前 compose 的草案已不適用；開發模式續跑時才載入已完成的聲部，只生成缺少或失敗的部分
+            self.score_drafts = {}
+            if dev_mode:
+                self.score_drafts.update(self._scores_from_json(checkpoints.load_items("generate_scores")))
+            pending = [
+                inst for inst in self.params["instruments"]
+                if inst in self.instructions and inst not in self.score_drafts
+            ]
+            save_draft = (
+                lambda inst, part: checkpoints.save_item(
+                    "generate_scores", inst, self.musicians[inst]._part_to_json(part))
+            ) if dev_mode else None
+
+            # 分段模式：只有一個段落時與一般模式相同
+            self.sections = self.section_planner.plan_sections(max_section_measures) if max_section_measures else []
+            if len(self.sections) > 1:
+                outline = ", ".join(f"{section['name']}({section['measures']})" for section in self.sections)
+                console.print(f"[cyan]分為 {len(self.sections)} 個段落：{outline}[/cyan]")
+
             # 使用 rich 的 Progress 來顯示進度條
             from rich.progress import Progress
             with Progress(console=console) as progress:
-                task = progress.add_task("[cyan]生成樂譜中...", total=len(self.musicians))
-                for inst, agent in self.musicians.items():
-                    self.score_drafts[inst] = agent.generate_score(self.params, self.instructions[inst])
-                    progress.update(task, advance=1)  # 每次完成一個樂器，更新進度
-                
-            if dev_mode:
-                save_to_temp("generate_scores", self.score_drafts)  # 保存結果
-            console.print(f"[bold green]✅ 所有樂譜草案生成完成！共 {len(self.musicians)} 個聲部[/bold green]")
-            
-            
+                task = progress.add_task("[cyan]生成樂譜中...", total=len(pending))
+
+                # 合奏模式：先以一次請求生成所有聲部，只有失敗的聲部改用逐聲部請求
+                if ensemble and len(self.sections) <= 1 and pending:
+                    parts, failed = self.ensemble_generator.generate_scores(self.instructions, pending)
+                    for inst, part in parts.items():
+                        self._record_score(progress, task, inst, part, None, save_draft)
+                    if failed:
+                        console.print(f"[yellow]以下聲部改為逐聲部生成：{', '.join(failed)}[/yellow]")
+                    pending = [inst for inst in pending if inst in failed]
+
+                if len(self.sections) > 1:
+                    asyncio.run(self._agenerate_sectioned(progress, task, max_concurrency, pending, save_draft))
+                elif parallel:
+                    asyncio.run(self._agenerate_scores(progress, task, max_concurrency, pending, save_draft,
+                                                       stream, on_note))
+                else:
+                    for inst in pending:
+                        agent = self.musicians[inst]
+                        try:
+                            if stream:
+                                part = agent.stream_score(self.params, self.instructions[inst],
+                                                          self._note_progress(progress, task, inst, on_note))
+                            else:
+                                part = agent.generate_score(self.params, self.instructions[inst])
+                            error = None
+                        except Exception as e:
+                            part, error = None, e
+                        self._record_score(progress, task, inst, part, error, save_draft)  # 每次完成一個樂器，更新進度
+            if stream:
+                self.stream_metrics = {inst: self.musicians[inst].stream_metrics for inst in pending}
+
+            missing = [inst for inst in self.params["instruments"] if inst not in self.score_drafts]
+            if missing:
+                console.print(f"[red]以下聲部尚未完成，重新執行即可只補生成這些聲部：{', '.join(missing)}[/red]")
+            else:
+                if dev_mode:
+                    checkpoints.save("generate_scores", self._scores_to_json(self.score_drafts))  # 保存結果
+                console.print(f"[bold green]✅ 所有樂譜草案生成完成！共 {len(self.params['instruments'])} 個聲部[/bold green]")
+            self.stage_timings["generate_scores"] = time.perf_counter() - stage_started
+            stage_span.end()
         elif self.score_drafts and dev_mode:
             console.print(Panel(
                 f"載入 [bold cyan]generate_scores[/bold cyan] 所以 pass 通過",
@@ -245,24 +521,17 @@ class ConductorAgent:
             ))
 
         # # 階段 5：評估與修正
-        # if not dev_mode or start_from in ["design_framework", "plan_composition", "generate_instructions", "generate_scores", "evaluate_and_revise"]:
-        #     evaluation = self.score_evaluator.evaluate_score(self.score_drafts, self.musicians)
+        # if start_index <= self.STAGES.index("evaluate_and_revise"):
+        #     evaluation = self.score_evaluator.evaluate_score(self.score_drafts, self.musicians, self.params["num_measures"],
+        #                                                         self.params["time_signature"])
         #     attempt = 1
         #     while not evaluation["passed"]:
         #         console.print(f"[bold yellow]⚠️ 樂譜需要修正 (嘗試 {attempt})[/bold yellow]")
-        #         for feedback in evaluation["feedback"]:
-        #             target_inst = feedback["target"]
-        #             if target_inst in self.musicians:
-        #                 console.log(f"正在修正 -> {target_inst}")
-        #                 self.score_drafts[target_inst] = self.musicians[target_inst].revise_score(
-        #                     self.params, feedback, self.score_drafts[target_inst]
-        #                 )
-        #             else:
-        #                 console.print(f"[yellow]忽略無效目標 '{target_inst}' 的反饋[/yellow]")
+        #         revised = self.revise_scores(evaluation)
                 
-        #         # 先生成 MIDI 文件
+        #         # 先生成 MIDI 文件（只有 revised 中的聲部會重新編碼）
         #         midi_file = f"fixup_song_{attempt}"
-        #         self.player.generate_midi(self.score_drafts, midi_file)
+        #         self.player.generate_midi(self.score_drafts, midi_file, tempo=self.params["tempo"])
         #         console.print(f"[bold cyan]已生成 MIDI 文件：{midi_file}.mid[/bold cyan]")
                 
         #         # 詢問用戶是否繼續修正
@@ -272,7 +541,8 @@ class ConductorAgent:
         #             break
                 
         #         # 如果繼續，重新評估
-        #         evaluation = self.score_evaluator.evaluate_score(self.score_drafts, self.musicians)
+        #         evaluation = self.score_evaluator.evaluate_score(self.score_drafts, self.musicians, self.params["num_measures"],
+        #                                                           self.params["time_signature"])
         #         attempt += 1
             
         #     # 最終通過或用戶停止時顯示訊息
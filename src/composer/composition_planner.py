@@ -45,10 +45,12 @@ class CompositionPlanner:
             - 和聲進行（包括轉調、借用和弦等具體方案）
             - 動態與速度變化（具體規劃，如漸強、漸慢）
             - 聲部間的呼應與對話
+            - 段落劃分與各段落的小節數（總和為 {num_measures}）
 
             返回 JSON：
             {{
                 "form": "曲式類型",
+                "sections": [{{"name": "段落名稱", "measures": 小節數}}],
                 "themes": ["主題1描述", "主題2描述"],
                 "harmonic_progression": ["和聲進行1", "和聲進行2"],
                 "dynamic_plan": "動態變化計劃",
@@ -0,0 +1,124 @@
+# 標準函式庫
+import json
+from typing import Dict, List, Tuple
+
+# LangChain 相關
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.music.model import EnsembleData
+from src.tracing import tracer
+
+__all__ = ["EnsembleGenerator"]
+
+
+class EnsembleGenerator:
+    """
+    以單一 LLM 請求生成所有聲部的樂譜。
+
+    全域參數與風格只送出一次，回應為 EnsembleData（{"parts": {樂器: PartData}}）。每個聲部各自以
+    EnsembleData 驗證並轉為 CompactPart，未通過的聲部交由呼叫端改用逐聲部請求。
+    """
+
+    def __init__(self, llm, params: dict, musicians: dict):
+        self.llm = llm
+        self.params = params
+        self.musicians = musicians
+
+    def _prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
+        作為樂團的全體演奏家，請一次創作以下所有聲部，並以 JSON 格式輸出：
+
+        [參數]
+        風格：{style}
+        速度：{tempo}BPM
+        調號：{key}
+        拍號：{time_signature}
+        樂器：{instruments}
+
+        [各聲部]
+        {part_specs}
+
+        [輸出要求]
+        生成一個 JSON 對象，"parts" 的鍵必須是上列樂器名稱，每個聲部結構如下：
+        {{
+            "parts": {{
+                "樂器名稱": {{
+                    "notes": [
+                        {{"pitch": "C4", "duration": 1.0, "technique": "arco"}},
+                        ...
+                    ],
+                    "clef": "treble",
+                    "instrument": "Violin"
+                }}
+            }}
+        }}
+
+        [格式規則]
+        - pitch 使用 MIDI 音高表示法，必須在各聲部的音域內；可使用 "rest" 表示休止符，和弦以空格分隔音高
+        - duration 以四分音符為單位（1.0 = 四分音符，2.0 = 二分音符）
+        - technique 必須是該聲部可用的技巧
+        - 各聲部總時長應一致並符合拍號 {time_signature}
+        - 聲部之間應有呼應與和聲配合
+        - 只返回純 JSON，不要包含其他文字或註釋
+        """)
+
+    def _part_spec(self, inst: str, instruction: Dict) -> str:
+        agent = self.musicians[inst]
+        return json.dumps({
+            "instrument": inst,
+            "role": agent.role,
+            "clef": agent.default_clef,
+            "range": f"{agent.pitch_range[0]}-{agent.pitch_range[1]}",
+            "techniques": agent.techniques,
+            "instruction": instruction,
+        }, ensure_ascii=False)
+
+    def generate_scores(self, instructions: Dict, instruments: List[str]) -> Tuple[Dict, Dict]:
+        """
+        以一次請求生成多個聲部。
+
+        Args:
+            instructions (Dict): 樂器名稱對應的聲部指令。
+            instruments (List[str]): 要生成的樂器。
+
+        Returns:
+            Tuple[Dict, Dict]: (樂器對應的 CompactPart, 失敗樂器對應的錯誤訊息)；整個請求失敗時所有樂器都在失敗列表中。
+        """
+        chain = self._prompt() | self.llm | JsonOutputParser(pydantic_object=EnsembleData)
+        inputs = {
+            "style": self.params["style"],
+            "tempo": self.params["tempo"],
+            "key": self.params["key"],
+            "time_signature": self.params["time_signature"],
+            "instruments": ", ".join(instruments),
+            "part_specs": "\n".join(self._part_spec(inst, instructions[inst]) for inst in instruments),
+        }
+        try:
+            with tracer.span("ensemble", instruments=",".join(instruments)):
+                response = chain.invoke(inputs)
+        except Exception as e:
+            return {}, {inst: str(e) for inst in instruments}
+
+        raw_parts = response.get("parts") if isinstance(response, dict) else None
+        if not isinstance(raw_parts, dict):
+            return {}, {inst: "回應缺少 parts 物件" for inst in instruments}
+
+        parts, failed = {}, {}
+        for inst in instruments:
+            raw = raw_parts.get(inst)
+            if raw is None:
+                failed[inst] = "回應中沒有此聲部"
+                continue
+            try:
+                with tracer.span("ensemble_part", instrument=inst):
+                    # 與逐聲部生成相同，先在本地修正拼法、音域與時值，只有無法修復時才改用逐聲部請求
+                    repaired = self.musicians[inst]._repair(raw)
+                    # 逐聲部驗證，一個聲部不合格不影響其他聲部
+                    EnsembleData(parts={inst: repaired})
+                    parts[inst] = self.musicians[inst]._json_to_part(repaired)
+                self.musicians[inst].part = parts[inst]
+            except Exception as e:
+                # 無法修復的結構、EnsembleData 驗證失敗或無法解析的音高
+                failed[inst] = str(e)
+        return parts, failed
@@ -15,17 +15,112 @@ from rich.progress import Progress
 # Pydantic 資料驗證
 
 from src.composer.model import PartInstruction
+from src.llm.tokens import count_tokens
+from src.tracing import tracer
 
 # Pydantic 資料驗證
 class InstructionGenerator:
-    def __init__(self, llm, params: dict, musicians: dict):
+    def __init__(self, llm, params: dict, musicians: dict, max_prompt_tokens: int = None):
         self.llm = llm
         self.params = params
         self.musicians = musicians
+        # 批次模式單次請求的提示 token 上限；超過時將樂器分批
+        self.max_prompt_tokens = max_prompt_tokens
 
-    def generate_part_instructions(self) -> dict:
+    def _batch_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_messages([
+            ("user", """根據總譜結構一次生成以下所有樂器的聲部指令：
 
-        instructions = {}
+            總結構：{structure}
+            樂器：{instruments}
+            樂器角色：
+            {roles}
+
+            請直接返回一個有效的 JSON 物件，鍵為上列每個樂器名稱，值符合以下結構：
+            {{
+                "<樂器>": {{
+                    "melody_position": "主要旋律出現位置，例如 measures 1-2 或 entire piece",
+                    "coordination_points": ["與其它聲部的配合點，例如 align with piano at measure 3"],
+                    "technical_challenges": ["技術難點提示，例如 rapid arpeggios in measure 4"]
+                }}
+            }}
+
+            不要包含任何其他文字、格式、註釋或代碼塊。只返回純 JSON。""")
+        ])
+
+    def _batch_inputs(self, batch: list) -> dict:
+        roles = self.params["structure"]["instrumentation_roles"]
+        return {
+            "structure": json.dumps(self.params["structure"], ensure_ascii=False),
+            "instruments": ", ".join(batch),
+            "roles": "\n".join(f"- {inst}: {roles.get(inst, '')}" for inst in batch),
+        }
+
+    def _split_by_budget(self, prompt: ChatPromptTemplate, pending: list) -> list:
+        """
+        依 token 預算將樂器分批；單一樂器就超過預算時留給逐樂器請求。
+
+        模板與總結構只計算一次，每個樂器再加上它在樂器列表與角色中所佔的 token 數，
+        不必為每個樂器重新格式化整個提示。
+        """
+        if self.max_prompt_tokens is None:
+            return [pending]
+        roles = self.params["structure"]["instrumentation_roles"]
+        base = self._prompt_tokens(prompt, [])
+        batches, used = [], 0
+        for inst in pending:
+            # 分段計數可能比整段少（例如以字元數估算時的捨去），每段加 1 保持保守
+            cost = count_tokens(f", {inst}") + count_tokens(f"\n- {inst}: {roles.get(inst, '')}") + 2
+            if batches and used + cost <= self.max_prompt_tokens:
+                batches[-1].append(inst)
+                used += cost
+            elif base + cost <= self.max_prompt_tokens:
+                batches.append([inst])
+                used = base + cost
+        return batches
+
+    def _prompt_tokens(self, prompt: ChatPromptTemplate, batch: list) -> int:
+        return count_tokens(prompt.format(**self._batch_inputs(batch)))
+
+    def _generate_batched(self, pending: list, instructions: dict, on_result, progress, task):
+        """一次請求生成多個樂器的指令；缺少或未通過驗證的樂器留在 instructions 之外"""
+        prompt = self._batch_prompt()
+        chain = prompt | self.llm | JsonOutputParser()
+        for batch in self._split_by_budget(prompt, pending):
+            try:
+                with tracer.span("generate_instruction_batch", instruments=",".join(batch)):
+                    response = chain.invoke(self._batch_inputs(batch))
+            except Exception as e:
+                print(f"批次生成 {', '.join(batch)} 指令失敗：{str(e)}")
+                continue
+            if not isinstance(response, dict):
+                continue
+            for inst in batch:
+                entry = response.get(inst)
+                try:
+                    PartInstruction(**entry)
+                except Exception:
+                    continue
+                instructions[inst] = entry
+                if on_result:
+                    on_result(inst, entry)
+                progress.update(task, advance=1, description=f"[green]已完成: {inst}")
+
+    def generate_part_instructions(self, existing: dict = None, on_result=None, batched: bool = False) -> dict:
+        """
+        為每個樂器生成聲部指令。
+
+        Args:
+            existing (dict): 已完成的指令，這些樂器不再呼叫 LLM。
+            on_result (callable): 每完成一個樂器就以 (樂器, 指令) 呼叫，用於逐樂器保存檢查點。
+            batched (bool): 以一次請求生成所有樂器的指令（超過 token 預算時分批），
+                缺少或未通過驗證的樂器再逐一補發請求。
+
+        Returns:
+            dict: 樂器名稱對應的指令；失敗的樂器不會出現在結果中。
+        """
+        instructions = dict(existing or {})
+        pending = [inst for inst in self.params["instruments"] if inst not in instructions]
         parser = JsonOutputParser(pydantic_object=PartInstruction)
         prompt_template = ChatPromptTemplate.from_messages([
             ("user", """根據總譜結構生成{instrument}聲部指令：
@@ -44,8 +139,11 @@ class InstructionGenerator:
         chain = prompt_template | self.llm | parser
 
         with Progress() as progress:
-            task = progress.add_task("[cyan]生成樂器指令...", total=len(self.musicians))
-            for inst, agent in self.musicians.items():
+            task = progress.add_task("[cyan]生成樂器指令...", total=len(pending))
+            if batched and pending:
+                self._generate_batched(pending, instructions, on_result, progress, task)
+                pending = [inst for inst in pending if inst not in instructions]
+            for inst in pending:
                 role_desc = self.params["structure"]["instrumentation_roles"].get(inst, "")
                 input_params = {
                     "instrument": inst,
@@ -53,7 +151,10 @@ class InstructionGenerator:
                     "role_desc": role_desc
                 }
                 try:
-                    instructions[inst] = chain.invoke(input_params)
+                    with tracer.span("generate_instruction", instrument=inst):
+                        instructions[inst] = chain.invoke(input_params)
+                    if on_result:
+                        on_result(inst, instructions[inst])
                     progress.update(task, advance=1, description=f"[green]已完成: {inst}")
                 except Exception as e:
                     progress.update(task, advance=1, description=f"[red]錯誤: {inst} - {str(e)}")
@@ -32,6 +32,7 @@ class MusicTheoryDatabase:
         self.form_analysis = {
             "sonata": {
                 "structure": ["Exposition", "Development", "Recapitulation"],
+                "proportions": [0.4, 0.3, 0.3],
                 "tonal_plan": "主调→属调→关系调→主调",
                 "classic_example": "莫札特第40號交響曲第一樂章"
             },
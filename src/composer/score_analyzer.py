@@ -0,0 +1,231 @@
+# 標準函式庫
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+# 數值計算
+import numpy as np
+
+from src.instrument_configs import instrument_configs
+from src.music.compact import REST, CompactPart
+from src.music.pitches import midi_to_name
+
+__all__ = ["ScoreAnalyzer"]
+
+# 平行五度與平行八度（含同度）的音程類別
+_PARALLEL_INTERVALS = {7: "五度", 0: "八度"}
+
+
+def _measures(onsets: np.ndarray, bar_length: float) -> str:
+    """將起始位置轉為去重後的小節編號字串，例如 "1, 3, 4" """
+    numbers = sorted({int(onset // bar_length) + 1 for onset in onsets})
+    shown = ", ".join(str(n) for n in numbers[:8])
+    return shown + ("…" if len(numbers) > 8 else "")
+
+
+def _sample(part: CompactPart, times: np.ndarray) -> np.ndarray:
+    """在指定時間點取聲部正在發聲的音高（和弦取第一個音），沒有發聲時為 REST"""
+    notes = part.notes
+    index = np.searchsorted(notes["onset"], times, side="right") - 1
+    valid = index >= 0
+    clipped = np.maximum(index, 0)
+    sounding = valid & (notes["onset"][clipped] + notes["duration"][clipped] > times + 1e-9)
+    return np.where(sounding, notes["pitch"][clipped], REST)
+
+
+class ScoreAnalyzer:
+    """
+    在送交 LLM 評估前對 CompactPart 進行的規則檢查。
+
+    所有檢查都是對音符陣列的向量運算，結果是確定的，毫秒內完成。
+    issues 是必須修正的問題（有任何一項時不需要再請 LLM 評估），
+    warnings 是建議，會附在最終的反饋中但不影響是否通過。
+
+    Attributes:
+        min_notes (int): 每個聲部至少需要的音符數。
+        max_scale_run (int): 同方向級進（一或兩個半音）的連續音數達到此值時視為單純音階。
+        max_parallels (int): 兩個聲部間允許的平行五度/八度次數，超過時列為問題，未超過時列為建議。
+        doubling_ratio (float): 兩個聲部共同移動中平行八度所佔比例達此值時視為刻意的八度重疊，不列入平行八度。
+    """
+
+    def __init__(self, min_notes: int = 8, max_scale_run: int = 8, max_parallels: int = 2,
+                 doubling_ratio: float = 0.5):
+        self.min_notes = min_notes
+        self.max_scale_run = max_scale_run
+        self.max_parallels = max_parallels
+        self.doubling_ratio = doubling_ratio
+
+    def analyze(self, scores: Dict[str, CompactPart], num_measures: Optional[int] = None,
+                time_signature: Optional[str] = None) -> Tuple[List[dict], List[dict]]:
+        """
+        檢查所有聲部。
+
+        Args:
+            scores (Dict[str, CompactPart]): 樂器名稱對應的聲部。
+            num_measures (Optional[int]): 預期的小節數；未指定時只檢查最後一小節是否完整。
+            time_signature (Optional[str]): 樂曲的拍號（params["time_signature"]）；未指定時使用各聲部自己的拍號。
+
+        Returns:
+            Tuple[List[dict], List[dict]]: (issues, warnings)，每項為 {"target", "message"}。
+        """
+        issues, warnings = [], []
+        for inst, part in scores.items():
+            issues.extend(self._check_note_count(inst, part))
+            issues.extend(self._check_range(inst, part))
+            issues.extend(self._check_measure_fill(inst, part, num_measures, time_signature))
+            issues.extend(self._check_scale_runs(inst, part))
+            warnings.extend(self._check_dynamics(inst, part))
+        for (inst_a, part_a), (inst_b, part_b) in combinations(scores.items(), 2):
+            count, message = self._check_parallels(inst_a, part_a, inst_b, part_b)
+            if count:
+                (issues if count > self.max_parallels else warnings).append({"target": inst_b, "message": message})
+        return issues, warnings
+
+    @staticmethod
+    def summarize(part: CompactPart) -> Dict:
+        """
+        聲部的精簡摘要，讓分組評估時每一組都能參考其他聲部而不必送出完整樂譜。
+
+        Returns:
+            Dict: {"notes": 音符數, "range": 最低–最高音, "beats": 每小節一個字串，列出每拍開始時發聲的音（休止為 "-"）}
+        """
+        sounding = part.notes["pitch"][part.notes["pitch"] != REST]
+        beat = 4.0 / int(part.time_signature.split("/")[1])
+        measures = part.measure_count
+        per_bar = int(round(part.bar_length / beat))
+        sampled = _sample(part, np.arange(measures * per_bar) * beat).reshape(measures, per_bar)
+        return {
+            "notes": len(part),
+            "range": f"{midi_to_name(int(sounding.min()))}–{midi_to_name(int(sounding.max()))}" if len(sounding) else "-",
+            "beats": [" ".join(midi_to_name(int(m)) if m != REST else "-" for m in row) for row in sampled],
+        }
+
+    def _check_note_count(self, inst: str, part: CompactPart) -> List[dict]:
+        note_count = len(part)
+        if note_count >= self.min_notes:
+            return []
+        return [{
+            "target": inst,
+            "message": f"{inst.capitalize()} 聲部音符數 ({note_count}) 過少，請增加至至少 {self.min_notes} 個音符。",
+        }]
+
+    def _check_range(self, inst: str, part: CompactPart) -> List[dict]:
+        config = instrument_configs.get(inst.lower())
+        if config is None:
+            return []
+        low, high = config["midi_range"]
+        notes = part.notes
+        single = notes[notes["chord"] < 0]
+        chord_rows = notes[notes["chord"] >= 0]
+        # 和弦的每個音都要檢查
+        spans = [np.arange(part.chord_offsets[c], part.chord_offsets[c + 1]) for c in chord_rows["chord"]]
+        members = np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+        pitches = np.concatenate([single["pitch"], part.chord_pitches[members]])
+        onsets = np.concatenate([single["onset"], np.repeat(chord_rows["onset"], [len(s) for s in spans])])
+        outside = (pitches != REST) & ((pitches < low) | (pitches > high))
+        if not outside.any():
+            return []
+        bar = part.bar_length
+        return [{
+            "target": inst,
+            "message": (f"{inst.capitalize()} 聲部有 {int(outside.sum())} 個音超出音域 "
+                        f"{config['pitch_range'][0]}–{config['pitch_range'][1]}（第 {_measures(onsets[outside], bar)} 小節），"
+                        "請移入可演奏的範圍。"),
+        }]
+
+    def _check_measure_fill(self, inst: str, part: CompactPart, num_measures: Optional[int],
+                            time_signature: Optional[str]) -> List[dict]:
+        time_signature = time_signature or part.time_signature
+        if part.time_signature != time_signature:
+            return [{
+                "target": inst,
+                "message": f"{inst.capitalize()} 聲部的拍號 {part.time_signature} 與樂曲的 {time_signature} 不同。",
+            }]
+        bar = part.bar_length
+        length = part.quarter_length
+        if num_measures is not None:
+            expected = num_measures * bar
+            if abs(length - expected) > 1e-6:
+                return [{
+                    "target": inst,
+                    "message": (f"{inst.capitalize()} 聲部總長 {length:g} 拍，與 {num_measures} 小節的 "
+                                f"{time_signature} 拍號（{expected:g} 拍）不符，請補足或刪減音符。"),
+                }]
+            return []
+        remainder = length % bar
+        if remainder > 1e-6 and bar - remainder > 1e-6:
+            return [{
+                "target": inst,
+                "message": (f"{inst.capitalize()} 聲部最後一小節只有 {remainder:g} 拍，"
+                            f"未填滿 {time_signature} 拍號的 {bar:g} 拍。"),
+            }]
+        return []
+
+    def _check_scale_runs(self, inst: str, part: CompactPart) -> List[dict]:
+        sounding = part.notes[part.notes["pitch"] != REST]
+        if len(sounding) < self.max_scale_run:
+            return []
+        steps = np.diff(sounding["pitch"].astype(np.int64))
+        # 1 為上行級進、-1 為下行級進、0 為其他音程
+        direction = np.where((np.abs(steps) >= 1) & (np.abs(steps) <= 2), np.sign(steps), 0)
+        # 以方向改變的位置切分連續段
+        boundaries = np.flatnonzero(np.diff(direction) != 0) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(direction)]])
+        runs = [(s, e) for s, e in zip(starts, ends)
+                if direction[s] != 0 and e - s + 1 >= self.max_scale_run]
+        if not runs:
+            return []
+        bar = part.bar_length
+        longest = max(e - s + 1 for s, e in runs)
+        return [{
+            "target": inst,
+            "message": (f"{inst.capitalize()} 聲部在第 {_measures(sounding['onset'][[s for s, _ in runs]], bar)} 小節"
+                        f"出現單純的音階進行（最長連續 {longest} 個級進音），請加入跳進、節奏變化或動機發展。"),
+        }]
+
+    def _check_dynamics(self, inst: str, part: CompactPart) -> List[dict]:
+        velocities = part.notes["velocity"][part.notes["pitch"] != REST]
+        if len(velocities) < 2 or velocities.min() != velocities.max():
+            return []
+        return [{
+            "target": inst,
+            "message": f"{inst.capitalize()} 聲部所有音符力度相同，建議加入漸強、漸弱或重音等力度變化。",
+        }]
+
+    def _check_parallels(self, inst_a: str, part_a: CompactPart,
+                         inst_b: str, part_b: CompactPart) -> Tuple[int, str]:
+        """
+        在兩聲部所有起音位置取樣，找出兩聲部同向移動且前後都是五度或八度的位置。
+
+        Returns:
+            Tuple[int, str]: (平行五度與八度的次數, 說明)；沒有時次數為 0。
+        """
+        times = np.union1d(part_a.notes["onset"], part_b.notes["onset"])
+        if len(times) < 2:
+            return 0, ""
+        a = _sample(part_a, times).astype(np.int64)
+        b = _sample(part_b, times).astype(np.int64)
+        sounding = (a != REST) & (b != REST)
+        both = sounding[:-1] & sounding[1:]
+        move_a, move_b = np.diff(a), np.diff(b)
+        moving = both & (move_a != 0) & (move_b != 0)
+        # 取絕對音程，兩聲部誰在上方都不影響五度的判斷
+        interval = np.abs(a - b) % 12
+        same = moving & (np.sign(move_a) == np.sign(move_b)) & (interval[:-1] == interval[1:])
+
+        found = {}
+        for interval_class, name in _PARALLEL_INTERVALS.items():
+            hits = same & (interval[1:] == interval_class)
+            # 大部分共同移動都是八度時是聲部重疊（doubling），屬配器手法而非聲部進行錯誤
+            if interval_class == 0 and moving.any() and hits.sum() >= self.doubling_ratio * moving.sum():
+                continue
+            if hits.any():
+                found[name] = times[1:][hits]
+        count = sum(len(onsets) for onsets in found.values())
+        if not count:
+            return 0, ""
+        bar = part_b.bar_length
+        details = "；".join(f"平行{name} {len(onsets)} 次（第 {_measures(onsets, bar)} 小節）"
+                           for name, onsets in found.items())
+        return count, (f"{inst_b.capitalize()} 與 {inst_a.capitalize()} 之間出現{details}，"
+                       f"請調整 {inst_b.capitalize()} 的聲部進行。")
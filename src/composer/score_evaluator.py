@@ -1,6 +1,9 @@
 from src.composer.model import EvaluationResult
 
+import asyncio
+import contextvars
 import json
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import ChatPromptTemplate
 from music21 import *
 import json
@@ -17,6 +20,11 @@ from pydantic import BaseModel, Field, validator
 from typing import List
 from langchain.output_parsers import PydanticOutputParser
 
+from src.composer.score_analyzer import ScoreAnalyzer
+from src.instrument_configs import instrument_configs
+from src.llm.tokens import TokenBudgetExceeded, count_tokens
+from src.tracing import tracer
+
 class Feedback(BaseModel):
     target: str = Field(..., description="樂器名稱")
     message: str = Field(..., description="建議內容")
@@ -28,11 +36,165 @@ class EvaluationResult(BaseModel):
 __all__ = ['ScoreEvaluator']
 
 class ScoreEvaluator:
-    def __init__(self, llm):
+    def __init__(self, llm, max_prompt_tokens: int = None, analyzer: ScoreAnalyzer = None,
+                 max_concurrency: int = 4, max_retries: int = 2):
         self.llm = llm
+        # 單次評估請求的提示 token 上限；超過時將樂器分批評估
+        self.max_prompt_tokens = max_prompt_tokens
+        # 各樂器組同時評估的請求數上限，以及單一組解析失敗時的重試次數
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # 先以規則檢查，只有通過時才請 LLM 評估音樂性
+        self.analyzer = analyzer or ScoreAnalyzer()
         self.console = Console()
 
-    def evaluate_score(self, scores: dict, musicians: dict) -> dict:
+    @staticmethod
+    def _group_by_family(instruments: list) -> list:
+        """依 instrument_configs 的 family 將樂器分組（弦樂、木管、銅管、打擊樂、鍵盤），保留原本的順序"""
+        groups = {}
+        for inst in instruments:
+            family = instrument_configs.get(inst.lower(), {}).get("family", inst)
+            groups.setdefault(family, []).append(inst)
+        return list(groups.values())
+
+    def _split_by_budget(self, prompt, score_json: dict, format_instructions: str,
+                         instruments: list = None, summaries: dict = None) -> list:
+        """
+        依 token 預算將樂器分批，讓每批的提示都不超過 max_prompt_tokens。
+
+        Args:
+            instruments (list): 要分批的樂器，預設為 score_json 中的所有樂器。
+            summaries (dict): 樂器名稱對應的聲部摘要；每批的提示會附上批次以外聲部的摘要。
+
+        Returns:
+            list: 樂器名稱列表的列表；沒有預算時只有一批。
+
+        Raises:
+            TokenBudgetExceeded: 單一樂器的提示就超過預算時。
+        """
+        instruments = list(instruments or score_json)
+        if self.max_prompt_tokens is None:
+            return [instruments]
+
+        def prompt_tokens(batch):
+            return count_tokens(prompt.format(**self._shard_inputs(batch, score_json, summaries or {},
+                                                                    format_instructions)))
+
+        batches = []
+        for inst in instruments:
+            if batches and prompt_tokens(batches[-1] + [inst]) <= self.max_prompt_tokens:
+                batches[-1].append(inst)
+                continue
+            tokens = prompt_tokens([inst])
+            if tokens > self.max_prompt_tokens:
+                raise TokenBudgetExceeded("evaluate_and_revise", tokens, self.max_prompt_tokens)
+            batches.append([inst])
+        return batches
+
+    @staticmethod
+    def _shard_inputs(batch: list, score_json: dict, summaries: dict, format_instructions: str) -> dict:
+        """一組樂器的提示參數：組內樂器的完整樂譜加上其他聲部的摘要"""
+        return {
+            "score_json": json.dumps({inst: score_json[inst] for inst in batch}, ensure_ascii=False),
+            "context_json": json.dumps({inst: summary for inst, summary in summaries.items() if inst not in batch},
+                                       ensure_ascii=False),
+            "instruments_list": ", ".join(batch),
+            "format_instructions": format_instructions,
+        }
+
+    def _shard_failed(self, batch: list, attempt: int, error: Exception):
+        self.console.print(f"[red]解析錯誤（{', '.join(batch)}，第 {attempt + 1} 次）：{str(error)}[/red]")
+
+    def _evaluate_shards(self, chain, shards: list, score_json: dict, summaries: dict,
+                         format_instructions: str) -> list:
+        """
+        以執行緒池同時評估各組（同時最多 max_concurrency 個請求）；某一組解析失敗時只重試該組，
+        超過重試次數時該組視為未通過，其他組的結果不受影響。
+        每個工作在呼叫端 context 的副本中執行，追蹤 span 與 token 記帳照常歸屬。
+
+        Returns:
+            list: 依 shards 順序排列的評估結果字典。
+        """
+        def evaluate(batch):
+            inputs = self._shard_inputs(batch, score_json, summaries, format_instructions)
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with tracer.span("evaluate", stage="evaluate_and_revise", instruments=",".join(batch),
+                                     retry=attempt):
+                        evaluation = chain.invoke(inputs)
+                    return evaluation.dict() if hasattr(evaluation, "dict") else evaluation
+                except Exception as e:
+                    self._shard_failed(batch, attempt, e)
+            return {"passed": False, "feedback": []}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(shards)))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, evaluate, batch) for batch in shards]
+            return [future.result() for future in futures]
+
+    async def _aevaluate_shards(self, chain, shards: list, score_json: dict, summaries: dict,
+                                format_instructions: str) -> list:
+        """_evaluate_shards 的非同步版本，以 semaphore 限制同時進行的請求數"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def evaluate(batch):
+            inputs = self._shard_inputs(batch, score_json, summaries, format_instructions)
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with semaphore:
+                        with tracer.span("evaluate", stage="evaluate_and_revise", instruments=",".join(batch),
+                                         retry=attempt):
+                            evaluation = await chain.ainvoke(inputs)
+                    return evaluation.dict() if hasattr(evaluation, "dict") else evaluation
+                except Exception as e:
+                    self._shard_failed(batch, attempt, e)
+            return {"passed": False, "feedback": []}
+
+        return await asyncio.gather(*(evaluate(batch) for batch in shards))
+
+    def evaluate_score(self, scores: dict, musicians: dict, num_measures: int = None,
+                       time_signature: str = None) -> dict:
+        """
+        評估樂譜：先進行本地規則檢查（音符數、音域、小節長度、音階進行、平行五八度與力度），
+        有必須修正的問題時直接返回，不呼叫 LLM；否則依樂器組以執行緒同時請 LLM 評估。
+        不使用事件迴圈，可在 Jupyter 等已有事件迴圈的環境呼叫；非同步的呼叫端可改用 aevaluate_score。
+
+        Args:
+            scores (dict): 樂器名稱對應的 CompactPart。
+            musicians (dict): 樂器名稱對應的演奏者代理。
+            num_measures (int): 預期的小節數；未指定時只檢查最後一小節是否完整。
+            time_signature (str): 樂曲的拍號；未指定時使用各聲部自己的拍號。
+
+        Returns:
+            dict: {"passed": bool, "feedback": [{"target", "message"}, ...]}
+        """
+        early, job, warnings = self._prepare(scores, musicians, num_measures, time_signature)
+        if early is not None:
+            return early
+        return self._merge(self._evaluate_shards(*job), warnings)
+
+    async def aevaluate_score(self, scores: dict, musicians: dict, num_measures: int = None,
+                              time_signature: str = None) -> dict:
+        """evaluate_score 的非同步版本，各樂器組以 chain.ainvoke 同時評估"""
+        early, job, warnings = self._prepare(scores, musicians, num_measures, time_signature)
+        if early is not None:
+            return early
+        return self._merge(await self._aevaluate_shards(*job), warnings)
+
+    def _prepare(self, scores: dict, musicians: dict, num_measures: int, time_signature: str) -> tuple:
+        """
+        進行本地規則檢查並準備各組的評估請求。
+
+        Returns:
+            tuple: (規則檢查未通過時的評估結果或 None, _evaluate_shards 的參數, 規則檢查的建議)。
+        """
+        with tracer.span("local_analysis", stage="evaluate_and_revise") as span:
+            issues, warnings = self.analyzer.analyze(scores, num_measures, time_signature)
+            span.set_attributes(issues=len(issues), warnings=len(warnings))
+        if issues:
+            evaluation_dict = {"passed": False, "feedback": issues + warnings}
+            self.console.print(evaluation_dict)
+            return evaluation_dict, None, warnings
+
         instruments_list = list(scores.keys())
         
         
@@ -51,6 +213,9 @@ class ScoreEvaluator:
         [樂譜數據]
         {score_json}
         
+        [其他聲部摘要]（每小節列出每拍開始時的音，"-" 為休止；僅供判斷和聲與配器，不需評估）
+        {context_json}
+        
         [要求]
         - 只針對以下樂器進行評估：{instruments_list}
         - 檢查是否有明確的主題及其發展（避免單純音階或重複音型）。
@@ -70,29 +235,24 @@ class ScoreEvaluator:
         """)
         
         score_json = {inst: musicians[inst]._part_to_json(part) for inst, part in scores.items()}
+        summaries = {inst: self.analyzer.summarize(part) for inst, part in scores.items()}
         chain = harmony_prompt | self.llm | parser
-        try:
-            evaluation = chain.invoke({
-                "score_json": json.dumps(score_json, ensure_ascii=False),
-                "instruments_list": ", ".join(instruments_list),
-                "format_instructions": parser.get_format_instructions()
-            })
-        except Exception as e:
-            self.console.print(f"[red]解析錯誤：{str(e)}[/red]")
-            evaluation = {"passed": False, "feedback": []}
-        
-        # 轉換為字典
-        evaluation_dict = evaluation.dict() if hasattr(evaluation, "dict") else evaluation
+        format_instructions = parser.get_format_instructions()
+
+        # 依樂器組分組評估（提示超過預算時再分批），各組同時進行後合併結果
+        shards = [batch for group in self._group_by_family(instruments_list)
+                  for batch in self._split_by_budget(harmony_prompt, score_json, format_instructions, group, summaries)]
+        return None, (chain, shards, score_json, summaries, format_instructions), warnings
+
+    def _merge(self, results: list, warnings: list) -> dict:
+        """合併各組的評估結果與規則檢查的建議"""
+        evaluation_dict = {
+            "passed": all(result["passed"] for result in results),
+            "feedback": [fb for result in results for fb in result["feedback"]],
+        }
         
-        # 額外檢查音符數量並根據反饋調整 passed
-        for inst, part in scores.items():
-            note_count = len(part.flatten().notesAndRests)
-            if note_count < 8:
-                evaluation_dict["passed"] = False
-                evaluation_dict["feedback"].append({
-                    "target": inst,
-                    "message": f"{inst.capitalize()} 聲部音符數 ({note_count}) 過少，請增加至至少 8 個音符。"
-                })
+        # 規則檢查的建議附在 LLM 反饋之後
+        evaluation_dict["feedback"].extend(warnings)
         
         # 根據反饋內容進一步檢查 passed
         for fb in evaluation_dict["feedback"]:
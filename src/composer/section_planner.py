@@ -0,0 +1,177 @@
+# 標準函式庫
+import re
+from typing import Dict, List, Optional
+
+# 音樂相關
+from music21 import meter
+
+from src.composer.music_theory_database import MusicTheoryDatabase
+from src.music.compact import CompactPart
+from src.music.pitches import midi_to_name, pitch_to_midi
+
+__all__ = ["SectionPlanner"]
+
+# 調名開頭的主音，例如 "Bb major"、"f# minor"、"C大調"；中文的「降B」「升F」寫法也接受
+_TONIC_PATTERN = re.compile(r"^\s*(降|升)?([A-Ga-g])([#♯b♭\-]?)")
+
+# 框架中常見的中文曲式名稱對應 MusicTheoryDatabase 的鍵
+FORM_ALIASES = {
+    "奏鳴曲": "sonata",
+    "迴旋曲": "rondo",
+}
+
+
+class SectionPlanner:
+    """
+    將長篇樂曲切分為段落，讓每個聲部的各段落可以同時生成再接合。
+
+    段落優先採用 design_framework 回傳的 sections，其次依曲式（例如奏鳴曲式的呈示部、
+    發展部、再現部）按比例分配小節，超過上限的段落再平均切分。段落之間以預先規劃的
+    銜接音（內部段落收在屬音、全曲收在主音）與調性、力度規劃作為邊界上下文，
+    因此各段落不必等待前一段完成。
+    """
+
+    def __init__(self, params: dict, theory_db: MusicTheoryDatabase):
+        self.params = params
+        self.theory_db = theory_db
+
+    def plan_sections(self, max_section_measures: int) -> List[Dict]:
+        """
+        規劃段落。
+
+        Args:
+            max_section_measures (int): 每個段落的小節上限。
+
+        Returns:
+            List[Dict]: 依序排列的段落，每段包含 name、start（起始小節，從 1 開始）與 measures。
+        """
+        if max_section_measures < 1:
+            raise ValueError("max_section_measures 必須大於 0")
+        total = int(self.params["num_measures"])
+        named = self._framework_sections(total) or self._form_sections(total) or [("全曲", total)]
+
+        sections = []
+        start = 1
+        for name, measures in named:
+            chunks = -(-measures // max_section_measures)
+            for i in range(chunks):
+                length = measures // chunks + (1 if i < measures % chunks else 0)
+                label = f"{name} ({i + 1}/{chunks})" if chunks > 1 else name
+                sections.append({"index": len(sections), "name": label, "start": start, "measures": length})
+                start += length
+        return sections
+
+    def _framework_sections(self, total: int) -> Optional[List]:
+        """採用框架中的 sections；格式不符或小節總和不等於 num_measures 時返回 None"""
+        raw = self.params.get("structure", {}).get("sections")
+        if not isinstance(raw, list) or not raw:
+            return None
+        try:
+            named = [(str(s["name"]), int(s["measures"])) for s in raw]
+        except (KeyError, TypeError, ValueError):
+            return None
+        if any(measures < 1 for _, measures in named) or sum(measures for _, measures in named) != total:
+            return None
+        return named
+
+    def _form_sections(self, total: int) -> Optional[List]:
+        """依框架的曲式與 MusicTheoryDatabase 的段落比例分配小節"""
+        form_name = str(self.params.get("structure", {}).get("form", "")).lower()
+        forms = self.theory_db.get_form_options()
+        names = list(forms) + [alias for alias, name in FORM_ALIASES.items() if name in forms]
+        matched = next((name for name in names if name in form_name), None)
+        if matched is None:
+            return None
+        form = forms[FORM_ALIASES.get(matched, matched)]
+        if total < len(form["structure"]):
+            return None
+        weights = form.get("proportions") or [1] * len(form["structure"])
+        exact = [total * w / sum(weights) for w in weights]
+        measures = [max(1, int(x)) for x in exact]
+        # 最大餘數法補足或扣回，使總和等於 total
+        order = sorted(range(len(exact)), key=lambda i: exact[i] - int(exact[i]), reverse=True)
+        i = 0
+        while sum(measures) != total:
+            j = order[i % len(order)]
+            if sum(measures) < total:
+                measures[j] += 1
+            elif measures[j] > 1:
+                measures[j] -= 1
+            i += 1
+        return list(zip(form["structure"], measures))
+
+    def _tonic(self) -> Optional[int]:
+        """調名主音的音級（0–11）；無法辨識時為 None"""
+        match = _TONIC_PATTERN.match(str(self.params["key"]))
+        if match is None:
+            return None
+        prefix, step, accidental = match.groups()
+        accidental = accidental or {"降": "-", "升": "#"}.get(prefix, "")
+        return pitch_to_midi(f"{step.upper()}{accidental}4") % 12
+
+    def _anchor_pitch(self, agent, degree: int) -> Optional[str]:
+        """樂器音域中央附近、指定調內音級（0 為主音、7 為屬音）的音高；調名無法辨識時為 None（不指定銜接音）"""
+        tonic = self._tonic()
+        if tonic is None:
+            return None
+        low, high = agent.midi_range
+        target = (tonic + degree) % 12
+        middle = (low + high) // 2
+        candidates = [m for m in range(low, high + 1) if m % 12 == target] or [middle]
+        midi = min(candidates, key=lambda m: abs(m - middle))
+        return midi_to_name(midi)
+
+    def section_instruction(self, instruction: Dict, section: Dict, sections: List[Dict], agent) -> Dict:
+        """
+        為單一段落加上段落範圍與邊界上下文。
+
+        Args:
+            instruction (Dict): 聲部指令。
+            section (Dict): 目前段落。
+            sections (List[Dict]): 所有段落。
+            agent (MusicianAgent): 樂器代理，用於計算音域內的銜接音。
+
+        Returns:
+            Dict: 加上 section 與文字說明 instruction 的新指令。
+        """
+        index = section["index"]
+        previous = sections[index - 1] if index > 0 else None
+        following = sections[index + 1] if index + 1 < len(sections) else None
+        end = section["start"] + section["measures"] - 1
+        boundary = {
+            "key": self.params["key"],
+            "dynamic_plan": self.params.get("structure", {}).get("dynamic_plan", ""),
+            "start_pitch": self._anchor_pitch(agent, 7) if previous else None,
+            "end_pitch": self._anchor_pitch(agent, 7 if following else 0),
+        }
+
+        text = f"本段為「{section['name']}」（第 {section['start']}-{end} 小節，第 {index + 1}/{len(sections)} 段），本段共 {section['measures']} 小節。"
+        if previous:
+            start = f"以接近 {boundary['start_pitch']} 的音開始，" if boundary["start_pitch"] else ""
+            text += f"{start}承接上一段「{previous['name']}」。"
+        if following:
+            end_pitch = f"段落結尾落在 {boundary['end_pitch']} 附近，" if boundary["end_pitch"] else "段落結尾"
+            text += f"{end_pitch}為下一段「{following['name']}」預留銜接。"
+        elif boundary["end_pitch"]:
+            text += f"以 {boundary['end_pitch']} 作為全曲的終止。"
+        else:
+            text += "以主音作為全曲的終止。"
+        text += f"調性：{boundary['key']}；力度規劃：{boundary['dynamic_plan']}"
+
+        return dict(instruction, section=dict(section, boundary=boundary), instruction=text)
+
+    def stitch(self, parts: List[CompactPart], sections: List[Dict]) -> CompactPart:
+        """
+        依段落順序接合各段落的聲部。每段補休止符或截斷至其小節長度，讓所有聲部的段落邊界對齊。
+
+        Args:
+            parts (List[CompactPart]): 與 sections 順序相同的段落樂譜。
+            sections (List[Dict]): 段落。
+
+        Returns:
+            CompactPart: 接合後的完整聲部。
+        """
+        bar_length = meter.TimeSignature(self.params["time_signature"]).barDuration.quarterLength
+        return CompactPart.concat([
+            part.fit(section["measures"] * bar_length) for part, section in zip(parts, sections)
+        ])
@@ -1,10 +1,13 @@
 # 樂器參數映射表
 from music21 import instrument
 
+from src.music.pitches import pitch_to_midi
+
 
 instrument_configs = {
     "piano": {
         "agent_class": "PianistAgent",
+        "performer": "Pianist",
         "default_clef": "both",
         "techniques": [
             "legato",
@@ -14,119 +17,173 @@ instrument_configs = {
             "arpeggio"
         ],
         "pitch_range": ("A0", "C8"),
+        "midi_program": 0,  # General MIDI 音色編號（從 0 起算）
+        "family": "keyboard",  # 評估時的樂器組：strings、winds、brass、percussion、keyboard
         "music21_instrument": instrument.Piano(),
     
     },
     "violin": {
         "agent_class": "ViolinAgent",
+        "performer": "Violinist",
         "default_clef": "treble",
         "techniques": ["arco", "pizz"],
         "pitch_range": ("G3", "E6"),
+        "midi_program": 40,
+        "family": "strings",
         "music21_instrument": instrument.Violin()
     },
     "viola": {
         "agent_class": "ViolaAgent",
+        "performer": "Violaist",
         "default_clef": "alto",
         "techniques": ["arco", "pizz"],
         "pitch_range": ("C3", "A5"),
+        "midi_program": 41,
+        "family": "strings",
         "music21_instrument": instrument.Viola()
     },
     "cello": {
         "agent_class": "CelloAgent",
+        "performer": "Cellist",
         "default_clef": "bass",
         "techniques": ["arco", "pizz"],
         "pitch_range": ("C2", "A3"),
+        "midi_program": 42,
+        "family": "strings",
         "music21_instrument": instrument.Violoncello()
     },
     "flute": {
         "agent_class": "FluteAgent",
+        "performer": "Flutist",
         "default_clef": "treble",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("C4", "C7"),
+        "midi_program": 73,
+        "family": "winds",
         "music21_instrument": instrument.Flute()
     },
     "clarinet": {
         "agent_class": "ClarinetAgent",
+        "performer": "Clarinetist",
         "default_clef": "treble",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("E3", "C7"),
+        "midi_program": 71,
+        "family": "winds",
         "music21_instrument": instrument.Clarinet()
     },
     "trumpet": {
         "agent_class": "TrumpetAgent",
+        "performer": "Trumpeter",
         "default_clef": "treble",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("F#3", "C6"),
+        "midi_program": 56,
+        "family": "brass",
         "music21_instrument": instrument.Trumpet()
     },
     "timpani": {
         "agent_class": "TimpaniAgent",
+        "performer": "Timpanist",
         "default_clef": "bass",
         "techniques": ["roll", "strike"],
         "pitch_range": ("C2", "C4"),
+        "midi_program": 47,
+        "family": "percussion",
         "music21_instrument": instrument.Timpani()
     },
     "double bass": {
         "agent_class": "DoubleBassAgent",
+        "performer": "Double Bassist",
         "default_clef": "bass",
         "techniques": ["arco", "pizz"],
         "pitch_range": ("E2", "G4"),
+        "midi_program": 43,
+        "family": "strings",
         "music21_instrument": instrument.Contrabass()
     },
     "oboe": {
         "agent_class": "OboeAgent",
+        "performer": "Oboist",
         "default_clef": "treble",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("Bb3", "G6"),
+        "midi_program": 68,
+        "family": "winds",
         "music21_instrument": instrument.Oboe()
     },
     "bassoon": {
         "agent_class": "BassoonAgent",
+        "performer": "Bassoonist",
         "default_clef": "bass",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("Bb1", "Eb5"),
+        "midi_program": 70,
+        "family": "winds",
         "music21_instrument": instrument.Bassoon()
     },
     "horn": {
         "agent_class": "HornAgent",
+        "performer": "Hornist",
         "default_clef": "treble",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("F2", "C6"),
+        "midi_program": 60,
+        "family": "brass",
         "music21_instrument": instrument.Horn()
     },
     "trombone": {
         "agent_class": "TromboneAgent",
+        "performer": "Trombonist",
         "default_clef": "bass",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("E2", "Bb4"),
+        "midi_program": 57,
+        "family": "brass",
         "music21_instrument": instrument.Trombone()
     },
     "tuba": {
         "agent_class": "TubaAgent",
+        "performer": "Tubist",
         "default_clef": "bass",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("D1", "F4"),
+        "midi_program": 58,
+        "family": "brass",
         "music21_instrument": instrument.Tuba()
     },
     "harp": {
         "agent_class": "HarpAgent",
+        "performer": "Harpist",
         "default_clef": "treble",  # 豎琴通常使用雙譜表，這裡簡化為高音譜號
         "techniques": ["pluck"],
         "pitch_range": ("Cb1", "G#7"),
+        "midi_program": 46,
+        "family": "keyboard",
         "music21_instrument": instrument.Harp()
     },
     "percussion": {
         "agent_class": "PercussionAgent",
+        "performer": "Percussionist",
         "default_clef": "percussion",  # 使用打擊樂專用譜號
         "techniques": ["strike"],
         "pitch_range": ("C4", "C4"),  # 打擊樂器音高不固定，這裡簡化處理
+        "midi_program": 0,
+        "family": "percussion",
         "music21_instrument": instrument.Percussion()
     },
     "saxophone": {
         "agent_class": "SaxophoneAgent",
+        "performer": "Saxophonist",
         "default_clef": "treble",
         "techniques": ["slur", "tongued"],
         "pitch_range": ("Bb3", "F6"),  # 以中音薩克斯風為例
+        "midi_program": 65,
+        "family": "winds",
         "music21_instrument": instrument.Saxophone()
     }
-}
\ No newline at end of file
+}
+
+# 預先計算音域的 MIDI 編號（midi_range），音域檢查只需整數比較
+for _config in instrument_configs.values():
+    _config["midi_range"] = (pitch_to_midi(_config["pitch_range"][0]), pitch_to_midi(_config["pitch_range"][1]))
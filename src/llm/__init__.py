@@ -0,0 +1,17 @@
+from .client import get_llm, clear_llm_registry, DEFAULT_MODELS
+from .cache import DiskLLMCache
+from .mock import MockChatModel, MockLLMError, configure_mock
+from .tokens import TokenBudgetExceeded, TokenLedger, count_tokens
+
+__all__ = [
+    'get_llm',
+    'clear_llm_registry',
+    'DEFAULT_MODELS',
+    'DiskLLMCache',
+    'MockChatModel',
+    'MockLLMError',
+    'configure_mock',
+    'TokenBudgetExceeded',
+    'TokenLedger',
+    'count_tokens'
+]
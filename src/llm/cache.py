@@ -0,0 +1,158 @@
+# 標準函式庫
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+# LangChain 相關
+from langchain_core._api import suppress_langchain_beta_warning
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+__all__ = ["CACHE_HIT_KEY", "DiskLLMCache"]
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_cache.sqlite")
+
+# 命中快取時在 Generation.generation_info 加上的標記，token 記帳以此略過不需付費的回應
+CACHE_HIT_KEY = "cache_hit"
+
+
+class DiskLLMCache(BaseCache):
+    """
+    以內容定址的磁碟 LLM 回應快取。
+
+    鍵為渲染後的提示加上 LangChain 的模型設定字串（包含 model、temperature、top_p）
+    的 SHA-256，值為 zlib 壓縮後的 Generation 序列，存放於單一 SQLite 檔案。
+    超過 max_bytes 時依最後存取時間（LRU）淘汰，可選擇設定 TTL。
+
+    Attributes:
+        path (str): SQLite 檔案路徑。
+        max_bytes (int): 快取資料總大小上限。
+        ttl (Optional[float]): 項目存活秒數，None 表示永不過期。
+        hits (int): 命中次數。
+        misses (int): 未命中次數。
+        evictions (int): 因容量或過期而刪除的項目數。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        # 目前的資料總大小只在開啟時計算一次，之後隨寫入與刪除更新
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        """由提示與模型設定字串計算快取鍵"""
+        digest = hashlib.sha256()
+        digest.update(prompt.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(llm_string.encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= size
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        with suppress_langchain_beta_warning():
+            generations = loads(zlib.decompress(value).decode("utf-8"))
+        for generation in generations:
+            generation.generation_info = {**(generation.generation_info or {}), CACHE_HIT_KEY: True}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self.make_key(prompt, llm_string)
+        value = zlib.compress(dumps(list(return_val)).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._size += len(value) - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self, batch: int = 32):
+        """超過上限時先刪除過期項目，再依 LRU 順序分批刪除至總大小低於上限（呼叫者需持有鎖）"""
+        if self.ttl is not None:
+            expired = time.time() - self.ttl
+            size = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE created < ?", (expired,)
+            ).fetchone()[0]
+            cursor = self._conn.execute("DELETE FROM entries WHERE created < ?", (expired,))
+            self.evictions += max(cursor.rowcount, 0)
+            self._size -= size
+
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed ASC LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.evictions += 1
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """回傳命中、未命中、淘汰次數與目前的項目數與大小"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,173 @@
+# 標準函式庫
+import asyncio
+import functools
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+# 第三方函式庫
+import httpx
+
+# LangChain 相關
+from langchain_core.caches import BaseCache
+
+from src.llm.tokens import token_accounting_handler
+from src.tracing import tracing_handler
+
+__all__ = ["get_llm", "clear_llm_registry", "DEFAULT_MODELS"]
+
+# 各提供者的預設模型
+DEFAULT_MODELS = {
+    "gemini": "gemini-2.0-flash",
+    "openai": "gpt-3.5-turbo",
+    "mock": "mock",
+}
+
+# 以 (provider, model, temperature, top_p, api_key, cache) 為鍵的共用客戶端
+_registry: Dict[Tuple, object] = {}
+_registry_lock = threading.Lock()
+
+# 所有 OpenAI 客戶端共用同一個 HTTP 連線池與 keep-alive（同步與非同步各一個）
+_HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0)
+_HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    依事件迴圈分開的非同步連線池。
+
+    非同步連線綁定在建立它的事件迴圈上，而每次 compose 都以 asyncio.run 建立新的迴圈；
+    同一個迴圈內的請求共用連線與 keep-alive，迴圈結束後它的連線池隨之釋放。
+    """
+
+    def __init__(self):
+        self._transports = weakref.WeakKeyDictionary()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=_HTTP_LIMITS)
+        return await transport.handle_async_request(request)
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def _shared_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+    return _http_client
+
+
+def _shared_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(transport=_LoopLocalTransport(), timeout=_HTTP_TIMEOUT)
+    return _async_http_client
+
+
+@functools.lru_cache(maxsize=None)
+def _gemini_class():
+    """
+    Gemini 以 gRPC 連線：同步請求共用註冊表實例上的同一個 channel（HTTP/2 多工與 keep-alive）。
+    非同步 channel 綁定在事件迴圈上，這個子類別在同一個迴圈內重複使用它，換了迴圈才重新建立。
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from pydantic import PrivateAttr
+
+    class PooledChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+        _async_loop: object = PrivateAttr(default=None)
+
+        @property
+        def async_client(self):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None and loop is not self._async_loop:
+                self.async_client_running = None
+                self._async_loop = loop
+            return super().async_client
+
+    return PooledChatGoogleGenerativeAI
+
+
+def _build_llm(provider: str, model: str, temperature: float, top_p: float, api_key: Optional[str],
+               cache: Optional[BaseCache]):
+    """依提供者建立新的 LangChain 聊天模型"""
+    if provider == "gemini":
+        return _gemini_class()(
+            model=model, temperature=temperature, top_p=top_p, api_key=api_key, transport="grpc", cache=cache
+        )
+    if provider == "openai":
+        if not api_key:
+            raise ValueError("OpenAI 需要提供 API 金鑰")
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model=model, api_key=api_key, temperature=temperature, top_p=top_p,
+            http_client=_shared_http_client(), http_async_client=_shared_async_http_client(), cache=cache,
+        )
+    if provider == "mock":
+        from src.llm.mock import MockChatModel, MOCK_DEFAULTS
+        return MockChatModel(cache=cache, **MOCK_DEFAULTS)
+    raise ValueError("不支援的 API 提供者，請選擇 'gemini'、'openai' 或 'mock'")
+
+
+def get_llm(provider: str = "gemini", api_key: Optional[str] = None, model: Optional[str] = None,
+            temperature: float = 0.7, top_p: float = 0.9, cache: Optional[BaseCache] = None):
+    """
+    取得共用的 LLM 客戶端。
+
+    相同 (provider, model, temperature, top_p) 設定的呼叫者會拿到同一個實例，
+    因此指揮家、規劃器、評估器與所有樂手代理共用連線，不必各自建立客戶端與 TLS 連線。
+
+    Args:
+        provider (str): API 提供者，"gemini"、"openai" 或離線的 "mock"。
+        api_key (Optional[str]): API 金鑰。
+        model (Optional[str]): 模型名稱，None 時使用 DEFAULT_MODELS。
+        temperature (float): 取樣溫度。
+        top_p (float): nucleus sampling 參數。
+        cache (Optional[BaseCache]): 掛在模型底下的回應快取，例如 DiskLLMCache。
+
+    Returns:
+        BaseChatModel: 共用的聊天模型實例。
+    """
+    if provider not in DEFAULT_MODELS:
+        raise ValueError("不支援的 API 提供者，請選擇 'gemini'、'openai' 或 'mock'")
+    model = model or DEFAULT_MODELS[provider]
+    key = (provider, model, float(temperature), float(top_p), api_key, id(cache) if cache else None)
+    with _registry_lock:
+        llm = _registry.get(key)
+        if llm is None:
+            llm = _build_llm(provider, model, temperature, top_p, api_key, cache)
+            # 每次 LLM 呼叫都記錄為追蹤 span 並計入 token 帳本（未設定時回呼會直接返回）
+            llm.callbacks = [tracing_handler, token_accounting_handler]
+            _registry[key] = llm
+    return llm
+
+
+def clear_llm_registry(provider: Optional[str] = None):
+    """
+    清空共用客戶端。
+
+    Args:
+        provider (Optional[str]): 只清除該提供者的客戶端；None 時全部清除並關閉連線池。
+    """
+    global _http_client, _async_http_client
+    with _registry_lock:
+        if provider is not None:
+            for key in [key for key in _registry if key[0] == provider]:
+                del _registry[key]
+            return
+        _registry.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        # 非同步連線池隨各自的事件迴圈釋放，這裡只丟棄共用的客戶端
+        _async_http_client = None
@@ -0,0 +1,251 @@
+# 標準函式庫
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional
+
+# LangChain 相關
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.instrument_configs import instrument_configs
+from src.music.pitches import midi_to_name, pitch_to_midi
+
+__all__ = ["MockChatModel", "MockLLMError", "MOCK_DEFAULTS", "configure_mock"]
+
+# api_provider="mock" 時使用的預設設定，可用 configure_mock 調整
+MOCK_DEFAULTS: Dict[str, Any] = {
+    "latency_mean": 0.05,
+    "latency_sigma": 0.25,
+    "tokens_per_second": 0.0,
+    "failure_rate": 0.0,
+    "malformed_rate": 0.0,
+    "measures": 4,
+    "seed": None,
+}
+
+_MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]
+
+
+def configure_mock(**settings):
+    """
+    調整 mock 提供者的預設設定，並讓之後的 get_llm("mock") 使用新設定。
+
+    Args:
+        **settings: MOCK_DEFAULTS 中的欄位，例如 latency_mean、failure_rate。
+    """
+    unknown = set(settings) - set(MOCK_DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的 mock 設定：{', '.join(sorted(unknown))}")
+    MOCK_DEFAULTS.update(settings)
+    from src.llm.client import clear_llm_registry
+    clear_llm_registry("mock")
+
+
+class MockLLMError(RuntimeError):
+    """模擬提供者端的錯誤（逾時、限流等）"""
+
+
+class MockChatModel(BaseChatModel):
+    """
+    離線的 mock 聊天模型，用於在沒有網路與 API 金鑰時測量流程本身的開銷。
+
+    依提示內容判斷所需的輸出結構，回傳符合 design_framework、plan_composition、
+    PartInstruction（單一或批次）、PartData、合奏模式的多聲部 PartData 與 EvaluationResult 的 JSON。延遲為對數常態分布，
+    加上依輸出 token 數與 tokens_per_second 計算的生成時間，並可注入失敗與格式錯誤。
+
+    Attributes:
+        latency_mean (float): 首個 token 前延遲的中位數（秒）。
+        latency_sigma (float): 對數常態分布的 sigma，0 表示固定延遲。
+        tokens_per_second (float): 輸出速度，0 表示瞬間完成。
+        failure_rate (float): 拋出 MockLLMError 的機率。
+        malformed_rate (float): 回傳無法解析之 JSON 的機率。
+        measures (int): 樂譜回應的小節數。
+        seed (Optional[int]): 亂數種子，固定後回應與延遲可重現。
+    """
+
+    latency_mean: float = 0.05
+    latency_sigma: float = 0.25
+    tokens_per_second: float = 0.0
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    measures: int = 4
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr()
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": "mock", "measures": self.measures, "seed": self.seed}
+
+    # ---- 回應內容 ----
+
+    def _respond(self, prompt: str) -> Dict:
+        """依提示中要求的輸出結構決定回傳哪一種 JSON（指令內容可能夾帶其他結構的欄位名稱）"""
+        if '"<樂器>"' in prompt:
+            return {name: self._part_instruction() for name in self._instruments(prompt)}
+        if "melody_position (str)" in prompt:
+            return self._part_instruction()
+        if "overall_structure (str)" in prompt:
+            return self._composition_plan(prompt)
+        if '"passed"' in prompt:
+            return {"passed": True, "feedback": []}
+        if '"patches"' in prompt:
+            return self._part_patch(prompt)
+        if '"parts"' in prompt:
+            return {"parts": {name: self._part_data(prompt, name) for name in self._instruments(prompt)}}
+        if '"notes"' in prompt:
+            return self._part_data(prompt)
+        if '"rationale"' in prompt:
+            return self._framework(prompt)
+        return {}
+
+    def _instruments(self, prompt: str) -> List[str]:
+        match = re.search(r"樂器：([^\n]*)", prompt)
+        if not match:
+            return []
+        return [name.strip() for name in match.group(1).split(",") if name.strip()]
+
+    def _framework(self, prompt: str) -> Dict:
+        instruments = self._instruments(prompt)
+        match = re.search(r"小節數：(\d+)", prompt)
+        total = int(match.group(1)) if match else self.measures
+        exposition = max(1, total * 2 // 5)
+        development = max(0, (total - exposition) // 2)
+        sections = [("Exposition", exposition), ("Development", development),
+                    ("Recapitulation", total - exposition - development)]
+        return {
+            "form": "Sonata",
+            "sections": [{"name": name, "measures": measures} for name, measures in sections if measures > 0],
+            "themes": ["上行三和弦動機，附點節奏", "級進下行的抒情旋律"],
+            "harmonic_progression": ["I-IV-V-I", "vi-ii-V-I"],
+            "dynamic_plan": "p 開始，中段漸強至 f，結尾回到 mp",
+            "instrumentation_roles": {inst: "melody" if i == 0 else "harmony" for i, inst in enumerate(instruments)},
+            "rationale": "mock 回應：以奏鳴曲式呈現兩個對比主題",
+        }
+
+    def _composition_plan(self, prompt: str) -> Dict:
+        instruments = self._instruments(prompt)
+        return {
+            "overall_structure": "ABA form with an intro and coda",
+            "instrument_roles": {inst: "melody" if i == 0 else "harmony" for i, inst in enumerate(instruments)},
+            "harmonic_and_dynamic_plan": "I-IV-V-I progression with crescendo in the middle",
+        }
+
+    def _part_instruction(self) -> Dict:
+        return {
+            "melody_position": "entire piece",
+            "coordination_points": ["align with the ensemble at measure 1"],
+            "technical_challenges": ["sustain in the upper register"],
+        }
+
+    def _part_data(self, prompt: str, name: Optional[str] = None) -> Dict:
+        if name is None:
+            match = re.search(r'"instrument":\s*"([^"]+)"', prompt)
+            name = match.group(1).lower() if match else "piano"
+        config = instrument_configs.get(name, instrument_configs["piano"])
+        low, high = config["midi_range"]
+
+        key_match = re.search(r"調號：([A-Ga-g])", prompt)
+        tonic = pitch_to_midi(f"{key_match.group(1).upper()}4") % 12 if key_match else 0
+        scale = [m for m in range(low, high + 1) if (m - tonic) % 12 in _MAJOR_SCALE] or [low]
+
+        beats_match = re.search(r"拍號：(\d+)/(\d+)", prompt)
+        beats = int(beats_match.group(1)) if beats_match else 4
+
+        # 分段生成時指令會註明本段小節數
+        section_match = re.search(r"本段共 (\d+) 小節", prompt)
+        measures = int(section_match.group(1)) if section_match else self.measures
+
+        index = len(scale) // 2
+        notes = []
+        for _ in range(measures * beats):
+            index = min(max(index + self._rng.choice([-2, -1, 1, 2]), 0), len(scale) - 1)
+            notes.append({
+                "pitch": midi_to_name(scale[index]),
+                "duration": 1.0,
+                "technique": config["techniques"][0],
+            })
+        return {"notes": notes, "clef": config["default_clef"], "instrument": name.capitalize()}
+
+    def _part_patch(self, prompt: str) -> Dict:
+        """修改指令：重寫第一小節"""
+        beats_match = re.search(r"拍號：(\d+)/(\d+)", prompt)
+        beats = int(beats_match.group(1)) if beats_match else 4
+        notes = self._part_data(prompt)["notes"][:beats]
+        return {"patches": [{"op": "replace", "start_measure": 1, "end_measure": 1, "notes": notes}]}
+
+    # ---- 延遲與錯誤注入 ----
+
+    def _prepare(self, messages: List[BaseMessage]):
+        """產生回應文字、token 數與延遲；依設定拋出錯誤或回傳截斷的 JSON"""
+        prompt = "\n".join(str(m.content) for m in messages)
+        if self._rng.random() < self.failure_rate:
+            raise MockLLMError("mock provider failure")
+        text = json.dumps(self._respond(prompt), ensure_ascii=False)
+        if self._rng.random() < self.malformed_rate:
+            # 重複的逗號讓 JSON 無法解析（單純截斷會被 JsonOutputParser 當成部分 JSON 接受）
+            text = text.replace(", ", ",, ", 1) if ", " in text else text + ",,"
+
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = max(1, len(text) // 4)
+        first_token = self.latency_mean * (self._rng.lognormvariate(0, self.latency_sigma) if self.latency_sigma else 1)
+        generation = output_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                 "total_tokens": input_tokens + output_tokens}
+        return text, usage, first_token, generation
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text, usage, first_token, generation = self._prepare(messages)
+        time.sleep(first_token + generation)
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text, usage, first_token, generation = self._prepare(messages)
+        await asyncio.sleep(first_token + generation)
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, text: str, size: int = 16) -> List[str]:
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text, usage, first_token, generation = self._prepare(messages)
+        pieces = self._chunks(text)
+        time.sleep(first_token)
+        for i, piece in enumerate(pieces):
+            time.sleep(generation / len(pieces))
+            chunk = AIMessageChunk(content=piece, usage_metadata=usage if i == len(pieces) - 1 else None)
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text, usage, first_token, generation = self._prepare(messages)
+        pieces = self._chunks(text)
+        await asyncio.sleep(first_token)
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(generation / len(pieces))
+            chunk = AIMessageChunk(content=piece, usage_metadata=usage if i == len(pieces) - 1 else None)
+            if run_manager:
+                await run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=chunk)
@@ -0,0 +1,207 @@
+# 標準函式庫
+import contextlib
+import contextvars
+import functools
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+# LangChain 相關
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.llm.cache import CACHE_HIT_KEY
+from src.tracing import tracer
+
+__all__ = [
+    "count_tokens",
+    "TokenBudgetExceeded",
+    "TokenLedger",
+    "TokenAccountingHandler",
+    "token_accounting_handler",
+    "use_ledger",
+    "current_ledger",
+]
+
+_current_ledger: contextvars.ContextVar = contextvars.ContextVar("current_ledger", default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    """取得 tiktoken 編碼；模型未知時用 cl100k_base，tiktoken 無法使用（例如離線下載編碼表失敗）時返回 None"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    計算文字的 token 數。
+
+    OpenAI 模型使用對應的 tiktoken 編碼；其他模型（例如 Gemini）以 cl100k_base 近似，
+    tiktoken 無法使用時以每 4 個字元 1 個 token 估算。
+
+    Args:
+        text (str): 文字內容。
+        model (Optional[str]): 模型名稱。
+
+    Returns:
+        int: token 數。
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """請求的提示超過階段的 token 預算，在送出前就中止"""
+
+    def __init__(self, stage: str, prompt_tokens: int, budget: int):
+        self.stage = stage
+        self.prompt_tokens = prompt_tokens
+        self.budget = budget
+        super().__init__(f"{stage} 階段的提示有 {prompt_tokens} tokens，超過預算 {budget}")
+
+
+class TokenLedger:
+    """
+    記錄每次 LLM 呼叫的 token 數，並檢查各階段的單次請求預算。
+
+    Attributes:
+        budgets (Dict[str, int]): 階段名稱對應的單次請求提示 token 上限。
+        calls (List[Dict]): 每次呼叫的紀錄（stage、instrument、prompt_tokens、completion_tokens、source）。
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = dict(budgets or {})
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def budget(self, stage: Optional[str]) -> Optional[int]:
+        return self.budgets.get(stage) if stage else None
+
+    def check(self, stage: Optional[str], prompt_tokens: int):
+        """提示超過該階段預算時拋出 TokenBudgetExceeded"""
+        budget = self.budget(stage)
+        if budget is not None and prompt_tokens > budget:
+            raise TokenBudgetExceeded(stage, prompt_tokens, budget)
+
+    def record(self, stage: Optional[str], instrument: Optional[str], prompt_tokens: int,
+               completion_tokens: int, source: str):
+        with self._lock:
+            self.calls.append({
+                "stage": stage,
+                "instrument": instrument,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "source": source,
+            })
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """
+        依階段彙總 token 數。
+
+        Returns:
+            Dict[str, Dict[str, int]]: 階段（依首次呼叫的順序）對應的 calls、prompt_tokens、completion_tokens，
+                最後一項為 "total"。
+        """
+        totals = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            usage = totals[call["stage"] or "other"]
+            usage["calls"] += 1
+            usage["prompt_tokens"] += call["prompt_tokens"]
+            usage["completion_tokens"] += call["completion_tokens"]
+        if calls:
+            totals["total"] = {key: sum(usage[key] for usage in totals.values())
+                               for key in ("calls", "prompt_tokens", "completion_tokens")}
+        return dict(totals)
+
+    def reset(self):
+        with self._lock:
+            self.calls = []
+
+
+@contextlib.contextmanager
+def use_ledger(ledger: TokenLedger):
+    """在區塊內將 LLM 呼叫記錄到指定的帳本"""
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+def current_ledger() -> Optional[TokenLedger]:
+    return _current_ledger.get()
+
+
+class TokenAccountingHandler(BaseCallbackHandler):
+    """
+    掛在共用 LLM 客戶端上的 token 記帳回呼。
+
+    請求送出前估算提示 token 數並檢查目前階段的預算（raise_error 讓超出預算的請求直接失敗），
+    回應後優先使用提供者回傳的 usage metadata，沒有時以 count_tokens 估算；來自 DiskLLMCache 的回應不記帳。
+    階段與樂器取自目前的追蹤 span。
+    """
+
+    run_inline = True
+    raise_error = True
+
+    def __init__(self):
+        self._pending: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any):
+        ledger = _current_ledger.get()
+        if ledger is None:
+            return
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name")
+        prompt = "\n".join(str(m.content) for batch in messages for m in batch)
+        prompt_tokens = count_tokens(prompt, model)
+
+        span = tracer.current()
+        stage = span.inherited("stage")
+        ledger.check(stage, prompt_tokens)
+        self._pending[run_id] = {
+            "ledger": ledger,
+            "model": model,
+            "stage": stage,
+            "instrument": span.inherited("instrument"),
+            "prompt_tokens": prompt_tokens,
+        }
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        # 快取命中的回應沒有實際送出請求，不計入花費
+        generations = [g for batch in response.generations for g in batch]
+        if generations and all((g.generation_info or {}).get(CACHE_HIT_KEY) for g in generations):
+            return
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            pass
+        if usage:
+            prompt_tokens, completion_tokens, source = usage["input_tokens"], usage["output_tokens"], "provider"
+        else:
+            text = "".join(g.text for g in generations)
+            prompt_tokens = pending["prompt_tokens"]
+            completion_tokens = count_tokens(text, pending["model"])
+            source = "estimate"
+        pending["ledger"].record(pending["stage"], pending["instrument"], prompt_tokens, completion_tokens, source)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._pending.pop(run_id, None)
+
+
+token_accounting_handler = TokenAccountingHandler()
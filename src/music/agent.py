@@ -43,7 +43,7 @@ class ViolinAgent(MusicianAgent):
         api_key (str): API 金鑰。
     """
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         """
         初始化 ViolinAgent 實例。
 
@@ -51,6 +51,7 @@ class ViolinAgent(MusicianAgent):
             role (str): 演奏者的角色，例如 "Violinist"。
             api_provider (str): API 提供者名稱。
             api_key (str): API 驗證金鑰。
+            **kwargs: 傳給 MusicianAgent 的其他設定，例如 temperature、llm_cache。
         """
         super().__init__(
             role=role,
@@ -59,11 +60,12 @@ class ViolinAgent(MusicianAgent):
             techniques=["arco", "pizz"],
             pitch_range=("G3", "E6"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
         
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作小提琴聲部，並以 JSON 格式輸出：
 
         [參數]
@@ -97,24 +99,16 @@ class ViolinAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請確保旋律具有起承轉合的結構，避免單純的音階重複
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser 
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "instruction": instruction.get("instruction", "")
-        })
-        self.part = self._parse_score(response)
-        return self.part
+
+    def _score_inputs(self, global_params: Dict, instruction: Dict) -> Dict:
+        inputs = super()._score_inputs(global_params, instruction)
+        inputs["instruction"] = instruction.get("instruction", "")
+        return inputs
     
 class ViolaAgent(MusicianAgent):
     """中提琴聲部代理"""
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Viola",
@@ -122,11 +116,12 @@ class ViolaAgent(MusicianAgent):
             techniques=["arco", "pizz"],
             pitch_range=("C3", "A5"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
         
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作小提琴聲部，並以 JSON 格式輸出：
 
         [參數]
@@ -160,33 +155,12 @@ class ViolaAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請確保旋律具有起承轉合的結構，避免單純的音階重複
         """)
-
-        # 從 instruction 中獲取主題、和聲和動態信息，若無則使用默認值
-        theme_description = instruction.get("theme", "請創作一個具有特色的旋律動機")
-        harmonic_progression = instruction.get("harmonic_progression", "自由和聲進行")
-        dynamic_plan = instruction.get("dynamic_plan", "自由動態變化")
-
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "theme_description": theme_description,
-            "harmonic_progression": harmonic_progression,
-            "dynamic_plan": dynamic_plan,
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part
     
     
 class CelloAgent(MusicianAgent):
     """大提琴聲部代理"""
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Cello",
@@ -194,11 +168,12 @@ class CelloAgent(MusicianAgent):
             techniques=["arco", "pizz"],
             pitch_range=("C2", "A3"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
         
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作大提琴聲部，並以 JSON 格式輸出：
         
         [參數]
@@ -234,24 +209,11 @@ class CelloAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請生成一個純粹的 JSON 對象，請勿包含任何註解或額外文字，輸出必須符合標準 JSON 格式。
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part
     
 class ClarinetAgent(MusicianAgent):
     """單簧管聲部代理"""
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Clarinet",
@@ -259,11 +221,12 @@ class ClarinetAgent(MusicianAgent):
             techniques=["slur", "tongued"],
             pitch_range=("E3", "C7"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
         
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作單簧管聲部，並以 JSON 格式輸出：
         
         [參數]
@@ -296,25 +259,12 @@ class ClarinetAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請生成一個純粹的 JSON 對象，請勿包含任何註解或額外文字，輸出必須符合標準 JSON 格式。
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part    
     
 """笛聲部代理"""
     
 class FluteAgent(MusicianAgent):
     """長笛聲部代理"""
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Flute",
@@ -322,11 +272,12 @@ class FluteAgent(MusicianAgent):
             techniques=["slur", "tongued"],
             pitch_range=("C4", "C7"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
     
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作長笛聲部，並以 JSON 格式輸出：
         
         [參數]
@@ -359,25 +310,12 @@ class FluteAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請生成一個純粹的 JSON 對象，請勿包含任何註解或額外文字，輸出必須符合標準 JSON 格式。
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part
 
 
 class TrumpetAgent(MusicianAgent):
     """小號聲部代理"""
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Trumpet",
@@ -385,11 +323,12 @@ class TrumpetAgent(MusicianAgent):
             techniques=["slur", "tongued"],
             pitch_range=("F#3", "C6"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
         
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作小號聲部，並以 JSON 格式輸出：
         
         [參數]
@@ -422,25 +361,12 @@ class TrumpetAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請生成一個純粹的 JSON 對象，請勿包含任何註解或額外文字，輸出必須符合標準 JSON 格式。
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part
     
     
 class TimpaniAgent(MusicianAgent):
     """定音鼓聲部代理"""
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Timpani",
@@ -448,11 +374,12 @@ class TimpaniAgent(MusicianAgent):
             techniques=["roll", "strike"],
             pitch_range=("C2", "C4"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
     
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作定音鼓聲部，並以 JSON 格式輸出：
         
         [參數]
@@ -485,20 +412,6 @@ class TimpaniAgent(MusicianAgent):
         - 總時長應符合拍號 {time_signature}
         - 請生成一個純粹的 JSON 對象，請勿包含任何註解或額外文字，輸出必須符合標準 JSON 格式。
         """)
-        
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part
 
 
 
@@ -509,8 +422,8 @@ class TimpaniAgent(MusicianAgent):
 class CellistAgent(MusicianAgent):
     """大提琴聲部代理"""
     
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        prompt = ChatPromptTemplate.from_template("""
+    def _score_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作大提琴聲部，並以 JSON 格式輸出：
         
         [參數]
@@ -555,25 +468,16 @@ class CellistAgent(MusicianAgent):
             "instrument": "Cello"
         }}
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
-            "techniques": "持續低音與撥奏交替",
-            "instruction": json.dumps(instruction, ensure_ascii=False)
-        })
-        self.part = self._parse_score(response)
-        return self.part
+
+    def _score_inputs(self, global_params: Dict, instruction: Dict) -> Dict:
+        inputs = super()._score_inputs(global_params, instruction)
+        inputs["techniques"] = "持續低音與撥奏交替"
+        return inputs
 
 class PianistAgent(MusicianAgent):
     """鋼琴聲部代理"""
     
-    def __init__(self, role: str, api_provider: str, api_key: str):
+    def __init__(self, role: str, api_provider: str, api_key: str, **kwargs):
         super().__init__(
             role=role,
             instrument_name="Piano",
@@ -587,21 +491,18 @@ class PianistAgent(MusicianAgent):
             ],
             pitch_range=("A0", "C8"),
             api_provider=api_provider,
-            api_key=api_key
+            api_key=api_key,
+            **kwargs
         )
         
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
+    def _score_prompt(self) -> ChatPromptTemplate:
         """
-        根據全局參數和指令生成鋼琴的樂譜。
-
-        Args:
-            global_params (Dict): 包含音樂創作的全局參數。
-            instruction (Dict): 包含具體的創作指令。
+        鋼琴樂譜的提示模板，額外包含協調點、技術挑戰與旋律位置。
 
         Returns:
-            stream.Part: 生成的鋼琴樂譜部分。
+            ChatPromptTemplate: 鋼琴聲部的提示模板。
         """
-        prompt = ChatPromptTemplate.from_template("""
+        return ChatPromptTemplate.from_template("""
         作為{role}演奏家，請創作鋼琴聲部，並以 JSON 格式輸出：
 
         [參數]
@@ -651,22 +552,14 @@ class PianistAgent(MusicianAgent):
         - 和弦使用逗號分隔的音高列表
         - 總時長應符合拍號 {time_signature}
         """)
-        
-        parser = JsonOutputParser(pydantic_object=PartData)
-        chain = prompt | self.llm | parser
-        
-        response = chain.invoke({
-            "role": self.role,
-            "style": global_params["style"],
-            "tempo": global_params["tempo"],
-            "key": global_params["key"],
-            "time_signature": global_params["time_signature"],
+
+    def _score_inputs(self, global_params: Dict, instruction: Dict) -> Dict:
+        inputs = super()._score_inputs(global_params, instruction)
+        inputs.update({
             "instruction": instruction.get("instruction", ""),
             "coordination_points": instruction.get("coordination_points", ""),
             "technical_challenges": instruction.get("technical_challenges", ""),
             "melody_position": instruction.get("melody_position", "")
         })
-        
-        self.part = self._parse_score(response)
-        return self.part
+        return inputs
 
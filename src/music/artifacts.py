@@ -0,0 +1,107 @@
+# 標準函式庫
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+from src.music.compact import CompactPart
+
+__all__ = ["ArtifactStore"]
+
+DEFAULT_ARTIFACT_DIR = ".artifacts"
+
+# 鍵鎖的數量；鍵依雜湊分配到固定數量的鎖，不同鍵偶爾共用同一把鎖只會互相等待
+KEY_LOCK_STRIPES = 64
+
+
+class ArtifactStore:
+    """
+    以內容定址的算繪結果存放區。
+
+    鍵為各聲部 CompactPart.digest()、輸出格式與算繪參數（例如 tempo）的 SHA-256，
+    檔案存放於 <root>/<鍵前兩碼>/<鍵>.<格式>。未變更的樂譜再次算繪時直接返回既有檔案；
+    新檔案先寫到同目錄的暫存檔再以 os.replace 原子替換，同時進行的工作不會互相覆寫或讀到半個檔案。
+
+    Attributes:
+        root (str): 存放目錄。
+        hits (int): 命中次數。
+        misses (int): 未命中（實際算繪）次數。
+    """
+
+    def __init__(self, root: str = DEFAULT_ARTIFACT_DIR):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(score_drafts: Dict[str, CompactPart], audio_format: str, **params) -> str:
+        """
+        計算快取鍵。
+
+        Args:
+            score_drafts (Dict[str, CompactPart]): 樂器名稱對應的聲部；順序會影響輸出（例如 MIDI 音軌順序），因此納入鍵中。
+            audio_format (str): 輸出格式（副檔名）。
+            **params: 其他影響輸出的參數，例如 tempo、backend。
+        """
+        payload = {
+            "format": audio_format,
+            "params": params,
+            "parts": [[name, part.digest()] for name, part in score_drafts.items()],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, audio_format: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{audio_format}")
+
+    def get(self, key: str, audio_format: str) -> Optional[str]:
+        """返回已存在的檔案路徑，不存在時為 None"""
+        path = self.path_for(key, audio_format)
+        return path if os.path.exists(path) else None
+
+    def get_or_create(self, key: str, audio_format: str, producer: Callable[[str], Optional[str]]) -> Optional[str]:
+        """
+        取得檔案，不存在時以 producer 產生。
+
+        Args:
+            key (str): make_key 的結果。
+            audio_format (str): 輸出格式（副檔名）。
+            producer (Callable[[str], Optional[str]]): 以暫存檔的基底路徑（不含副檔名）呼叫，
+                返回實際寫出的檔案路徑；失敗時返回 None。
+
+        Returns:
+            Optional[str]: 存放區中的檔案路徑；producer 失敗時為 None。
+        """
+        key_lock = self._key_locks[int(key[:8], 16) % KEY_LOCK_STRIPES]
+        # 同一個鍵同時只算繪一次，其餘等待後直接命中
+        with key_lock:
+            path = self.get(key, audio_format)
+            if path is not None:
+                with self._lock:
+                    self.hits += 1
+                return path
+
+            with self._lock:
+                self.misses += 1
+            directory = os.path.dirname(self.path_for(key, audio_format))
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=directory) as temp_dir:
+                produced = producer(os.path.join(temp_dir, key))
+                if produced is None or not os.path.exists(produced):
+                    return None
+                path = self.path_for(key, audio_format)
+                os.replace(produced, path)
+            return path
+
+    def stats(self) -> Dict[str, int]:
+        """回傳命中、未命中次數與目前的檔案數與大小"""
+        files, size = 0, 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                files += 1
+                size += os.path.getsize(os.path.join(directory, name))
+        return {"hits": self.hits, "misses": self.misses, "files": files, "bytes": size}
@@ -0,0 +1,377 @@
+# 標準函式庫
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 數值計算
+import numpy as np
+
+# 音樂相關
+from music21 import articulations, chord, clef, key, meter, note, stream
+
+from src.music.pitches import midi_to_name, pitch_to_midi
+
+__all__ = ["CompactPart", "CompactPartBuilder", "NOTE_DTYPE", "REST", "DEFAULT_VELOCITY", "DYNAMIC_VELOCITIES"]
+
+# 每個音符一列：起始位置與時值以四分音符為單位，pitch 為 MIDI 編號（和弦為第一個音），
+# chord 為和弦在 chord_offsets 中的索引（單音與休止符為 -1），technique 為樂器技巧列表的索引
+NOTE_DTYPE = np.dtype([
+    ("onset", np.float64),
+    ("duration", np.float32),
+    ("pitch", np.int16),
+    ("chord", np.int32),
+    ("technique", np.int8),
+    ("velocity", np.uint8),
+])
+
+# 休止符的 pitch 與 technique
+REST = -1
+
+# 沒有指定力度時的 MIDI velocity（約為 mf）
+DEFAULT_VELOCITY = 80
+
+# 力度記號對應的 MIDI velocity，LLM 以 "dynamic" 欄位標示力度時使用
+DYNAMIC_VELOCITIES = {"ppp": 16, "pp": 33, "p": 49, "mp": 64, "mf": 80, "f": 96, "ff": 112, "fff": 127}
+
+
+def _quarters(value: float) -> float:
+    """float32 欄位轉回的時間去掉浮點尾數，例如 0.3333333432674408 → 0.333333"""
+    return float(round(value, 6))
+
+
+def _make_clef(clef_name: str) -> 'clef.Clef':
+    if clef_name.lower() == "bass":
+        return clef.BassClef()
+    elif clef_name.lower() == "alto":
+        return clef.AltoClef()
+    return clef.TrebleClef()  # 預設高音譜號
+
+
+class CompactPart:
+    """
+    以 NumPy 結構化陣列保存的聲部，是流程中樂譜的標準記憶體格式。
+
+    音符直接由 LLM 的 JSON 建立，評估、修改與檢查點都以陣列或 to_json() 處理，
+    只有匯出 MusicXML/MIDI 時才以 to_music21() 建立 music21 物件。
+
+    Attributes:
+        notes (np.ndarray): NOTE_DTYPE 的音符陣列，依 onset 排序。
+        chord_offsets (np.ndarray): 和弦 i 的音高為 chord_pitches[chord_offsets[i]:chord_offsets[i + 1]]。
+        chord_pitches (np.ndarray): 所有和弦的 MIDI 音高。
+        techniques (Tuple[str, ...]): technique 欄位對應的技巧名稱。
+        clef (str): 譜號名稱（treble、bass、alto）。
+        instrument (str): 樂器名稱。
+        time_signature (str): 拍號。
+        key_fifths (int): 調號的升降記號數。
+    """
+
+    __slots__ = ("notes", "chord_offsets", "chord_pitches", "techniques", "clef", "instrument",
+                 "time_signature", "key_fifths")
+
+    def __init__(self, notes: np.ndarray, chord_offsets: np.ndarray, chord_pitches: np.ndarray,
+                 techniques: Sequence[str], clef: str = "treble", instrument: str = "",
+                 time_signature: str = "4/4", key_fifths: int = 0):
+        self.notes = notes
+        self.chord_offsets = chord_offsets
+        self.chord_pitches = chord_pitches
+        self.techniques = tuple(techniques)
+        self.clef = clef
+        self.instrument = instrument
+        self.time_signature = time_signature
+        self.key_fifths = key_fifths
+
+    @classmethod
+    def from_json(cls, data: Dict, techniques: Sequence[str], pitch_range: Optional[Tuple[str, str]] = None,
+                  instrument_name: str = "") -> 'CompactPart':
+        """
+        由 LLM 回傳（並經 PartRepairer 修正）的 JSON 建立聲部。
+
+        Args:
+            data (Dict): 包含 notes 與 clef 的聲部資料。
+            techniques (Sequence[str]): 樂器可用技巧，第一個為預設值。
+            pitch_range (Optional[Tuple[str, str]]): 音域；超出音域的音符會被略過。
+            instrument_name (str): 樂器名稱。
+        """
+        builder = CompactPartBuilder(techniques, data.get("clef") or "treble", instrument_name, pitch_range)
+        for note_data in data["notes"]:
+            builder.append(note_data)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    def __repr__(self) -> str:
+        return f"CompactPart({self.instrument!r}, {len(self)} notes, {self.quarter_length} quarters)"
+
+    @property
+    def quarter_length(self) -> float:
+        """聲部總長度（四分音符）"""
+        if not len(self.notes):
+            return 0.0
+        return float(np.max(self.notes["onset"] + self.notes["duration"]))
+
+    @property
+    def bar_length(self) -> float:
+        """一小節的長度（四分音符），取自拍號"""
+        numerator, denominator = (int(x) for x in self.time_signature.split("/"))
+        return numerator * 4.0 / denominator
+
+    @property
+    def measure_count(self) -> int:
+        """小節數；最後一小節未填滿時也算一小節"""
+        return int(np.ceil(self.quarter_length / self.bar_length - 1e-9))
+
+    def digest(self) -> str:
+        """
+        聲部內容的 SHA-256，作為算繪結果的快取鍵。
+
+        只涵蓋音符、和弦表、技巧、譜號、拍號與調號等會影響輸出的內容。
+        """
+        hasher = hashlib.sha256()
+        for array in (self.notes, self.chord_offsets, self.chord_pitches):
+            hasher.update(np.ascontiguousarray(array).tobytes())
+        meta = [self.techniques, self.clef, self.instrument, self.time_signature, self.key_fifths]
+        hasher.update(json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+        return hasher.hexdigest()
+
+    @property
+    def nbytes(self) -> int:
+        return self.notes.nbytes + self.chord_offsets.nbytes + self.chord_pitches.nbytes
+
+    def pitches(self, index: int) -> List[int]:
+        """第 index 個音符的所有 MIDI 音高；休止符為空列表"""
+        row = self.notes[index]
+        if row["pitch"] == REST:
+            return []
+        if row["chord"] < 0:
+            return [int(row["pitch"])]
+        start, end = self.chord_offsets[row["chord"]], self.chord_offsets[row["chord"] + 1]
+        return self.chord_pitches[start:end].tolist()
+
+    def to_json(self) -> Dict:
+        """轉為與 LLM 輸出相同格式的 JSON，供評估、修改提示與檢查點使用；音名依調號拼寫"""
+        offsets = self.chord_offsets.tolist()
+        chord_pitches = self.chord_pitches.tolist()
+        fifths = self.key_fifths
+        notes_data = []
+        for _, duration, midi, chord_index, technique, velocity in self.notes.tolist():
+            duration = _quarters(duration)
+            if midi == REST:
+                notes_data.append({"pitch": "rest", "duration": duration, "technique": "none"})
+                continue
+            if chord_index >= 0:
+                name = " ".join(midi_to_name(m, fifths)
+                                for m in chord_pitches[offsets[chord_index]:offsets[chord_index + 1]])
+            else:
+                name = midi_to_name(midi, fifths)
+            note_data = {"pitch": name, "duration": duration, "technique": self.techniques[technique]}
+            if velocity != DEFAULT_VELOCITY:
+                note_data["velocity"] = velocity
+            notes_data.append(note_data)
+        return {"notes": notes_data, "clef": self.clef, "instrument": self.instrument}
+
+    def to_music21(self) -> 'stream.Part':
+        """建立 music21 Part，只在匯出時使用；MIDI 音高依調號拼寫（降號調為降記號、升號調為升記號）"""
+        part = stream.Part()
+        part.insert(0, meter.TimeSignature(self.time_signature))
+        part.insert(0, key.KeySignature(self.key_fifths))
+        part.insert(0, _make_clef(self.clef))
+
+        offsets = self.chord_offsets.tolist()
+        chord_pitches = self.chord_pitches.tolist()
+        for onset, duration, midi, chord_index, technique, velocity in self.notes.tolist():
+            onset, duration = _quarters(onset), _quarters(duration)
+            if midi == REST:
+                part.coreInsert(onset, note.Rest(quarterLength=duration))
+                continue
+            if chord_index >= 0:
+                midis = chord_pitches[offsets[chord_index]:offsets[chord_index + 1]]
+                element = chord.Chord([midi_to_name(m, self.key_fifths) for m in midis], quarterLength=duration)
+            else:
+                element = note.Note(midi_to_name(midi, self.key_fifths), quarterLength=duration)
+            element.volume.velocity = velocity
+            if self.techniques[technique] == "pizz":
+                element.articulations.append(articulations.Pizzicato())
+            part.coreInsert(onset, element)
+        part.coreElementsChanged()
+        return part
+
+    def fit(self, quarter_length: float) -> 'CompactPart':
+        """
+        截斷或以休止符補足至指定長度。
+
+        Args:
+            quarter_length (float): 目標長度（四分音符）。
+
+        Returns:
+            CompactPart: 新的聲部；和弦表與原聲部共用。
+        """
+        notes = self.notes[self.notes["onset"] < quarter_length].copy()
+        notes["duration"] = np.minimum(notes["duration"], quarter_length - notes["onset"])
+        end = float(np.max(notes["onset"] + notes["duration"])) if len(notes) else 0.0
+        if end < quarter_length:
+            rest = np.array([(end, quarter_length - end, REST, -1, REST, 0)], dtype=NOTE_DTYPE)
+            notes = np.concatenate([notes, rest])
+        return self._replace(notes, self.chord_offsets, self.chord_pitches)
+
+    def slice(self, start: float, end: float, carry_over: bool = True) -> 'CompactPart':
+        """
+        取出 [start, end) 的內容並移到 0 開始；跨越邊界的音會被截短。
+
+        Args:
+            start (float): 起始位置（四分音符）。
+            end (float): 結束位置（四分音符）。
+            carry_over (bool): 為 False 時，在 start 之前開始、延續到範圍內的音改為休止符。
+
+        Returns:
+            CompactPart: 長度為 end - start 的新聲部；和弦表與原聲部共用。
+        """
+        notes = self.notes
+        inside = (notes["onset"] < end) & (notes["onset"] + notes["duration"] > start)
+        notes = notes[inside].copy()
+        note_end = np.minimum(notes["onset"] + notes["duration"], end)
+        if not carry_over:
+            held = notes["onset"] < start
+            notes["pitch"][held] = REST
+            notes["chord"][held] = -1
+            notes["technique"][held] = REST
+        notes["onset"] = np.maximum(notes["onset"], start)
+        notes["duration"] = note_end - notes["onset"]
+        notes["onset"] -= start
+        return self._replace(notes, self.chord_offsets, self.chord_pitches).fit(end - start)
+
+    def transpose(self, semitones: int) -> 'CompactPart':
+        """所有音（含和弦）移高 semitones 個半音，休止符不變"""
+        notes = self.notes.copy()
+        sounding = notes["pitch"] != REST
+        notes["pitch"][sounding] += semitones
+        return self._replace(notes, self.chord_offsets, self.chord_pitches + semitones)
+
+    def replace_span(self, start: float, end: float, replacement: 'CompactPart') -> 'CompactPart':
+        """
+        以 replacement 取代 [start, end) 的內容，總長度不變。
+
+        replacement 會被截斷或以休止符補足到 end - start；範圍內開始、延續到 end 之後的音，
+        在 end 之後的部分改為休止符。
+
+        Args:
+            start (float): 起始位置（四分音符）。
+            end (float): 結束位置（四分音符）。
+            replacement (CompactPart): 新的內容，技巧列表需與本聲部相同。
+        """
+        if tuple(replacement.techniques) != tuple(self.techniques):
+            raise ValueError("取代內容的技巧列表與原聲部不同")
+        head = self.slice(0.0, start)
+        tail = self.slice(end, max(end, self.quarter_length), carry_over=False)
+        return CompactPart.concat([head, replacement.fit(end - start), tail])
+
+    @classmethod
+    def concat(cls, parts: Sequence['CompactPart']) -> 'CompactPart':
+        """
+        依序接合多個聲部，後一段的起始位置接在前一段的結尾。
+
+        Args:
+            parts (Sequence[CompactPart]): 至少一個聲部；拍號、譜號等取自第一個。
+        """
+        notes, offsets, chord_pitches = [], [np.zeros(1, dtype=np.int32)], []
+        onset, chords, pitch_count = 0.0, 0, 0
+        for part in parts:
+            shifted = part.notes.copy()
+            shifted["onset"] += onset
+            shifted["chord"] = np.where(shifted["chord"] >= 0, shifted["chord"] + chords, -1)
+            notes.append(shifted)
+            offsets.append(part.chord_offsets[1:] + pitch_count)
+            chord_pitches.append(part.chord_pitches)
+            onset += part.quarter_length
+            chords += len(part.chord_offsets) - 1
+            pitch_count += len(part.chord_pitches)
+        return parts[0]._replace(
+            np.concatenate(notes),
+            np.concatenate(offsets).astype(np.int32),
+            np.concatenate(chord_pitches).astype(np.int16),
+        )
+
+    def _replace(self, notes: np.ndarray, chord_offsets: np.ndarray, chord_pitches: np.ndarray) -> 'CompactPart':
+        return CompactPart(notes, chord_offsets, chord_pitches, self.techniques, self.clef, self.instrument,
+                           self.time_signature, self.key_fifths)
+
+
+class CompactPartBuilder:
+    """
+    逐音符建立 CompactPart，供整份 JSON 的轉換與串流生成共用。
+
+    Attributes:
+        clef (str): 譜號名稱，可在 build() 前修改。
+        onset (float): 下一個音符的起始位置，也就是目前的總長度。
+        skipped (List[str]): 因超出音域而略過的音符說明；builder 不自行輸出，由呼叫端決定是否提示。
+    """
+
+    def __init__(self, techniques: Sequence[str], clef: str = "treble", instrument: str = "",
+                 pitch_range: Optional[Tuple[str, str]] = None, time_signature: str = "4/4",
+                 midi_range: Optional[Tuple[int, int]] = None, key_fifths: int = 0):
+        self.techniques = tuple(techniques)
+        self.clef = clef
+        self.instrument = instrument
+        self.pitch_range = pitch_range
+        self.time_signature = time_signature
+        self.key_fifths = key_fifths
+        # 音域檢查只比較整數；呼叫端可傳入預先計算的 midi_range
+        if midi_range is None and pitch_range:
+            midi_range = (pitch_to_midi(pitch_range[0]), pitch_to_midi(pitch_range[1]))
+        self.bounds = midi_range
+        self.onset = 0.0
+        self.skipped: List[str] = []
+        self._rows: List[tuple] = []
+        self._chord_offsets = [0]
+        self._chord_pitches: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def append(self, note_data: Dict) -> Optional[int]:
+        """
+        驗證單一音符並加入；超出音域時略過並記錄在 skipped。
+
+        力度取自 velocity（1–127），沒有時依 dynamic 力度記號（pp–ff）換算。
+
+        Returns:
+            Optional[int]: 加入的列索引，略過時為 None。
+
+        Raises:
+            music21.pitch.PitchException: 音名無法解析時。
+        """
+        duration = float(note_data["duration"])
+        name = note_data["pitch"]
+        if name == "rest":
+            row = (self.onset, duration, REST, -1, REST, 0)
+        else:
+            midis = [pitch_to_midi(p) for p in name.split()] if " " in name else [pitch_to_midi(name)]
+            if self.bounds and not all(self.bounds[0] <= m <= self.bounds[1] for m in midis):
+                label = f"和弦 {name.split()}" if len(midis) > 1 else f"音高 {name}"
+                self.skipped.append(f"{label} 超出 {self.instrument} 的音域 {self.pitch_range}")
+                return None
+            technique = note_data.get("technique")
+            technique = self.techniques.index(technique) if technique in self.techniques else 0
+            velocity = note_data.get("velocity")
+            if not isinstance(velocity, int) or isinstance(velocity, bool) or not 1 <= velocity <= 127:
+                # 沒有數值力度時改用力度記號（例如 "mf"），兩者都沒有時為預設力度
+                dynamic = note_data.get("dynamic")
+                velocity = DYNAMIC_VELOCITIES.get(dynamic.strip().lower() if isinstance(dynamic, str) else None,
+                                                  DEFAULT_VELOCITY)
+            chord_index = -1
+            if len(midis) > 1:
+                chord_index = len(self._chord_offsets) - 1
+                self._chord_pitches.extend(midis)
+                self._chord_offsets.append(len(self._chord_pitches))
+            row = (self.onset, duration, midis[0], chord_index, technique, velocity)
+        self._rows.append(row)
+        self.onset += duration
+        return len(self._rows) - 1
+
+    def build(self) -> CompactPart:
+        return CompactPart(
+            np.array(self._rows, dtype=NOTE_DTYPE),
+            np.array(self._chord_offsets, dtype=np.int32),
+            np.array(self._chord_pitches, dtype=np.int16),
+            self.techniques, self.clef, self.instrument, self.time_signature, self.key_fifths,
+        )
@@ -0,0 +1,128 @@
+# 標準函式庫
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from src.instrument_configs import instrument_configs
+from src.music.compact import REST, CompactPart
+
+__all__ = ["encode_midi", "write_midi", "TICKS_PER_QUARTER"]
+
+TICKS_PER_QUARTER = 480
+
+# General MIDI 的打擊樂固定使用第 10 軌（索引 9），其餘聲部依序分配
+PERCUSSION_CHANNEL = 9
+_MELODIC_CHANNELS = [c for c in range(16) if c != PERCUSSION_CHANNEL]
+
+
+def _vlq(value: int) -> bytes:
+    """MIDI 的可變長度數值編碼"""
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(data))
+
+
+def _meta(meta_type: int, data: bytes) -> bytes:
+    return b"\xff" + bytes([meta_type]) + _vlq(len(data)) + data
+
+
+def _chunk(events: List[Tuple[int, int, bytes]]) -> bytes:
+    """將 (tick, 排序鍵, 事件) 依時間排序並編碼為 MTrk 區塊"""
+    track = bytearray()
+    previous = 0
+    for tick, _, event in sorted(events, key=lambda e: (e[0], e[1])):
+        track += _vlq(tick - previous) + event
+        previous = tick
+    track += _vlq(0) + _meta(0x2F, b"")
+    return b"MTrk" + struct.pack(">I", len(track)) + bytes(track)
+
+
+def _conductor_track(tempo: float, time_signature: str, key_fifths: int) -> bytes:
+    """第 0 軌：速度、拍號與調號"""
+    numerator, denominator = (int(x) for x in time_signature.split("/"))
+    microseconds = round(60_000_000 / tempo)
+    return _chunk([
+        (0, 0, _meta(0x51, microseconds.to_bytes(3, "big"))),
+        (0, 1, _meta(0x58, bytes([numerator, denominator.bit_length() - 1, 24, 8]))),
+        (0, 2, _meta(0x59, struct.pack(">bB", key_fifths, 0))),
+    ])
+
+
+def _part_track(name: str, part: CompactPart, channel: int, program: int, ticks_per_quarter: int) -> bytes:
+    """單一聲部的音軌：名稱、音色與每個音（和弦逐音展開）的 note on/off"""
+    events = [
+        (0, 0, _meta(0x03, name.encode("utf-8"))),
+        (0, 1, bytes([0xC0 | channel, program])),
+    ]
+    offsets = part.chord_offsets.tolist()
+    chord_pitches = part.chord_pitches.tolist()
+    for onset, duration, midi, chord_index, _, velocity in part.notes.tolist():
+        if midi == REST:
+            continue
+        start = round(onset * ticks_per_quarter)
+        end = max(start + 1, round((onset + duration) * ticks_per_quarter))
+        midis = chord_pitches[offsets[chord_index]:offsets[chord_index + 1]] if chord_index >= 0 else [midi]
+        for m in midis:
+            # 同一時間先關音再開音，避免相同音高的連續音被截斷
+            events.append((start, 3, bytes([0x90 | channel, m, velocity])))
+            events.append((end, 2, bytes([0x80 | channel, m, 0])))
+    return _chunk(events)
+
+
+def encode_midi(parts: Dict[str, CompactPart], tempo: float = 120,
+                ticks_per_quarter: int = TICKS_PER_QUARTER, track_cache: Optional[Dict] = None) -> bytes:
+    """
+    將聲部編碼為 type-1 標準 MIDI 檔。
+
+    第 0 軌記錄速度、拍號與調號，之後每個聲部一軌，音色取自 instrument_configs 的 midi_program，
+    力度取自 CompactPart 的 velocity 欄位。
+
+    Args:
+        parts (Dict[str, CompactPart]): 樂器名稱對應的聲部。
+        tempo (float): 每分鐘拍數。
+        ticks_per_quarter (int): 每個四分音符的 tick 數。
+        track_cache (Optional[Dict]): 樂器名稱對應 (聲部雜湊與設定, 音軌位元組) 的快取；
+            傳入同一個字典時只重新編碼內容有變更的聲部，每個樂器只保留最新的音軌。
+
+    Returns:
+        bytes: MIDI 檔內容。
+    """
+    if not parts:
+        raise ValueError("沒有可匯出的聲部")
+    first = next(iter(parts.values()))
+    tracks = [_conductor_track(float(tempo), first.time_signature, first.key_fifths)]
+    melodic = 0
+    for name, part in parts.items():
+        config = instrument_configs.get(name.lower(), {})
+        if name.lower() == "percussion":
+            channel = PERCUSSION_CHANNEL
+        else:
+            channel = _MELODIC_CHANNELS[melodic % len(_MELODIC_CHANNELS)]
+            melodic += 1
+        program = config.get("midi_program", 0)
+        if track_cache is None:
+            tracks.append(_part_track(name, part, channel, program, ticks_per_quarter))
+            continue
+        key = (part.digest(), channel, program, ticks_per_quarter)
+        cached = track_cache.get(name)
+        if cached is None or cached[0] != key:
+            cached = track_cache[name] = (key, _part_track(name, part, channel, program, ticks_per_quarter))
+        tracks.append(cached[1])
+    header = b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), ticks_per_quarter)
+    return header + b"".join(tracks)
+
+
+def write_midi(parts: Dict[str, CompactPart], path: str, tempo: float = 120,
+               ticks_per_quarter: int = TICKS_PER_QUARTER, track_cache: Optional[Dict] = None) -> str:
+    """
+    將聲部寫成 MIDI 檔，不經過 MusicXML 與 MuseScore。
+
+    Returns:
+        str: 寫入的檔案路徑。
+    """
+    data = encode_midi(parts, tempo, ticks_per_quarter, track_cache)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
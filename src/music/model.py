@@ -47,4 +47,18 @@ class ScoreData(BaseModel):
         if not v:
             raise ValueError("音符列表不能為空")
         return v
-    
\ No newline at end of file
+    
+# 合奏模式：一次請求生成所有聲部
+class EnsembleData(BaseModel):
+    parts: Dict[str, PartData] = Field(description="Instrument key (e.g., 'violin') mapped to its part")
+
+# 修改模式：只回傳要修改的小節範圍
+class MeasurePatch(BaseModel):
+    op: str = Field(description="'replace' to rewrite the measures with new notes, or 'transpose' to shift them")
+    start_measure: int = Field(description="First measure to change (1-based, inclusive)")
+    end_measure: int = Field(description="Last measure to change (1-based, inclusive)")
+    notes: List[NoteData] = Field(default_factory=list, description="Replacement notes filling the measures exactly (replace only)")
+    semitones: int = Field(default=0, description="Transposition in semitones, e.g. -12 for an octave down (transpose only)")
+
+class PartPatch(BaseModel):
+    patches: List[MeasurePatch] = Field(description="Non-overlapping measure-range edits to apply to the part")
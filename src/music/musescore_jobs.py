@@ -0,0 +1,147 @@
+# 標準函式庫
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from src.tracing import tracer
+
+__all__ = ["ConversionJob", "MuseScoreBatchRunner", "SUPPORTED_FORMATS"]
+
+# MuseScore 可由 MusicXML 轉出的格式
+SUPPORTED_FORMATS = ("mid", "mp3", "pdf", "png", "wav", "mscz", "musicxml")
+
+
+class ConversionJob:
+    """
+    一個待轉換的檔案：一個輸入檔可以同時輸出多種格式。
+
+    Attributes:
+        input_path (str): 輸入檔（通常是 MusicXML）。
+        outputs (List[str]): 輸出檔路徑，副檔名決定格式。
+        status (str): "pending"、"ok" 或 "error"。
+        error (Optional[str]): 失敗原因。
+        elapsed (Optional[float]): 所屬批次的執行秒數。
+    """
+
+    def __init__(self, input_path: str, outputs: Sequence[str]):
+        for output in outputs:
+            extension = os.path.splitext(output)[1].lstrip(".").lower()
+            if extension not in SUPPORTED_FORMATS:
+                raise ValueError(f"不支援的輸出格式：{output}")
+        self.input_path = input_path
+        self.outputs = list(outputs)
+        self.status = "pending"
+        self.error = None
+        self.elapsed = None
+
+    def to_job_entry(self) -> dict:
+        """MuseScore 批次工作檔（-j）中的一筆"""
+        return {"in": os.path.abspath(self.input_path),
+                "out": [os.path.abspath(p) for p in self.outputs]}
+
+    def __repr__(self) -> str:
+        return f"ConversionJob({self.input_path!r} -> {self.outputs}, {self.status})"
+
+
+class MuseScoreBatchRunner:
+    """
+    收集待轉換的檔案，以 MuseScore 的批次工作檔（`mscore -j jobs.json`）一次轉換多個檔案，
+    讓 MuseScore 的啟動成本由整批分攤。
+
+    批次以有上限的執行緒平行執行；每批的逾時為 job_timeout 乘以該批的工作數，
+    逾時或失敗時已產生輸出的工作仍視為成功，其餘標記為錯誤。
+
+    Attributes:
+        musescore_path (str): MuseScore 執行檔路徑。
+        batch_size (int): 每次啟動 MuseScore 處理的工作數上限。
+        max_workers (int): 同時執行的 MuseScore 行程數上限。
+        job_timeout (float): 每個工作的逾時秒數。
+        on_result (Optional[Callable]): 每個工作完成（成功或失敗）時以 ConversionJob 呼叫。
+    """
+
+    def __init__(self, musescore_path: str, batch_size: int = 20, max_workers: int = 2,
+                 job_timeout: float = 120.0, on_result: Optional[Callable[[ConversionJob], None]] = None):
+        if batch_size < 1 or max_workers < 1:
+            raise ValueError("batch_size 與 max_workers 必須大於 0")
+        self.musescore_path = musescore_path
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self.on_result = on_result
+        self._pending: List[ConversionJob] = []
+        self._lock = threading.Lock()
+
+    def submit(self, input_path: str, outputs: Sequence[str]) -> ConversionJob:
+        """
+        加入一個待轉換的檔案，run() 時才會執行。
+
+        Args:
+            input_path (str): 輸入檔路徑。
+            outputs (Sequence[str]): 輸出檔路徑，例如 ["song.mid", "song.mp3"]。
+
+        Returns:
+            ConversionJob: 可在 run() 之後查詢 status 的工作。
+        """
+        job = ConversionJob(input_path, outputs)
+        with self._lock:
+            self._pending.append(job)
+        return job
+
+    def run(self) -> List[ConversionJob]:
+        """
+        執行目前所有待轉換的工作。
+
+        Returns:
+            List[ConversionJob]: 依提交順序排列的工作。
+        """
+        with self._lock:
+            jobs, self._pending = self._pending, []
+        if not jobs:
+            return []
+        batches = [jobs[i:i + self.batch_size] for i in range(0, len(jobs), self.batch_size)]
+        with tracer.span("musescore_batch", jobs=len(jobs), batches=len(batches)):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(self._run_batch, batches))
+        return jobs
+
+    def _run_batch(self, batch: List[ConversionJob]):
+        for job in batch:
+            for output in job.outputs:
+                # 先移除舊檔，才能以檔案是否存在判斷這次是否成功
+                if os.path.exists(output):
+                    os.remove(output)
+
+        error = None
+        started = time.perf_counter()
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            json.dump([job.to_job_entry() for job in batch], f, ensure_ascii=False)
+            job_file = f.name
+        try:
+            with tracer.span("musescore", command=f"-j ({len(batch)} jobs)"):
+                subprocess.run([self.musescore_path, "-j", job_file], check=True, capture_output=True,
+                               text=True, timeout=self.job_timeout * len(batch))
+        except subprocess.TimeoutExpired:
+            error = f"逾時（{self.job_timeout * len(batch):.0f} 秒）"
+        except subprocess.CalledProcessError as e:
+            error = f"MuseScore 結束碼 {e.returncode}：{(e.stderr or '').strip()[-500:]}"
+        except OSError as e:
+            error = f"無法執行 MuseScore：{e}"
+        finally:
+            os.remove(job_file)
+
+        elapsed = time.perf_counter() - started
+        for job in batch:
+            missing = [p for p in job.outputs if not os.path.exists(p)]
+            job.elapsed = elapsed
+            if missing:
+                job.status = "error"
+                job.error = error or f"未產生輸出：{', '.join(missing)}"
+            else:
+                job.status = "ok"
+            if self.on_result:
+                self.on_result(job)
@@ -6,14 +6,36 @@ from pathlib import Path
 from music21 import stream, converter, instrument
 
 from src.instrument_configs import instrument_configs
+from src.music.compact import CompactPart
+from src.music.midi_writer import write_midi
+from src.music.musescore_jobs import MuseScoreBatchRunner
+from src.tracing import tracer
 
 __all__ = ["MusicPlayer"]
 
+# 已確認可執行的 MuseScore 路徑，同一行程內不重複啟動版本檢查
+_VERIFIED_MUSESCORE = set()
+
 class MusicPlayer:
-    def __init__(self, musescore_path=None):
+    def __init__(self, musescore_path=None, renderer=None, timeout=300, store=None):
+        """
+        Args:
+            musescore_path (str): MuseScore 執行檔路徑，只用於排版與未設定 renderer 時的音訊轉換。
+            renderer (FluidSynthRenderer): 音訊算繪後端；設定後 generate_mp3 不再需要 MuseScore。
+            timeout (float): 每次 MuseScore 轉換的逾時秒數。
+            store (ArtifactStore): 算繪結果存放區；設定後 generate_midi、generate_mp3 與 save
+                以內容雜湊快取輸出，返回存放區中的路徑，output_file 不再決定檔名。
+        """
         self.musescore_path = musescore_path or self._get_default_musescore_path()
+        self.renderer = renderer
+        self.timeout = timeout
+        self.store = store
+        # 樂器名稱 → 最近一次編碼的 MIDI 音軌，修改後只重新編碼有變更的聲部
+        self._track_cache = {}
         self.score = None
-        self._check_musescore()
+        self._score_drafts = None
+        # MuseScore 只用於排版與音訊，第一次需要時才檢查
+        self._musescore_checked = False
 
     def _get_default_musescore_path(self) -> str:
         """
@@ -57,12 +79,7 @@ class MusicPlayer:
                 )
             
             # 測試執行
-            result = subprocess.run(
-                [self.musescore_path, "--version"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            result = self._run_musescore(["--version"], capture_output=True, text=True, timeout=30)
             
             print(f"MuseScore 版本檢查成功：{result.stdout.strip()}")
             return True
@@ -75,50 +92,125 @@ class MusicPlayer:
         except Exception as e:
             raise RuntimeError(f"檢查 MuseScore 時發生未知錯誤：{str(e)}")
 
+    def _require_musescore(self):
+        """第一次需要 MuseScore 時檢查安裝，之後不再重複檢查"""
+        if not self._musescore_checked and self.musescore_path not in _VERIFIED_MUSESCORE:
+            self._check_musescore()
+            _VERIFIED_MUSESCORE.add(self.musescore_path)
+        self._musescore_checked = True
+
+    def _run_musescore(self, args, **kwargs) -> subprocess.CompletedProcess:
+        """執行 MuseScore 子行程（預設以 self.timeout 為逾時），並記錄為追蹤 span"""
+        kwargs.setdefault("timeout", self.timeout)
+        with tracer.span("musescore", command=" ".join(args)):
+            return subprocess.run([self.musescore_path, *args], check=True, **kwargs)
+
     def assign_instrument(self, part, inst_name):
         """
         根據樂器名稱為聲部分配音色。
-        :param part: stream.Part 物件
+        :param part: CompactPart 或 stream.Part 物件；CompactPart 在此才轉為 music21
         :param inst_name: 樂器名稱（例如 "piano", "violin"）
-        :return: 更新後的 part
+        :return: 更新後的 part（stream.Part）
         """
+        if isinstance(part, CompactPart):
+            part = part.to_music21()
         inst_map = {name: config["music21_instrument"] for name, config in instrument_configs.items()}
 
         selected_inst = inst_map.get(inst_name.lower(), instrument.Piano())  # 預設為鋼琴
         part.insert(0, selected_inst)  # 在聲部開頭插入樂器音色
         return part
 
-    def generate_midi(self, score_drafts, output_file="symphony"):
-        self.score = stream.Score()
+    def _build_score(self, score_drafts) -> stream.Score:
+        """將聲部轉為 music21 Score（MusicXML 匯出與播放時才需要）"""
+        score = stream.Score()
         for inst_name, part in score_drafts.items():
             # 為每個聲部分配音色
-            updated_part = self.assign_instrument(part, inst_name)
-            self.score.insert(0, updated_part)
+            score.insert(0, self.assign_instrument(part, inst_name))
+        return score
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            xml_file = f"{temp_dir}/{output_file}.musicxml"
-            self.score.write('musicxml', fp=xml_file)
-            print(f"已生成暫存 MusicXML 檔案：{xml_file}")
-            midi_file = f"{output_file}.mid"
-            try:
-                subprocess.run([self.musescore_path, "-o", midi_file, xml_file], check=True)
-                print(f"MIDI 檔案生成成功：{midi_file}")
-                return midi_file
-            except subprocess.CalledProcessError as e:
-                print(f"MIDI 檔案生成失敗：{str(e)}")
-                return None
+    def _cacheable(self, score_drafts) -> bool:
+        return self.store is not None and bool(score_drafts) \
+            and all(isinstance(part, CompactPart) for part in score_drafts.values())
+
+    def _from_store(self, score_drafts, audio_format, producer, **params):
+        """以聲部內容、格式與參數的雜湊取得或產生輸出"""
+        key = self.store.make_key(score_drafts, audio_format, **params)
+        with tracer.span("artifact_store", format=audio_format, key=key[:12]) as span:
+            hits = self.store.hits
+            path = self.store.get_or_create(key, audio_format, producer)
+            span.set_attribute("hit", self.store.hits > hits)
+        return path
+
+    def generate_midi(self, score_drafts, output_file="symphony", tempo=120):
+        """
+        將聲部直接寫成 type-1 MIDI 檔，不需要 MuseScore。
+
+        Args:
+            score_drafts (Dict): 樂器名稱對應的 CompactPart（或載入的 stream.Part）。
+            output_file (str): 輸出檔名（不含副檔名）；設定了 store 時不使用。
+            tempo (int): 每分鐘拍數，通常為 params["tempo"]。
+
+        Returns:
+            str: MIDI 檔路徑；失敗時為 None。
+        """
+        self.score = None
+        self._score_drafts = score_drafts
+        if self._cacheable(score_drafts):
+            return self._from_store(score_drafts, "mid",
+                                    lambda base: self._write_midi(score_drafts, base, tempo), tempo=tempo)
+        return self._write_midi(score_drafts, output_file, tempo)
+
+    def _write_midi(self, score_drafts, output_file, tempo):
+        midi_file = f"{output_file}.mid"
+        try:
+            with tracer.span("midi_export", parts=len(score_drafts)):
+                if all(isinstance(part, CompactPart) for part in score_drafts.values()):
+                    write_midi(score_drafts, midi_file, tempo=tempo, track_cache=self._track_cache)
+                else:
+                    self.score = self._build_score(score_drafts)
+                    self.score.write('midi', fp=midi_file)
+            print(f"MIDI 檔案生成成功：{midi_file}")
+            return midi_file
+        except (OSError, ValueError) as e:
+            print(f"MIDI 檔案生成失敗：{str(e)}")
+            return None
 
-    def generate_mp3(self, score_drafts=None, output_file="symphony", input_file=None):
+    def generate_mp3(self, score_drafts=None, output_file="symphony", input_file=None, tempo=120):
         """
         將樂譜或 MIDI 檔案轉換為 MP3，並為不同樂器分配音色。
+
+        設定了 renderer 時，CompactPart 聲部在行程池中以 FluidSynth 算繪，不需要 MuseScore；
+        否則經 MusicXML 交給 MuseScore 轉換。設定了 store 時相同內容只算繪一次。
         """
+        if score_drafts:
+            self.score = None
+            self._score_drafts = score_drafts
+        if self._cacheable(score_drafts):
+            if self.renderer is not None:
+                backend = f"fluidsynth:{self.renderer.soundfont}:{self.renderer.sample_rate}"
+            else:
+                backend = f"musescore:{self.musescore_path}"
+            return self._from_store(score_drafts, "mp3",
+                                    lambda base: self._write_mp3(score_drafts, base, None, tempo),
+                                    tempo=tempo, backend=backend)
+        return self._write_mp3(score_drafts, output_file, input_file, tempo)
+
+    def _write_mp3(self, score_drafts, output_file, input_file, tempo):
+        if self.renderer is not None and score_drafts \
+                and all(isinstance(part, CompactPart) for part in score_drafts.values()):
+            try:
+                mp3_file = self.renderer.render(score_drafts, output_file, tempo=tempo)
+                print(f"MP3 檔案生成成功：{mp3_file}")
+                return mp3_file
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+                print(f"MP3 檔案生成失敗：{str(e)}")
+                return None
+
+        self._require_musescore()
         with tempfile.TemporaryDirectory() as temp_dir:
             if score_drafts:
-                self.score = stream.Score()
-                for inst_name, part in score_drafts.items():
-                    updated_part = self.assign_instrument(part, inst_name)
-                    self.score.insert(0, updated_part)
-                xml_file = f"{temp_dir}/{output_file}.musicxml"
+                self.score = self._build_score(score_drafts)
+                xml_file = f"{temp_dir}/{os.path.basename(output_file)}.musicxml"
                 self.score.write('musicxml', fp=xml_file)
             elif input_file and os.path.exists(input_file):
                 xml_file = input_file
@@ -128,24 +220,77 @@ class MusicPlayer:
 
             mp3_file = f"{output_file}.mp3"
             try:
-                subprocess.run([self.musescore_path, "-o", mp3_file, xml_file], check=True)
+                self._run_musescore(["-o", mp3_file, xml_file])
                 print(f"MP3 檔案生成成功：{mp3_file}")
                 return mp3_file
-            except subprocess.CalledProcessError as e:
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
                 print(f"MP3 檔案生成失敗：{str(e)}")
                 return None
 
+    def export_batch(self, pieces, formats=("mid", "mp3"), output_dir=".", tempo=120,
+                     on_result=None, batch_size=20, max_workers=2):
+        """
+        批次匯出多首樂曲，MuseScore 以批次工作檔一次轉換多個檔案，而不是每個檔案啟動一次。
+
+        CompactPart 樂曲的 MIDI 直接以 midi_writer 寫出，其餘格式（mp3、pdf、png 等）
+        先寫成 MusicXML 再交給 MuseScoreBatchRunner。
+
+        Args:
+            pieces (Dict[str, Dict]): 樂曲名稱對應的 score_drafts。
+            formats (Sequence[str]): 輸出格式（副檔名）。
+            output_dir (str): 輸出目錄。
+            tempo (int): MIDI 的每分鐘拍數。
+            on_result (callable): 每個 MuseScore 工作完成時以 ConversionJob 呼叫。
+            batch_size (int): 每次啟動 MuseScore 處理的樂曲數上限。
+            max_workers (int): 同時執行的 MuseScore 行程數上限。
+
+        Returns:
+            Dict[str, List[str]]: 樂曲名稱對應成功產生的檔案。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        outputs = {name: [] for name in pieces}
+        runner = MuseScoreBatchRunner(self.musescore_path, batch_size=batch_size, max_workers=max_workers,
+                                      job_timeout=self.timeout, on_result=on_result)
+        jobs = {}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name, score_drafts in pieces.items():
+                remaining = list(formats)
+                base = os.path.join(output_dir, name)
+                if "mid" in remaining and all(isinstance(p, CompactPart) for p in score_drafts.values()):
+                    outputs[name].append(write_midi(score_drafts, f"{base}.mid", tempo=tempo))
+                    remaining.remove("mid")
+                if remaining:
+                    xml_file = os.path.join(temp_dir, f"{name}.musicxml")
+                    self._build_score(score_drafts).write('musicxml', fp=xml_file)
+                    jobs[name] = runner.submit(xml_file, [f"{base}.{fmt}" for fmt in remaining])
+            if jobs:
+                self._require_musescore()
+                runner.run()
+        for name, job in jobs.items():
+            if job.status == "ok":
+                outputs[name].extend(job.outputs)
+            else:
+                print(f"{name} 匯出失敗：{job.error}")
+        return outputs
+
     def load_file(self, file_path):
         try:
             self.score = converter.parse(file_path)
+            self._score_drafts = None
             print(f"已成功載入檔案：{file_path}")
             return True
         except Exception as e:
             print(f"載入檔案失敗：{str(e)}")
             return False
 
+    def _current_score(self):
+        """目前的 music21 Score；generate_midi 直接寫檔時，到播放或儲存才建立"""
+        if self.score is None and self._score_drafts:
+            self.score = self._build_score(self._score_drafts)
+        return self.score
+
     def play(self):
-        if self.score is None:
+        if self._current_score() is None:
             print("錯誤：尚未載入或生成樂譜。")
             return
         try:
@@ -159,10 +304,15 @@ class MusicPlayer:
             print("正在使用系統播放器播放音樂...")
 
     def save(self, output_file, format="midi"):
-        if self.score is None:
+        if self._current_score() is None:
             print("錯誤：尚未載入或生成樂譜。")
             return None
+        if self._cacheable(self._score_drafts):
+            return self._from_store(self._score_drafts, format, lambda base: self._write_score(base, format))
+        return self._write_score(output_file, format)
+
+    def _write_score(self, output_file, format):
         output_path = f"{output_file}.{format}"
-        self.score.write(format, fp=output_path)
+        self._current_score().write(format, fp=output_path)
         print(f"已儲存檔案：{output_path}")
         return output_path
@@ -1,17 +1,25 @@
-from src.music.model import PartData, RetryInput, ScoreData
+from src.music.model import PartData, PartPatch, RetryInput, ScoreData
+from src.llm.client import get_llm
+from src.music.compact import CompactPart, CompactPartBuilder
+from src.music.patch import PatchError, apply_patch, part_by_measure
+from src.music.pitches import key_to_fifths, pitch_to_midi
+from src.music.repair import PartRepairer
+from src.music.streaming import NoteStreamParser
+from src.tracing import traced, tracer
 
 
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from music21 import articulations, chord, clef, key, meter, note, pitch, stream
+from music21 import articulations, chord, meter, note
 from rich.console import Console
 from rich.panel import Panel
 
 
 import json
+import time
 import traceback
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 console = Console()
 
@@ -22,39 +30,206 @@ class MusicianAgent:
                  techniques: List[str], pitch_range: Tuple[str, str], 
                  api_provider: str = "gemini", api_key: str = None,
                  temperature: float = 0.6, top_p: float = 0.9, 
-                 max_retries: int = 3):     
+                 max_retries: int = 3, llm_cache=None, time_signature: str = "4/4", key: str = "C major"):     
         
         self.api_provider = api_provider
         self.api_key = api_key
         self.temperature = temperature
         self.top_p = top_p
         
-        # 初始化選擇的 LLM
-        if api_provider == "gemini":
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash", 
-                temperature=self.temperature, top_p=self.top_p, api_key=api_key)
-        elif api_provider == "openai":
-            if not api_key:
-                
-                raise ValueError("OpenAI 需要提供 API 金鑰")
-            from langchain_openai import ChatOpenAI
-            self.llm = ChatOpenAI(api_key=api_key, top_p=self.top_p , temperature=self.temperature)
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2)
+        # 從共用的客戶端註冊表取得 LLM，尊重各代理設定的提供者
+        self.llm = get_llm(api_provider, api_key=api_key, temperature=self.temperature, top_p=self.top_p,
+                           cache=llm_cache)
         self.role = role
         self.instrument_name = instrument_name
         self.default_clef = default_clef
         self.techniques = techniques
         self.pitch_range = pitch_range  # (最低音高, 最高音高)
+        self.midi_range = (pitch_to_midi(pitch_range[0]), pitch_to_midi(pitch_range[1]))  # 音域的 MIDI 編號
         self.part = None
+        # 建立聲部時使用的拍號與調號；每次生成或修改時依全域參數更新
+        self.time_signature = time_signature
+        self.key_fifths = key_to_fifths(key)
         self.max_retries = max_retries
-
-    def generate_score(self, global_params: Dict, instruction: Dict) -> 'stream.Part':
-        """生成樂譜，具體實現由子類提供"""
+        # 在 LLM 重試前先於本地修正拼法、音域、時值與技巧
+        self.repairer = PartRepairer(pitch_range, techniques, default_clef, instrument_name)
+        # 最近一次 stream_score 的首個音符/首個小節時間（秒）與音符數
+        self.stream_metrics = {}
+
+    def use_params(self, global_params: Dict):
+        """以全域參數的拍號與調號建立之後的聲部（CompactPart 的 time_signature 與 key_fifths）"""
+        self.time_signature = global_params.get("time_signature", self.time_signature)
+        if global_params.get("key"):
+            self.key_fifths = key_to_fifths(global_params["key"])
+
+    def _score_prompt(self) -> ChatPromptTemplate:
+        """樂譜生成的提示模板，具體實現由子類提供"""
         raise NotImplementedError
 
-    def revise_score(self, global_params: Dict, feedback: Dict, part: 'stream.Part') -> 'stream.Part':
-        """根據指揮家反饋修改樂譜"""
+    def _score_inputs(self, global_params: Dict, instruction: Dict) -> Dict:
+        """組合樂譜生成提示所需的參數，子類可覆寫以加入額外欄位"""
+        return {
+            "role": self.role,
+            "style": global_params["style"],
+            "tempo": global_params["tempo"],
+            "key": global_params["key"],
+            "time_signature": global_params["time_signature"],
+            "instruction": json.dumps(instruction, ensure_ascii=False)
+        }
+
+    def _score_chain(self):
+        """建立 prompt | llm | parser 的樂譜生成鏈"""
+        parser = JsonOutputParser(pydantic_object=PartData)
+        return self._score_prompt() | self.llm | parser
+
+    def generate_score(self, global_params: Dict, instruction: Dict) -> 'CompactPart':
+        """生成樂譜"""
+        self.use_params(global_params)
+        with tracer.span("generate_score", instrument=self.instrument_name.lower()):
+            response = self._score_chain().invoke(self._score_inputs(global_params, instruction))
+            self.part = self._parse_score(response)
+        return self.part
+
+    async def agenerate_score(self, global_params: Dict, instruction: Dict) -> 'CompactPart':
+        """非同步生成樂譜，供指揮家同時發出多個聲部的請求"""
+        self.use_params(global_params)
+        with tracer.span("generate_score", instrument=self.instrument_name.lower()):
+            response = await self._score_chain().ainvoke(self._score_inputs(global_params, instruction))
+            self.part = await self._aparse_score(response)
+        return self.part
+
+    def stream_score(self, global_params: Dict, instruction: Dict,
+                     on_note: Optional[Callable] = None) -> 'CompactPart':
+        """
+        以串流方式生成樂譜：LLM 仍在輸出時就逐一驗證音符並加入聲部。
+
+        Args:
+            global_params (Dict): 全域參數。
+            instruction (Dict): 聲部指令。
+            on_note (Optional[Callable]): 每加入一個音符就以 (builder, note_data) 呼叫，供進度或預覽使用部分樂譜
+                （builder 為目前的 CompactPartBuilder，可用 build() 取得部分聲部）。
+
+        Returns:
+            CompactPart: 完整的樂譜；串流中有音符驗證失敗時改走 _parse_score 的重試流程。
+        """
+        self.use_params(global_params)
+        with tracer.span("generate_score", instrument=self.instrument_name.lower(), streaming=True) as span:
+            session = _ScoreStream(self, on_note)
+            chain = self._score_prompt() | self.llm
+            for chunk in chain.stream(self._score_inputs(global_params, instruction)):
+                session.feed(chunk)
+            part, response = session.finish(span)
+            self.part = part if part is not None else self._parse_score(response)
+        return self.part
+
+    async def astream_score(self, global_params: Dict, instruction: Dict,
+                            on_note: Optional[Callable] = None) -> 'CompactPart':
+        """stream_score 的非同步版本"""
+        self.use_params(global_params)
+        with tracer.span("generate_score", instrument=self.instrument_name.lower(), streaming=True) as span:
+            session = _ScoreStream(self, on_note)
+            chain = self._score_prompt() | self.llm
+            async for chunk in chain.astream(self._score_inputs(global_params, instruction)):
+                session.feed(chunk)
+            part, response = session.finish(span)
+            self.part = part if part is not None else await self._aparse_score(response)
+        return self.part
+
+    def revise_score(self, global_params: Dict, feedback: Dict, part: 'CompactPart',
+                     use_patch: bool = True) -> 'CompactPart':
+        """
+        根據指揮家反饋修改樂譜。
+
+        預設請 LLM 只回傳要修改的小節範圍（取代或移調），在本地套用並驗證，
+        輸出 token 與修改範圍成正比；修改指令無效時改為重寫整個聲部。
+
+        Args:
+            global_params (Dict): 全域參數。
+            feedback (Dict): {"target", "message"}。
+            part (CompactPart): 目前的聲部。
+            use_patch (bool): 為 False 時直接重寫整個聲部。
+        """
+        self.use_params(global_params)
+        if use_patch and isinstance(part, CompactPart) and len(part):
+            try:
+                self.part = self._revise_with_patch(feedback, part)
+                return self.part
+            except ValueError as e:
+                console.print(f"[yellow]{self.instrument_name} 的修改指令無法套用，改為重寫整個聲部：{e}[/yellow]")
+        return self._revise_full(feedback, part)
+
+    def _revise_with_patch(self, feedback: Dict, part: CompactPart) -> CompactPart:
+        """請 LLM 回傳小節範圍的修改指令並在本地套用"""
+        prompt = ChatPromptTemplate.from_template("""
+        根據指揮家反饋，以小節為單位修改樂譜，只回傳需要修改的部分：
+        
+        [原始樂譜]（拍號：{time_signature}，每小節 {bar_length} 拍，共 {measure_count} 小節；
+        "measures" 依小節編號列出在該小節開始的音符）
+        {score}
+        
+        [反饋意見]
+        {feedback}
+        
+        [輸出要求]
+        請返回一個 JSON 格式的修改指令，符合以下結構：
+        {{
+            "patches": [
+                {{"op": "replace", "start_measure": 3, "end_measure": 4,
+                  "notes": [{{"pitch": "C4", "duration": 1.0, "technique": "{technique}"}}, ...]}},
+                {{"op": "transpose", "start_measure": 5, "end_measure": 5, "semitones": -12}}
+            ]
+        }}
+        
+        [格式規則]
+        - replace：notes 取代 start_measure 到 end_measure（含）的所有內容，總時值必須剛好等於這些小節的長度
+        - transpose：將範圍內的音移調 semitones 個半音（負數為向下）
+        - 小節編號從 1 開始，各修改範圍不可重疊，未列出的小節保持不變
+        - pitch 使用 MIDI 音高表示法，音域為 {min_pitch} 到 {max_pitch}
+        - duration 以四分音符為單位（1.0 = 四分音符，2.0 = 二分音符，4.0 = 全音符）
+        - technique 可為 {techniques}
+        - 只返回純 JSON，不要包含其他文字或註釋
+        """)
+        parser = JsonOutputParser(pydantic_object=PartPatch)
+        chain = prompt | self.llm | parser
+        score = {"instrument": self.instrument_name, "time_signature": part.time_signature,
+                 "measures": part_by_measure(part)}
+        input_data = {
+            "score": json.dumps(score, ensure_ascii=False),
+            "feedback": feedback['message'],
+            "time_signature": part.time_signature,
+            "bar_length": f"{part.bar_length:g}",
+            "measure_count": part.measure_count,
+            "technique": self.techniques[0],
+            "min_pitch": self.pitch_range[0],
+            "max_pitch": self.pitch_range[1],
+            "techniques": ", ".join(self.techniques),
+        }
+
+        with tracer.span("revise_score", instrument=self.instrument_name.lower(), mode="patch") as span:
+            # 只有回應無法解析時才改為重寫；連線、速率限制與 token 預算等錯誤直接拋出，不再多發一次請求
+            try:
+                response = chain.invoke(input_data)
+            except (OutputParserException, json.JSONDecodeError) as e:
+                raise PatchError(f"LLM 回傳的修改指令無效：{e}") from e
+            revised = apply_patch(part, self._repair_patch(response), lambda: self._new_builder(part.clef),
+                                  self.midi_range)
+            span.set_attribute("patches", len(response["patches"]))
+        return revised
+
+    def _repair_patch(self, response) -> Dict:
+        """以與 _parse_score 相同的 PartRepairer 修正 replace 指令中的音符（拼法、音域摺回、時值寫法）"""
+        if not isinstance(response, dict) or not isinstance(response.get("patches"), list):
+            return response
+        patches = []
+        for item in response["patches"]:
+            if isinstance(item, dict) and item.get("op") == "replace" and isinstance(item.get("notes"), list):
+                repaired = [self.repairer.repair_note(note_data)[0] for note_data in item["notes"]]
+                item = dict(item, notes=[note_data for note_data in repaired if note_data is not None])
+            patches.append(item)
+        return dict(response, patches=patches)
+
+    def _revise_full(self, feedback: Dict, part) -> 'CompactPart':
+        """請 LLM 重寫整個聲部"""
         # 定義提示詞
         prompt = ChatPromptTemplate.from_template("""
         根據指揮家反饋修改樂譜：
@@ -101,26 +276,29 @@ class MusicianAgent:
         }
 
         # 調用 LLM 並解析結果
-        try:
-            response = chain.invoke(input_data)
-            # console.print("[bold cyan]LLM 回傳的 JSON:[/bold cyan]")
-            # console.print(response)
-        except Exception as e:
-            console.print(f"[red]解析錯誤：{str(e)}[/red]")
-            raise ValueError("LLM 回傳的 JSON 無效，無法生成樂譜")
-
-        # 將 JSON 轉換為 Part 對象
-        self.part = self._json_to_part(response)
+        with tracer.span("revise_score", instrument=self.instrument_name.lower(), mode="full"):
+            try:
+                response = chain.invoke(input_data)
+                # console.print("[bold cyan]LLM 回傳的 JSON:[/bold cyan]")
+                # console.print(response)
+            except Exception as e:
+                console.print(f"[red]解析錯誤：{str(e)}[/red]")
+                raise ValueError("LLM 回傳的 JSON 無效，無法生成樂譜")
+
+            # 與生成時相同，先在本地修正再轉換為 CompactPart
+            self.part = self._json_to_part(self._repair(response))
         if self.part is None:
-            console.print("[red]錯誤：_json_to_part 返回 None，無法生成有效 Part 對象[/red]")
+            console.print("[red]錯誤：_json_to_part 返回 None，無法生成有效聲部[/red]")
             raise ValueError("無法根據 LLM 回傳生成樂譜")
 
         return self.part
 
-    def _part_to_json(self, part: 'stream.Part') -> Dict:
-        """將 music21 Part 轉換為 JSON"""
+    def _part_to_json(self, part) -> Dict:
+        """將 CompactPart（或載入的 music21 Part）轉換為 JSON"""
+        if isinstance(part, CompactPart):
+            return dict(part.to_json(), instrument=self.instrument_name)
         notes_data = []
-        for element in part.flat.notesAndRests:
+        for element in part.flatten().notesAndRests:
             if isinstance(element, note.Note):
                 technique = self._get_technique(element)
                 notes_data.append({
@@ -152,83 +330,80 @@ class MusicianAgent:
             # 可根據需要擴展其他技巧的判斷邏輯
         return self.techniques[0]  # 預設使用第一個技巧
 
-    def _json_to_part(self, data: Dict) -> 'stream.Part':
-        """將 JSON 轉換為 music21 Part"""
-        part = stream.Part()
-        part.insert(0, meter.TimeSignature("4/4"))  # 預設拍號
-        part.insert(0, key.KeySignature(0))  # 預設 C 大調
-
-
-        # 設置譜號
-        if data["clef"].lower() == "bass":
-            part.insert(0, clef.BassClef())
-        elif data["clef"].lower() == "alto":
-            part.insert(0, clef.AltoClef())
-        elif data["clef"].lower() == "treble":
-            part.insert(0, clef.TrebleClef())
-        else:
-            part.insert(0, clef.TrebleClef())  # 預設高音譜號
+    @traced("json_to_part")
+    def _json_to_part(self, data: Dict) -> 'CompactPart':
+        """將 JSON 轉換為 CompactPart；music21 物件要到匯出時才建立"""
+        builder = self._new_builder(data["clef"])
 
         # 添加音符並檢查音域
-        min_pitch = pitch.Pitch(self.pitch_range[0])
-        max_pitch = pitch.Pitch(self.pitch_range[1])
         for note_data in data["notes"]:
-            if note_data["pitch"] == "rest":
-                part.append(note.Rest(quarterLength=note_data["duration"]))
-            elif " " in note_data["pitch"]:
-                pitches = note_data["pitch"].split()
-                if all(min_pitch <= pitch.Pitch(p) <= max_pitch for p in pitches):
-                    ch = chord.Chord(pitches, quarterLength=note_data["duration"])
-                    if note_data["technique"] in self.techniques:
-                        self._apply_technique(ch, note_data["technique"])
-                    part.append(ch)
-                else:
-                    print(f"警告：和弦 {pitches} 超出 {self.instrument_name} 的音域 {self.pitch_range}")
+            builder.append(note_data)
+        for message in builder.skipped:
+            console.print(f"[yellow]警告：{message}[/yellow]")
+        return builder.build()
+
+    def _new_builder(self, clef_name: str) -> CompactPartBuilder:
+        """建立此樂器的 CompactPartBuilder，拍號與調號取自 use_params 設定的全域參數"""
+        return CompactPartBuilder(self.techniques, clef_name.lower(), self.instrument_name, self.pitch_range,
+                                  time_signature=self.time_signature, midi_range=self.midi_range,
+                                  key_fifths=self.key_fifths)
+
+    def _parse_score(self, response: dict, retries: int = 0) -> 'CompactPart':
+        """解析並驗證生成的樂譜；先在本地修正，只有結構無法使用時才請 LLM 重新生成"""
+        try:
+            return self._json_to_part(self._repair(response))
+        except Exception as e:
+            error_message = str(e)
+            self._report_parse_error(response, error_message)
+
+            if retries < self.max_retries:
+                Console().print(f"[yellow]重試第 {retries + 1} 次...[/yellow]")
+                with tracer.span("retry", retry=retries + 1, error=error_message):
+                    revised_response = self._retry_generate(response, error_message)
+                    return self._parse_score(revised_response, retries + 1)
             else:
-                p = pitch.Pitch(note_data["pitch"])
-                if min_pitch <= p <= max_pitch:
-                    n = note.Note(note_data["pitch"], quarterLength=note_data["duration"])
-                    if note_data["technique"] in self.techniques:
-                        self._apply_technique(n, note_data["technique"])
-                    part.append(n)
-                else:
-                    print(f"警告：音高 {note_data['pitch']} 超出 {self.instrument_name} 的音域 {self.pitch_range}")
-        return part
-
-    def _apply_technique(self, element, technique: str):
-        """根據演奏技巧應用相應的標記"""
-        if technique == "pizz" and "pizz" in self.techniques:
-            element.articulations.append(articulations.Pizzicato())
-        # 可根據需要擴展其他技巧的應用，例如 "slur", "roll" 等
-
-    def _parse_score(self, response: dict, retries: int = 0) -> 'stream.Part':
-        """解析並驗證生成的樂譜"""
-        console = Console()
+                raise RuntimeError(f"達到最大重試次數 {self.max_retries}，無法生成有效的樂譜。")
+
+    async def _aparse_score(self, response: dict, retries: int = 0) -> 'CompactPart':
+        """_parse_score 的非同步版本，重試時不阻塞事件迴圈"""
         try:
-            return self._json_to_part(response)
+            return self._json_to_part(self._repair(response))
         except Exception as e:
             error_message = str(e)
-            # 取得完整的 traceback 資訊
-            tb_info = traceback.format_exc()
-            # 使用 Rich Panel 輸出錯誤資訊與 traceback，讓錯誤追蹤更加美觀
-            console.print(
-                Panel(
-                    f"[bold red]解析樂譜失敗[/bold red]：{error_message}\n\n[dim]{tb_info}[/dim]",
-                    title="[red]錯誤追蹤[/red]",
-                    border_style="red"
-                )
-            )
-            console.print(Panel(f"[cyan]Response Data:[/cyan]\n{response}", title="📜 Response", border_style="blue"))
+            self._report_parse_error(response, error_message)
 
             if retries < self.max_retries:
-                console.print(f"[yellow]重試第 {retries + 1} 次...[/yellow]")
-                revised_response = self._retry_generate(response, error_message)
-                return self._parse_score(revised_response, retries + 1)
+                Console().print(f"[yellow]重試第 {retries + 1} 次...[/yellow]")
+                with tracer.span("retry", retry=retries + 1, error=error_message):
+                    revised_response = await self._aretry_generate(response, error_message)
+                    return await self._aparse_score(revised_response, retries + 1)
             else:
                 raise RuntimeError(f"達到最大重試次數 {self.max_retries}，無法生成有效的樂譜。")
 
+    def _repair(self, response) -> Dict:
+        """以 PartRepairer 修正回應並記錄修正數量；無法修復時拋出 UnrepairableScore"""
+        repaired, fixes = self.repairer.repair(response)
+        if fixes:
+            tracer.current().set_attribute("repairs", len(fixes))
+            console.print(f"[dim]{self.instrument_name}：本地修正 {len(fixes)} 處（{fixes[0]}{' …' if len(fixes) > 1 else ''}）[/dim]")
+        return repaired
 
-    def _retry_generate(self, original_data: Dict, error_message: str) -> Dict:
+    def _report_parse_error(self, response: dict, error_message: str):
+        """使用 Rich Panel 輸出錯誤資訊與 traceback，讓錯誤追蹤更加美觀"""
+        console = Console()
+        # 取得完整的 traceback 資訊
+        tb_info = traceback.format_exc()
+        console.print(
+            Panel(
+                f"[bold red]解析樂譜失敗[/bold red]：{error_message}\n\n[dim]{tb_info}[/dim]",
+                title="[red]錯誤追蹤[/red]",
+                border_style="red"
+            )
+        )
+        console.print(Panel(f"[cyan]Response Data:[/cyan]\n{response}", title="📜 Response", border_style="blue"))
+
+    def _retry_request(self, original_data: Dict, error_message: str):
+        """建立重試用的鏈與輸入參數"""
         # 使用 Pydantic 驗證輸入數據
         retry_input = RetryInput(
             error_message=error_message,
@@ -265,8 +440,7 @@ class MusicianAgent:
         parser = JsonOutputParser(pydantic_object=PartData)
         chain = retry_prompt | self.llm | parser
 
-        # 傳遞參數並執行重試生成
-        response = chain.invoke({
+        inputs = {
             "error_message": retry_input.error_message,
             "original_data": json.dumps(retry_input.original_data, ensure_ascii=False),
             "clef": self.default_clef,
@@ -275,7 +449,93 @@ class MusicianAgent:
             "min_pitch": self.pitch_range[0],
             "max_pitch": self.pitch_range[1],
             "techniques": ", ".join(self.techniques)
-        })
+        }
+        return chain, inputs
 
+    def _retry_generate(self, original_data: Dict, error_message: str) -> Dict:
+        chain, inputs = self._retry_request(original_data, error_message)
         # 返回驗證後的結果
-        return response
\ No newline at end of file
+        return chain.invoke(inputs)
+
+    async def _aretry_generate(self, original_data: Dict, error_message: str) -> Dict:
+        chain, inputs = self._retry_request(original_data, error_message)
+        return await chain.ainvoke(inputs)
+
+
+class _ScoreStream:
+    """
+    stream_score 的單次串流狀態：解析音符、加入 CompactPartBuilder，並記錄首個音符與首個小節完成的時間。
+    """
+
+    def __init__(self, agent: MusicianAgent, on_note: Optional[Callable]):
+        self.agent = agent
+        self.on_note = on_note
+        self.parser = NoteStreamParser()
+        self.builder = agent._new_builder(agent.default_clef)
+        self.bar_length = meter.TimeSignature(self.builder.time_signature).barDuration.quarterLength
+        self.error = None
+        # 無法修正或超出音域而未加入的音符數；有任何略過時改走 _parse_score，與非串流的修正結果一致
+        self.dropped = 0
+        self.started = time.perf_counter()
+        self.first_note = None
+        self.first_measure = None
+
+    def feed(self, chunk):
+        content = chunk.content
+        if not isinstance(content, str):
+            content = "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+        for note_data in self.parser.feed(content):
+            if self.error is not None:
+                continue
+            try:
+                note_data, _ = self.agent.repairer.repair_note(note_data)
+                if note_data is None:
+                    self.dropped += 1
+                    continue
+                index = self.builder.append(note_data)
+            except Exception as e:
+                # 之後交由完整回應的 _parse_score 處理（包含重試）
+                self.error = e
+                continue
+            if index is None:
+                self.dropped += 1
+                continue
+            now = time.perf_counter() - self.started
+            if self.first_note is None:
+                self.first_note = now
+            if self.first_measure is None and self.builder.onset >= self.bar_length:
+                self.first_measure = now
+            if self.on_note:
+                self.on_note(self.builder, note_data)
+
+    def finish(self, span) -> Tuple[Optional['CompactPart'], Dict]:
+        """
+        解析完整回應並決定是否採用串流組裝的聲部。
+
+        串流組裝的聲部只有在回應完整、每個音符都已加入且至少有一個音符時才採用；
+        其餘情況（JSON 無效、空聲部、略過音符）交由 _parse_score 以與非串流相同的方式修正或重試。
+
+        Returns:
+            Tuple[Optional[CompactPart], Dict]: 可直接使用的聲部（需重新解析時為 None）與完整回應；
+                JSON 無效時回應為 {"raw": 原始文字}，讓 _parse_score 以 UnrepairableScore 進入重試。
+        """
+        try:
+            response = self.parser.close()
+        except OutputParserException:
+            response = {"raw": self.parser.text}
+        metrics = {
+            "time_to_first_note": self.first_note,
+            "time_to_first_measure": self.first_measure,
+            "notes": self.parser.count,
+        }
+        self.agent.stream_metrics = metrics
+        span.set_attributes(**metrics)
+
+        notes = response.get("notes") if isinstance(response, dict) else None
+        if self.error is not None or self.parser.broken or not isinstance(notes, list) \
+                or len(notes) != self.parser.count or self.dropped or not len(self.builder):
+            return None, response
+        clef_name = response.get("clef")
+        if isinstance(clef_name, str) and clef_name.lower() in ("treble", "bass", "alto"):
+            self.builder.clef = clef_name.lower()
+        return self.builder.build(), response
@@ -0,0 +1,126 @@
+# 標準函式庫
+from typing import Callable, Dict, List, Tuple
+
+# 數值計算
+import numpy as np
+
+from src.music.compact import REST, CompactPart, CompactPartBuilder
+
+__all__ = ["PatchError", "apply_patch", "part_by_measure"]
+
+PATCH_OPS = ("replace", "transpose")
+
+# 移調幅度上限（半音），超過時多半是 LLM 誤把音高當成半音數
+MAX_TRANSPOSE = 24
+
+
+class PatchError(ValueError):
+    """修改指令無法套用到聲部"""
+
+
+def part_by_measure(part: CompactPart) -> Dict[str, List[Dict]]:
+    """
+    將聲部依起始小節分組為 JSON，讓 LLM 能以小節編號指定修改範圍。
+
+    跨小節線的音歸在開始的小節，時值保持不變。
+
+    Returns:
+        Dict[str, List[Dict]]: 小節編號（從 "1" 起）對應該小節開始的音符。
+    """
+    notes = part.to_json()["notes"]
+    measures = (part.notes["onset"] // part.bar_length).astype(int) + 1
+    grouped = {str(m): [] for m in range(1, part.measure_count + 1)}
+    for number, note_data in zip(measures.tolist(), notes):
+        grouped[str(number)].append(note_data)
+    return grouped
+
+
+def _span(patch: Dict, measure_count: int) -> Tuple[int, int]:
+    try:
+        first, last = int(patch["start_measure"]), int(patch["end_measure"])
+    except (KeyError, TypeError, ValueError):
+        raise PatchError(f"缺少或無效的小節範圍：{patch}")
+    if not 1 <= first <= last <= measure_count:
+        raise PatchError(f"小節範圍 {first}–{last} 超出聲部的 1–{measure_count} 小節")
+    return first, last
+
+
+def apply_patch(part: CompactPart, patch: Dict, new_builder: Callable[[], CompactPartBuilder],
+                midi_range: Tuple[int, int]) -> CompactPart:
+    """
+    在本地將修改指令套用到聲部並驗證，不需要 LLM 重寫整個聲部。
+
+    支援的指令：
+    - replace：以 notes 取代 start_measure 到 end_measure 的內容；總時值必須剛好等於範圍的長度。
+    - transpose：將範圍內的音移調 semitones 個半音，移調後必須仍在音域內。
+
+    Args:
+        part (CompactPart): 原聲部。
+        patch (Dict): {"patches": [{"op", "start_measure", "end_measure", "notes" | "semitones"}, ...]}。
+        new_builder (Callable[[], CompactPartBuilder]): 建立與原聲部相同樂器設定的 builder，用於解析取代的音符。
+        midi_range (Tuple[int, int]): 樂器音域的 MIDI 編號。
+
+    Returns:
+        CompactPart: 修改後的新聲部，長度與小節數不變。
+
+    Raises:
+        PatchError: 指令格式錯誤、範圍重疊或超出聲部、音高無法解析或超出音域、取代內容的總時值與範圍不符，
+            或移調後超出音域時。
+    """
+    patches = patch.get("patches") if isinstance(patch, dict) else None
+    if not patches:
+        raise PatchError("修改指令中沒有 patches")
+
+    measure_count = part.measure_count
+    spans = []
+    for item in patches:
+        if not isinstance(item, dict) or item.get("op") not in PATCH_OPS:
+            raise PatchError(f"未知的修改指令：{item}")
+        spans.append(_span(item, measure_count))
+    ordered = sorted(zip(spans, patches), key=lambda entry: entry[0])
+    for ((_, previous_last), _), ((first, _), _) in zip(ordered, ordered[1:]):
+        if first <= previous_last:
+            raise PatchError(f"修改範圍重疊：第 {first} 小節")
+
+    bar = part.bar_length
+    low, high = midi_range
+    result = part
+    for (first, last), item in ordered:
+        start, end = (first - 1) * bar, last * bar
+        if item["op"] == "replace":
+            builder = new_builder()
+            for note_data in item.get("notes") or []:
+                try:
+                    index = builder.append(note_data)
+                except Exception as e:
+                    raise PatchError(f"第 {first}–{last} 小節的音符無法解析：{e}") from e
+                # 不能默默略過音符再以休止符補足，否則修改「成功」卻刪掉了內容
+                if index is None:
+                    raise PatchError(f"第 {first}–{last} 小節的音符 {note_data.get('pitch')} 超出音域")
+            replacement = builder.build()
+            if not len(replacement):
+                raise PatchError(f"第 {first}–{last} 小節的取代內容沒有音符")
+            if abs(replacement.quarter_length - (end - start)) > 1e-6:
+                raise PatchError(f"第 {first}–{last} 小節的取代內容共 {replacement.quarter_length:g} 拍，"
+                                 f"應為 {end - start:g} 拍")
+            result = result.replace_span(start, end, replacement)
+            continue
+
+        semitones = item.get("semitones")
+        if not isinstance(semitones, int) or semitones == 0 or abs(semitones) > MAX_TRANSPOSE:
+            raise PatchError(f"第 {first}–{last} 小節的移調幅度無效：{semitones}")
+        moved = result.slice(start, end).transpose(semitones)
+        sounding = moved.notes["pitch"] != REST
+        pitches = np.concatenate([moved.notes["pitch"][sounding & (moved.notes["chord"] < 0)],
+                                  moved.chord_pitches[_chord_members(moved)]])
+        if len(pitches) and (pitches.min() < low or pitches.max() > high):
+            raise PatchError(f"第 {first}–{last} 小節移調 {semitones:+d} 個半音後超出音域")
+        result = result.replace_span(start, end, moved)
+    return result
+
+
+def _chord_members(part: CompactPart) -> np.ndarray:
+    """聲部中實際使用的和弦音在 chord_pitches 中的索引"""
+    chords = part.notes["chord"][part.notes["chord"] >= 0]
+    spans = [np.arange(part.chord_offsets[c], part.chord_offsets[c + 1]) for c in chords]
+    return np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,111 @@
+# 標準函式庫
+import functools
+import re
+from typing import Dict
+
+# 音樂相關
+from music21 import pitch
+
+__all__ = ["PITCH_TABLE", "LOWEST_MIDI", "HIGHEST_MIDI", "pitch_to_midi", "midi_to_name", "key_to_fifths"]
+
+# 鋼琴音域 A0–C8，涵蓋所有樂器設定的音域
+LOWEST_MIDI = 21
+HIGHEST_MIDI = 108
+
+_STEP_OFFSETS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+# 同一升降的不同寫法：music21 以 '-' 表示降記號，LLM 常用 'b'、'♭'
+_ACCIDENTALS = {
+    "": 0,
+    "#": 1, "♯": 1, "##": 2, "x": 2, "♯♯": 2,
+    "-": -1, "b": -1, "♭": -1, "--": -2, "bb": -2, "♭♭": -2,
+}
+_NAMES = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "G#", "A", "B-", "B"]
+# 有調號時黑鍵依調號的方向拼寫：降號調用降記號、升號調用升記號
+_FLAT_NAMES = ["C", "D-", "D", "E-", "E", "F", "G-", "G", "A-", "A", "B-", "B"]
+_SHARP_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+def _build_table() -> Dict[str, int]:
+    table = {}
+    for step, offset in _STEP_OFFSETS.items():
+        for accidental, alter in _ACCIDENTALS.items():
+            for octave in range(-1, 10):
+                midi = (octave + 1) * 12 + offset + alter
+                if LOWEST_MIDI <= midi <= HIGHEST_MIDI:
+                    table[f"{step}{accidental}{octave}"] = midi
+                    table[f"{step.lower()}{accidental}{octave}"] = midi
+    return table
+
+
+# 全程共用的音名 → MIDI 編號表，例如 "Bb4"、"B-4"、"A#4" 都對應 70
+PITCH_TABLE = _build_table()
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_uncommon(name: str) -> int:
+    """表外的音名（A0–C8 以外或少見寫法）交給 music21 解析，結果同樣快取"""
+    return pitch.Pitch(name).midi
+
+
+def pitch_to_midi(name: str) -> int:
+    """
+    將音名轉為 MIDI 編號。
+
+    Args:
+        name (str): 音名，例如 'C4'、'Bb3'、'B-3'。
+
+    Returns:
+        int: MIDI 編號。
+
+    Raises:
+        music21.pitch.PitchException: 音名無法解析時。
+    """
+    midi = PITCH_TABLE.get(name)
+    return midi if midi is not None else _parse_uncommon(name)
+
+
+def midi_to_name(midi: int, fifths: int = 0) -> str:
+    """
+    將 MIDI 編號轉為音名。
+
+    Args:
+        midi (int): MIDI 編號。
+        fifths (int): 調號的升降記號數（key_to_fifths 的結果）；降號調的黑鍵拼為降記號（例如 B-），
+            升號調拼為升記號（例如 A#），0 時與 music21 的預設拼法相同。
+
+    Returns:
+        str: music21 寫法的音名，例如 'B-4'。
+    """
+    names = _FLAT_NAMES if fifths < 0 else _SHARP_NAMES if fifths > 0 else _NAMES
+    return f"{names[midi % 12]}{midi // 12 - 1}"
+
+
+# 五度圈上各音名相對 C 的位置：每個升記號 +7，降記號 -7
+_STEP_FIFTHS = {"F": -1, "C": 0, "G": 1, "D": 2, "A": 3, "E": 4, "B": 5}
+_MINOR_WORDS = ("minor", "min", "小調")
+# 中文調名的升降寫在主音前，例如「降B大調」「升F小調」
+_KEY_PATTERN = re.compile(r"^\s*(降|升)?([A-Ga-g])([#♯x\-b♭]*)\s*(.*?)\s*$")
+
+
+@functools.lru_cache(maxsize=64)
+def key_to_fifths(name: str) -> int:
+    """
+    將調名轉為調號的升降記號數（升為正、降為負）。
+
+    Args:
+        name (str): 調名，例如 'C major'、'A minor'、'Bb major'、'f# minor'、'降B大調'；只寫主音時小寫視為小調。
+
+    Returns:
+        int: 升降記號數，例如 'D major' 為 2、'C minor' 為 -3。
+
+    Raises:
+        ValueError: 調名無法解析時。
+    """
+    match = _KEY_PATTERN.match(name)
+    if match is None or match.group(3) not in _ACCIDENTALS or (match.group(1) and match.group(3)):
+        raise ValueError(f"無法解析的調名：{name}")
+    prefix, step, accidental, mode = match.group(1), match.group(2), match.group(3), match.group(4).lower()
+    accidental = accidental or {"降": "-", "升": "#"}.get(prefix, "")
+    minor = any(word in mode for word in _MINOR_WORDS) if mode else step.islower()
+    fifths = _STEP_FIFTHS[step.upper()] + 7 * _ACCIDENTALS[accidental]
+    return fifths - 3 if minor else fifths
@@ -0,0 +1,260 @@
+# 標準函式庫
+import os
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+# 數值計算
+import numpy as np
+
+from src.instrument_configs import instrument_configs
+from src.music.compact import REST, CompactPart
+from src.tracing import tracer
+
+__all__ = ["FluidSynthRenderer", "find_soundfont", "write_wav"]
+
+# 未指定 SoundFont 時依序尋找的位置（SYMPHONY_SOUNDFONT 環境變數優先）
+SOUNDFONT_PATHS = [
+    "/usr/share/sounds/sf2/FluidR3_GM.sf2",
+    "/usr/share/soundfonts/FluidR3_GM.sf2",
+    "/usr/share/sounds/sf2/default-GM.sf2",
+    "/opt/homebrew/share/soundfonts/default.sf2",
+]
+
+PERCUSSION_CHANNEL = 9
+PERCUSSION_BANK = 128
+
+
+def find_soundfont(soundfont: Optional[str] = None) -> str:
+    """
+    取得 SoundFont 路徑。
+
+    Raises:
+        FileNotFoundError: 找不到任何 SoundFont 時。
+    """
+    candidates = [soundfont] if soundfont else [os.getenv("SYMPHONY_SOUNDFONT"), *SOUNDFONT_PATHS]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    raise FileNotFoundError(
+        f"找不到 SoundFont：{soundfont or SOUNDFONT_PATHS}\n"
+        "請以 soundfont 參數或 SYMPHONY_SOUNDFONT 環境變數指定 .sf2 檔。"
+    )
+
+
+def _note_events(part: CompactPart, seconds_per_quarter: float, sample_rate: int) -> np.ndarray:
+    """將聲部轉為 (起始樣本, 結束樣本, MIDI, velocity) 的整數陣列，和弦逐音展開"""
+    notes = part.notes[part.notes["pitch"] != REST]
+    single = notes[notes["chord"] < 0]
+    columns = [(single["onset"], single["duration"], single["pitch"].astype(np.int64), single["velocity"])]
+    for row in notes[notes["chord"] >= 0]:
+        start, end = part.chord_offsets[row["chord"]], part.chord_offsets[row["chord"] + 1]
+        size = end - start
+        columns.append((np.full(size, row["onset"]), np.full(size, row["duration"]),
+                        part.chord_pitches[start:end].astype(np.int64), np.full(size, row["velocity"])))
+    onset, duration, midi, velocity = (np.concatenate(c) for c in zip(*columns))
+    scale = seconds_per_quarter * sample_rate
+    starts = np.rint(onset * scale).astype(np.int64)
+    ends = np.maximum(starts + 1, np.rint((onset + duration) * scale).astype(np.int64))
+    return np.stack([starts, ends, midi, velocity.astype(np.int64)], axis=1)
+
+
+def _render_stem(soundfont: str, sample_rate: int, channel: int, bank: int, program: int,
+                 events: np.ndarray, length: int) -> np.ndarray:
+    """
+    在工作行程中以 FluidSynth 合成單一聲部。
+
+    Returns:
+        np.ndarray: (length, 2) 的 float32 立體聲 PCM，範圍 -1 到 1。
+    """
+    import fluidsynth
+
+    synth = fluidsynth.Synth(samplerate=float(sample_rate))
+    try:
+        sfid = synth.sfload(soundfont)
+        synth.program_select(channel, sfid, bank, program)
+        # 同一樣本位置先關音再開音
+        timeline = [(int(end), 0, int(midi), 0) for _, end, midi, _ in events]
+        timeline += [(int(start), 1, int(midi), int(velocity)) for start, _, midi, velocity in events]
+        timeline.sort()
+
+        chunks = []
+        position = 0
+        for sample, is_on, midi, velocity in timeline:
+            if sample > position:
+                chunks.append(synth.get_samples(sample - position))
+                position = sample
+            if is_on:
+                synth.noteon(channel, midi, velocity)
+            else:
+                synth.noteoff(channel, midi)
+        if length > position:
+            chunks.append(synth.get_samples(length - position))
+    finally:
+        synth.delete()
+    pcm = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+    return (pcm.reshape(-1, 2).astype(np.float32) / 32768.0)[:length]
+
+
+def write_wav(path: str, audio: np.ndarray, sample_rate: int) -> str:
+    """將 (樣本數, 2) 的 float PCM 寫為 16-bit WAV"""
+    pcm = np.clip(audio, -1.0, 1.0)
+    pcm = np.rint(pcm * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(pcm.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def _require_ffmpeg() -> str:
+    """返回 ffmpeg 路徑，找不到時拋出 RuntimeError"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("找不到 ffmpeg，無法編碼 MP3；請安裝 ffmpeg 或改用 audio_format=\"wav\"")
+    return ffmpeg
+
+
+class FluidSynthRenderer:
+    """
+    不經 MuseScore 的音訊算繪後端。
+
+    每個聲部在行程池中以 FluidSynth 與本地 SoundFont 合成為一條 NumPy 音軌（stem），
+    再以向量化的增益混音、正規化峰值後寫成 WAV，MP3 交由 ffmpeg 編碼。
+
+    Attributes:
+        soundfont (str): SoundFont 路徑。
+        sample_rate (int): 取樣率。
+        max_workers (Optional[int]): 行程池大小，預設為 CPU 數。
+        tail_seconds (float): 最後一個音之後保留的殘響時間。
+        peak (float): 正規化後的峰值。
+        rendered (List[str]): 最近一次 render_stems 實際合成的聲部；其餘沿用快取的音軌。
+    """
+
+    def __init__(self, soundfont: Optional[str] = None, sample_rate: int = 44100,
+                 max_workers: Optional[int] = None, tail_seconds: float = 2.0, peak: float = 0.89):
+        try:
+            import fluidsynth  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError(f"FluidSynth 無法使用（需要 pyfluidsynth 與 libfluidsynth）：{e}") from e
+        self.soundfont = find_soundfont(soundfont)
+        self.sample_rate = sample_rate
+        self.max_workers = max_workers
+        self.tail_seconds = tail_seconds
+        self.peak = peak
+        self.rendered: List[str] = []
+        # 樂器名稱 → (聲部雜湊與設定, 音軌)；修改迴圈中只有內容變更的聲部需要重新合成
+        self._stems: Dict[str, tuple] = {}
+
+    def _jobs(self, parts: Dict[str, CompactPart], tempo: float) -> Dict[str, tuple]:
+        """每個聲部的 _render_stem 參數；音軌長度各自計算，混音時再補齊"""
+        seconds_per_quarter = 60.0 / float(tempo)
+        jobs = {}
+        for name, part in parts.items():
+            length = int((part.quarter_length * seconds_per_quarter + self.tail_seconds) * self.sample_rate)
+            # 每條音軌使用各自的合成器，只有打擊樂需要 GM 的第 10 軌與鼓組音色庫
+            if name.lower() == "percussion":
+                channel, bank, program = PERCUSSION_CHANNEL, PERCUSSION_BANK, 0
+            else:
+                channel, bank = 0, 0
+                program = instrument_configs.get(name.lower(), {}).get("midi_program", 0)
+            events = _note_events(part, seconds_per_quarter, self.sample_rate)
+            jobs[name] = (self.soundfont, self.sample_rate, channel, bank, program, events, length)
+        return jobs
+
+    def render_stems(self, parts: Dict[str, CompactPart], tempo: float = 120) -> Dict[str, np.ndarray]:
+        """
+        平行合成內容有變更的聲部，未變更的聲部沿用上次的音軌。
+
+        Args:
+            parts (Dict[str, CompactPart]): 樂器名稱對應的聲部。
+            tempo (float): 每分鐘拍數。
+
+        Returns:
+            Dict[str, np.ndarray]: 樂器名稱對應的 (樣本數, 2) float32 音軌。
+        """
+        if not parts:
+            raise ValueError("沒有可算繪的聲部")
+        keys = {name: (part.digest(), float(tempo), self.soundfont, self.sample_rate, self.tail_seconds)
+                for name, part in parts.items()}
+        changed = {name: part for name, part in parts.items()
+                   if name not in self._stems or self._stems[name][0] != keys[name]}
+        self.rendered = list(changed)
+        with tracer.span("render_stems", parts=len(parts), rendered=len(changed)):
+            if changed:
+                jobs = self._jobs(changed, tempo)
+                with ProcessPoolExecutor(max_workers=min(len(jobs), self.max_workers or os.cpu_count() or 1)) as pool:
+                    futures = {name: pool.submit(_render_stem, *args) for name, args in jobs.items()}
+                    for name, future in futures.items():
+                        self._stems[name] = (keys[name], future.result())
+        return {name: self._stems[name][1] for name in parts}
+
+    def mix(self, stems: Dict[str, np.ndarray], gains: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        以增益混合音軌並正規化峰值。
+
+        Args:
+            stems (Dict[str, np.ndarray]): render_stems 的結果。
+            gains (Optional[Dict[str, float]]): 各聲部的線性增益，未指定的聲部為 1.0。
+
+        Returns:
+            np.ndarray: (樣本數, 2) 的混音結果。
+        """
+        names = list(stems)
+        length = max(len(stems[name]) for name in names)
+        stacked = np.zeros((len(names), length, 2), dtype=np.float32)
+        for i, name in enumerate(names):
+            stacked[i, :len(stems[name])] = stems[name]
+        weights = np.array([(gains or {}).get(name, 1.0) for name in names], dtype=np.float32)
+        mixed = np.tensordot(weights, stacked, axes=1)
+        peak = float(np.max(np.abs(mixed))) if mixed.size else 0.0
+        if peak > 0:
+            mixed *= self.peak / peak
+        return mixed
+
+    def render(self, parts: Dict[str, CompactPart], output_file: str = "symphony", tempo: float = 120,
+               audio_format: str = "mp3", gains: Optional[Dict[str, float]] = None) -> str:
+        """
+        算繪並寫出音訊檔。
+
+        Args:
+            parts (Dict[str, CompactPart]): 樂器名稱對應的聲部。
+            output_file (str): 輸出檔名（不含副檔名）。
+            tempo (float): 每分鐘拍數。
+            audio_format (str): "wav" 或 "mp3"。
+            gains (Optional[Dict[str, float]]): 各聲部的線性增益。
+
+        Returns:
+            str: 輸出檔路徑。
+
+        Raises:
+            RuntimeError: 要求 MP3 但找不到 ffmpeg 時（在算繪之前檢查）。
+        """
+        if audio_format not in ("wav", "mp3"):
+            raise ValueError(f"不支援的音訊格式：{audio_format}")
+        # 先確認能編碼再算繪，避免白算一次；輸出可能寫在暫存目錄（例如 ArtifactStore），失敗時不會保留 WAV
+        ffmpeg = _require_ffmpeg() if audio_format == "mp3" else None
+        mixed = self.mix(self.render_stems(parts, tempo), gains)
+        wav_file = write_wav(f"{output_file}.wav", mixed, self.sample_rate)
+        if audio_format == "wav":
+            return wav_file
+        return self.encode_mp3(wav_file, f"{output_file}.mp3", ffmpeg=ffmpeg)
+
+    def encode_mp3(self, wav_file: str, mp3_file: str, keep_wav: bool = False,
+                   ffmpeg: Optional[str] = None) -> str:
+        """
+        以 ffmpeg 將 WAV 編碼為 MP3。
+
+        Raises:
+            RuntimeError: 找不到 ffmpeg 時。
+        """
+        ffmpeg = ffmpeg or _require_ffmpeg()
+        with tracer.span("ffmpeg", output=mp3_file):
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", wav_file, "-b:a", "192k", mp3_file],
+                           check=True)
+        if not keep_wav:
+            os.remove(wav_file)
+        return mp3_file
@@ -0,0 +1,209 @@
+# 標準函式庫
+import functools
+import math
+import re
+from fractions import Fraction
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.music.pitches import midi_to_name, pitch_to_midi
+
+__all__ = ["PartRepairer", "UnrepairableScore"]
+
+DURATION_NAMES = {
+    "whole": 4.0,
+    "half": 2.0,
+    "quarter": 1.0,
+    "eighth": 0.5,
+    "sixteenth": 0.25,
+}
+
+REST_NAMES = {"rest", "r", "休止符", "silence"}
+
+# 音名的結構：音級、任意寫法的升降記號、可省略的八度；實際的音高由 src.music.pitches 的共用音高表換算
+_ACCIDENTALS = {"#": 1, "♯": 1, "x": 2, "b": -1, "♭": -1, "-": -1}
+_PITCH_PATTERN = re.compile(r"^([A-Ga-g])\s*([#♯xb♭\-]*)\s*(-?\d+)?$")
+
+
+class UnrepairableScore(ValueError):
+    """回應的結構無法在本地修復（例如沒有 notes 列表），需要交給 LLM 重試"""
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_pitch(name: str) -> Optional[Tuple[int, bool]]:
+    """
+    解析音名為 (MIDI 編號, 是否寫了八度)；沒有八度時以第 4 八度計算。無法解析時返回 None。
+    LLM 輸出的音名種類有限，結果全程快取。
+    """
+    match = _PITCH_PATTERN.match(name.strip())
+    if not match:
+        return None
+    step, accidentals, octave = match.groups()
+    alter = sum(_ACCIDENTALS[a] for a in accidentals)
+    spelled = f"{step.upper()}{'#' * alter if alter > 0 else '-' * -alter}{octave if octave is not None else 4}"
+    try:
+        return pitch_to_midi(spelled), octave is not None
+    except Exception:
+        return None
+
+
+class PartRepairer:
+    """
+    在呼叫 LLM 重試之前，於本地修正樂譜 JSON 中常見的小錯誤。
+
+    - 音名拼法：'bb4'、'C♯4'、'Db4' 等轉為 pitches.midi_to_name 的拼法，缺少八度時取最接近音域中央的八度
+    - 音域：超出 pitch_range 的音以八度移位摺回音域內，仍無法放入時改為最接近的邊界音
+    - 時值：字串、分數與名稱（'quarter'）轉為數字；三連音、附點或長音等有效的正數時值保持不變，
+      只有無法解析或不大於 0 的時值改為 1.0
+    - 技巧：不支援的技巧改為樂器的預設技巧
+
+    結構性錯誤（不是物件、沒有 notes 列表、修正後沒有任何音符）拋出 UnrepairableScore。
+
+    Attributes:
+        low (int): 音域最低音的 MIDI 編號。
+        high (int): 音域最高音的 MIDI 編號。
+        techniques (List[str]): 可用技巧，第一個為預設值。
+        default_clef (str): 預設譜號。
+    """
+
+    def __init__(self, pitch_range: Sequence[str], techniques: List[str], default_clef: str,
+                 instrument_name: str = ""):
+        bounds = [_parse_pitch(p) for p in pitch_range]
+        if any(b is None or not b[1] for b in bounds):
+            raise ValueError(f"無法解析音域：{pitch_range}")
+        self.low, self.high = (b[0] for b in bounds)
+        self.techniques = techniques
+        self.default_clef = default_clef
+        self.instrument_name = instrument_name
+
+    def repair(self, data) -> Tuple[Dict, List[str]]:
+        """
+        修正整個聲部。
+
+        Args:
+            data: LLM 回傳並經 JSON 解析的聲部資料。
+
+        Returns:
+            Tuple[Dict, List[str]]: 修正後的新資料與修正說明；原資料不會被修改。
+
+        Raises:
+            UnrepairableScore: 結構無法修復時。
+        """
+        if not isinstance(data, dict):
+            raise UnrepairableScore(f"回應不是 JSON 物件：{type(data).__name__}")
+        notes = data.get("notes")
+        if not isinstance(notes, list) or not notes:
+            raise UnrepairableScore("回應缺少 notes 列表或列表為空")
+
+        fixes = []
+        repaired_notes = []
+        for index, note_data in enumerate(notes):
+            repaired, note_fixes = self.repair_note(note_data)
+            fixes.extend(f"第 {index + 1} 個音符：{fix}" for fix in note_fixes)
+            if repaired is not None:
+                repaired_notes.append(repaired)
+        if not repaired_notes:
+            raise UnrepairableScore("修正後沒有任何可用的音符")
+
+        clef_name = data.get("clef")
+        if not isinstance(clef_name, str) or clef_name.lower() not in ("treble", "bass", "alto"):
+            fixes.append(f"譜號 {clef_name!r} 改為 {self.default_clef}")
+            clef_name = self.default_clef
+        repaired = dict(data, notes=repaired_notes, clef=clef_name)
+        if not isinstance(repaired.get("instrument"), str):
+            repaired["instrument"] = self.instrument_name
+        return repaired, fixes
+
+    def repair_note(self, note_data) -> Tuple[Optional[Dict], List[str]]:
+        """
+        修正單一音符。
+
+        Returns:
+            Tuple[Optional[Dict], List[str]]: 修正後的音符（無法使用時為 None）與修正說明。
+        """
+        if not isinstance(note_data, dict):
+            return None, [f"略過非物件的音符 {note_data!r}"]
+        fixes = []
+
+        raw_pitch = note_data.get("pitch")
+        if raw_pitch is None:
+            pitch_name = "rest"
+            fixes.append("缺少音高，改為休止符")
+        else:
+            pitch_name, pitch_fixes = self._repair_pitch(raw_pitch)
+            fixes.extend(pitch_fixes)
+            if pitch_name is None:
+                return None, fixes
+
+        duration, duration_fix = self._repair_duration(note_data.get("duration"))
+        if duration_fix:
+            fixes.append(duration_fix)
+
+        technique = note_data.get("technique")
+        if pitch_name == "rest":
+            technique = technique if isinstance(technique, str) else "none"
+        elif technique not in self.techniques:
+            fixes.append(f"技巧 {technique!r} 改為 {self.techniques[0]}")
+            technique = self.techniques[0]
+
+        return dict(note_data, pitch=pitch_name, duration=duration, technique=technique), fixes
+
+    def _repair_pitch(self, raw) -> Tuple[Optional[str], List[str]]:
+        """修正音高或和弦；無法解析時返回 (None, 說明)"""
+        if isinstance(raw, list):
+            names = [str(p) for p in raw]
+        elif isinstance(raw, str):
+            if raw.strip().lower() in REST_NAMES:
+                return "rest", [] if raw == "rest" else [f"{raw!r} 改為 rest"]
+            names = [p for p in re.split(r"[\s,]+", raw.strip()) if p]
+        else:
+            return None, [f"無法解析音高 {raw!r}，略過"]
+
+        fixes = []
+        spelled = []
+        for name in names:
+            parsed = _parse_pitch(name)
+            if parsed is None:
+                return None, [f"無法解析音高 {name!r}，略過"]
+            midi, has_octave = parsed
+            if not has_octave:
+                middle = (self.low + self.high) // 2
+                midi += 12 * round((middle - midi) / 12)
+            folded = self._fold(midi)
+            if folded is None:
+                # 音域小於一個八度且無法摺入時改為最接近的邊界音
+                folded = self.low if midi < self.low else self.high
+            result = midi_to_name(folded)
+            if result != name:
+                fixes.append(f"音高 {name} 改為 {result}")
+            spelled.append(result)
+        return " ".join(spelled), fixes
+
+    def _fold(self, midi: int) -> Optional[int]:
+        """以八度移位讓音高落在音域內；無法放入時返回 None"""
+        while midi < self.low:
+            midi += 12
+        while midi > self.high:
+            midi -= 12
+        return midi if self.low <= midi <= self.high else None
+
+    def _repair_duration(self, raw) -> Tuple[float, Optional[str]]:
+        """將時值轉為數字；只修正無法解析或不大於 0 的值。返回 (時值, 說明或 None)"""
+        value = None
+        if isinstance(raw, bool):
+            value = None
+        elif isinstance(raw, (int, float)):
+            value = float(raw)
+        elif isinstance(raw, str):
+            text = raw.strip().lower()
+            if text in DURATION_NAMES:
+                value = DURATION_NAMES[text]
+            else:
+                try:
+                    value = float(Fraction(text))
+                except (ValueError, ZeroDivisionError):
+                    value = None
+        if value is None or not math.isfinite(value) or value <= 0:
+            return 1.0, f"時值 {raw!r} 改為 1.0"
+        if isinstance(raw, str):
+            return value, f"時值 {raw!r} 改為 {value:g}"
+        return value, None
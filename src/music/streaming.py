@@ -0,0 +1,108 @@
+# 標準函式庫
+import json
+import re
+from typing import Dict, List
+
+# LangChain 相關
+from langchain_core.exceptions import OutputParserException
+from langchain_core.utils.json import parse_json_markdown
+
+__all__ = ["NoteStreamParser"]
+
+_NOTES_KEY = re.compile(r'"notes"\s*:\s*\[')
+
+
+class NoteStreamParser:
+    """
+    逐段解析 LLM 串流輸出中的 `notes` 陣列。
+
+    每收到一段文字就掃描已完整的 `{...}` 音符物件並返回，不必等整個 JSON 結束；
+    串流結束後 close() 以與 JsonOutputParser 相同的方式解析完整回應，取得 clef 等其餘欄位。
+    單一音符物件無法解析時停止增量解析，交由完整回應的解析與重試流程處理。
+
+    Attributes:
+        text (str): 目前為止收到的完整文字。
+        count (int): 已解析出的音符數。
+        broken (bool): 增量解析是否因格式錯誤而停止。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.count = 0
+        self.broken = False
+        self._state = "seek"  # seek → array → done
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        加入一段串流文字。
+
+        Args:
+            chunk (str): LLM 輸出的文字片段。
+
+        Returns:
+            List[Dict]: 這段文字中新完成的音符。
+        """
+        self.text += chunk
+        if self._state == "seek":
+            match = _NOTES_KEY.search(self.text)
+            if not match:
+                return []
+            self._state = "array"
+            self._pos = match.end()
+        if self._state != "array":
+            return []
+
+        notes = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._depth == 0:
+                if char == "]":
+                    self._state = "done"
+                    break
+                if char == "{":
+                    self._start = self._pos
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        notes.append(json.loads(text[self._start:self._pos + 1]))
+                    except ValueError:
+                        self.broken = True
+                        self._state = "done"
+                        break
+            self._pos += 1
+        self.count += len(notes)
+        return notes
+
+    def close(self) -> Dict:
+        """
+        解析完整的回應。
+
+        Returns:
+            Dict: 完整的 JSON 物件。
+
+        Raises:
+            OutputParserException: 回應不是有效的 JSON 時。
+        """
+        try:
+            return parse_json_markdown(self.text)
+        except ValueError as e:
+            raise OutputParserException(f"Invalid json output: {self.text}") from e
@@ -1,5 +1,5 @@
 # 標準函式庫
-from typing import Optional
+from typing import Dict, Optional
 from music21 import *
 
 # 第三方函式庫
@@ -0,0 +1,321 @@
+# 標準函式庫
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+# LangChain 相關
+from langchain_core.callbacks import BaseCallbackHandler
+
+__all__ = [
+    "Span",
+    "Tracer",
+    "JsonlSpanExporter",
+    "OtlpFileSpanExporter",
+    "TracingCallbackHandler",
+    "tracer",
+    "traced",
+    "configure_tracing",
+]
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    一段被追蹤的工作，例如一個階段、一次 LLM 呼叫或一次 MuseScore 轉換。
+
+    Attributes:
+        name (str): span 名稱。
+        attributes (Dict): 樂器、token 數、重試次數等屬性。
+        parent (Optional[Span]): 父 span。
+        outcome (str): "ok" 或 "error"。
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.end_ns = None
+        self.duration = None
+        self.outcome = "ok"
+        self.error = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def inherited(self, key: str, default: Any = None) -> Any:
+        """由本身往上尋找屬性，例如 LLM 呼叫從所屬的聲部 span 取得 instrument"""
+        span = self
+        while span is not None:
+            if key in span.attributes:
+                return span.attributes[key]
+            span = span.parent
+        return default
+
+    def end(self, error: Optional[BaseException] = None) -> float:
+        """結束 span 並匯出；返回持續秒數"""
+        if self.end_ns is not None:
+            return self.duration
+        self.duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        if error is not None:
+            self.outcome = "error"
+            self.error = f"{type(error).__name__}: {error}"
+        if _current_span.get() is self:
+            _current_span.set(self.parent)
+        self.tracer._export(self)
+        return self.duration
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "latency_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "outcome": self.outcome,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """沒有目前 span 時 Tracer.current() 返回的空 span，讓呼叫端不必判斷"""
+
+    attributes: Dict = {}
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def inherited(self, key: str, default: Any = None) -> Any:
+        return default
+
+    def end(self, error: Optional[BaseException] = None) -> float:
+        return 0.0
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    """每個結束的 span 寫成 JSONL 檔中的一行"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class OtlpFileSpanExporter(JsonlSpanExporter):
+    """
+    以 OTLP/JSON（ExportTraceServiceRequest）格式逐行寫入 span，
+    與 OpenTelemetry Collector 的 file exporter 格式相容，可直接匯入追蹤後端。
+    """
+
+    def __init__(self, path: str, service_name: str = "symphony-agents"):
+        super().__init__(path)
+        self.service_name = service_name
+
+    @staticmethod
+    def _value(value: Any) -> Dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def export(self, span: Span):
+        attributes = dict(span.attributes, outcome=span.outcome)
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": self._value(v)} for k, v in attributes.items() if v is not None],
+            "status": {"code": 2, "message": span.error} if span.outcome == "error" else {"code": 1},
+        }
+        if span.parent:
+            otlp_span["parentSpanId"] = span.parent.span_id
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "src.tracing"}, "spans": [otlp_span]}],
+            }]
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+class Tracer:
+    """
+    以 contextvars 追蹤目前 span 的輕量追蹤器。
+
+    span 一律建立，讓 token 記帳等功能可以由目前 span 取得階段與樂器；
+    只有設定了匯出器才會寫出。
+
+    Attributes:
+        exporters (List): span 結束時呼叫的匯出器。
+    """
+
+    def __init__(self):
+        self.exporters: List = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def current(self):
+        return _current_span.get() or _NOOP_SPAN
+
+    def start_span(self, name: str, activate: bool = True, parent: Optional[Span] = None, **attributes):
+        """
+        開始一個 span。
+
+        Args:
+            name (str): span 名稱。
+            activate (bool): 是否設為目前 span，之後開始的 span 會成為它的子 span。
+            parent (Optional[Span]): 指定父 span，預設為目前 span。
+            **attributes: span 屬性。
+        """
+        span = Span(self, name, parent or _current_span.get(), attributes)
+        if activate:
+            _current_span.set(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        """以 with 區塊追蹤一段工作；離開時一併結束區塊內未結束的子 span，發生例外時標記為錯誤"""
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self._close(span, error=e)
+            raise
+        else:
+            self._close(span)
+
+    def _close(self, span, error: Optional[BaseException] = None):
+        current = _current_span.get()
+        while isinstance(current, Span) and current is not span:
+            current.end(error=error)
+            current = current.parent
+        span.end(error=error)
+
+    def _export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    將每次 LLM 呼叫記錄為 span 的 LangChain 回呼，掛在共用的 LLM 客戶端上。
+    span 的父節點是呼叫當下的目前 span，樂器與重試次數等屬性由父 span 繼承。
+    """
+
+    run_inline = True
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans: Dict[UUID, Span] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any):
+        if not self.tracer.enabled:
+            return
+        parent = _current_span.get()
+        span = self.tracer.start_span("llm.invoke", activate=False)
+        span.set_attributes(
+            model=(serialized or {}).get("name"),
+            instrument=parent.inherited("instrument") if parent else None,
+            stage=parent.inherited("stage") if parent else None,
+            retry=parent.inherited("retry", 0) if parent else 0,
+        )
+        self._spans[run_id] = span
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        usage = {}
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+        except (AttributeError, IndexError):
+            pass
+        if not usage and response.llm_output:
+            token_usage = response.llm_output.get("token_usage") or {}
+            usage = {"input_tokens": token_usage.get("prompt_tokens"),
+                     "output_tokens": token_usage.get("completion_tokens")}
+        span.set_attributes(prompt_tokens=usage.get("input_tokens"), completion_tokens=usage.get("output_tokens"))
+        span.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.end(error=error)
+
+
+# 全域追蹤器與 LLM 回呼
+tracer = Tracer()
+tracing_handler = TracingCallbackHandler(tracer)
+
+
+def traced(name: str):
+    """
+    將函式的每次呼叫記錄為 span 的裝飾器；未設定匯出器時直接呼叫，不建立 span。
+
+    Args:
+        name (str): span 名稱。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configure_tracing(jsonl_path: Optional[str] = None, otlp_path: Optional[str] = None):
+    """
+    設定 span 匯出位置；兩者皆為 None 時關閉追蹤。
+
+    Args:
+        jsonl_path (Optional[str]): 本地 JSONL 檔路徑。
+        otlp_path (Optional[str]): OTLP/JSON 檔路徑。
+    """
+    tracer.exporters = []
+    if jsonl_path:
+        tracer.exporters.append(JsonlSpanExporter(jsonl_path))
+    if otlp_path:
+        tracer.exporters.append(OtlpFileSpanExporter(otlp_path))
@@ -0,0 +1,79 @@
+import os
+import threading
+
+import pytest
+
+from src.music.artifacts import ArtifactStore
+from src.music.compact import CompactPartBuilder
+
+
+def make_part(name):
+    builder = CompactPartBuilder(["arco"])
+    builder.append({"pitch": name, "duration": 1.0, "technique": "arco"})
+    return builder.build()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "artifacts"))
+
+
+def writer(content=b"data", calls=None):
+    def produce(base):
+        if calls is not None:
+            calls.append(base)
+        path = base + ".mid"
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+    return produce
+
+
+def test_key_depends_on_content_order_format_and_params():
+    violin, cello = make_part("C4"), make_part("C3")
+    key = ArtifactStore.make_key({"violin": violin, "cello": cello}, "mid", tempo=120)
+    assert key == ArtifactStore.make_key({"violin": make_part("C4"), "cello": cello}, "mid", tempo=120)
+    assert key != ArtifactStore.make_key({"cello": cello, "violin": violin}, "mid", tempo=120)
+    assert key != ArtifactStore.make_key({"violin": violin, "cello": cello}, "wav", tempo=120)
+    assert key != ArtifactStore.make_key({"violin": violin, "cello": cello}, "mid", tempo=90)
+    assert key != ArtifactStore.make_key({"violin": make_part("D4"), "cello": cello}, "mid", tempo=120)
+
+
+def test_second_request_is_a_hit(store):
+    key = ArtifactStore.make_key({"violin": make_part("C4")}, "mid")
+    calls = []
+    path = store.get_or_create(key, "mid", writer(calls=calls))
+    assert path == store.path_for(key, "mid")
+    assert store.get_or_create(key, "mid", writer(calls=calls)) == path
+    assert len(calls) == 1
+    assert open(path, "rb").read() == b"data"
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["files"], stats["bytes"]) == (1, 1, 1, 4)
+
+
+def test_failed_producer_stores_nothing(store):
+    key = ArtifactStore.make_key({"violin": make_part("C4")}, "mid")
+    assert store.get_or_create(key, "mid", lambda base: None) is None
+    assert store.get_or_create(key, "mid", lambda base: base + ".missing") is None
+    assert store.get(key, "mid") is None
+    # 暫存目錄已清除
+    assert store.stats()["files"] == 0
+
+
+def test_concurrent_requests_render_once(store):
+    key = ArtifactStore.make_key({"violin": make_part("C4")}, "mid")
+    calls = []
+    started = threading.Barrier(8)
+
+    def request():
+        started.wait()
+        store.get_or_create(key, "mid", writer(calls=calls))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert (store.hits, store.misses) == (7, 1)
+    assert os.listdir(os.path.dirname(store.path_for(key, "mid"))) == [f"{key}.mid"]
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+from langchain_core.outputs import Generation
+
+from src.llm.cache import CACHE_HIT_KEY, DiskLLMCache
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = DiskLLMCache(os.path.join(tmp_path, "llm_cache.sqlite"), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def entry_size(cache, prompt):
+    return cache._conn.execute("SELECT size FROM entries WHERE key = ?",
+                               (cache.make_key(prompt, "m"),)).fetchone()[0]
+
+
+def put(cache, prompt, text=None):
+    # 隨機內容幾乎無法壓縮，每個項目的大小相近
+    cache.update(prompt, "m", [Generation(text=text or os.urandom(200).hex())])
+
+
+def test_round_trip_marks_cache_hits(make_cache):
+    cache = make_cache()
+    put(cache, "p", "hello")
+    generations = cache.lookup("p", "m")
+    assert [g.text for g in generations] == ["hello"]
+    assert generations[0].generation_info[CACHE_HIT_KEY] is True
+    assert cache.lookup("other", "m") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_eviction_boundary_is_exactly_max_bytes(make_cache):
+    cache = make_cache()
+    put(cache, "a", "x" * 400)
+    put(cache, "b", "y" * 400)
+    total = cache.stats()["bytes"]
+
+    # 剛好等於上限時不淘汰
+    cache.max_bytes = total
+    put(cache, "b", "y" * 400)
+    assert cache.stats()["evictions"] == 0
+    assert cache.stats()["entries"] == 2
+
+    # 超出一個位元組時淘汰最久未使用的 a
+    cache.max_bytes = total - 1
+    put(cache, "b", "y" * 400)
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("a", "m") is None
+    assert cache.lookup("b", "m") is not None
+
+
+def test_lru_evicts_least_recently_accessed_first(make_cache):
+    cache = make_cache(max_bytes=10 ** 9)
+    for prompt in "abc":
+        put(cache, prompt)
+    size = entry_size(cache, "a")
+    for order, prompt in enumerate("abc"):
+        cache._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (order, cache.make_key(prompt, "m")))
+    # 讀取 a 讓 b 成為最久未使用的項目
+    assert cache.lookup("a", "m") is not None
+    cache.max_bytes = cache.stats()["bytes"] + size // 2
+    put(cache, "d")
+
+    assert cache.lookup("b", "m") is None
+    for prompt in "acd":
+        assert cache.lookup(prompt, "m") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= cache.max_bytes
+    assert stats["bytes"] == cache._size
+
+
+def test_replacing_an_entry_does_not_double_count(make_cache):
+    cache = make_cache()
+    put(cache, "a")
+    put(cache, "a", "short")
+    assert cache._size == cache.stats()["bytes"] == entry_size(cache, "a")
+
+
+def test_running_size_is_restored_on_reopen(make_cache):
+    cache = make_cache()
+    for prompt in "abc":
+        put(cache, prompt)
+    size = cache.stats()["bytes"]
+    cache.close()
+    assert make_cache()._size == size
+
+
+def test_expired_entries_are_dropped_before_lru(make_cache):
+    cache = make_cache(ttl=60)
+    put(cache, "old")
+    put(cache, "fresh")
+    cache._conn.execute("UPDATE entries SET created = created - 3600 WHERE key = ?",
+                        (cache.make_key("old", "m"),))
+    # 剛好超出上限：刪除過期的 old 就足夠，不必淘汰 fresh
+    cache.max_bytes = cache.stats()["bytes"] + entry_size(cache, "old") // 2
+    put(cache, "new")
+
+    assert cache.lookup("fresh", "m") is not None
+    assert cache.lookup("new", "m") is not None
+    assert cache.stats()["entries"] == 2
+    assert cache._size == cache.stats()["bytes"]
+
+
+def test_expired_entry_is_a_miss_on_lookup(make_cache):
+    cache = make_cache(ttl=60)
+    put(cache, "old")
+    cache._conn.execute("UPDATE entries SET created = created - 3600")
+    assert cache.lookup("old", "m") is None
+    assert cache.stats()["entries"] == 0
+    assert cache._size == 0
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from src.checkpoint import CheckpointStore, params_key
+
+PARAMS = {"style": "Romantic", "tempo": 90, "key": "D minor", "time_signature": "3/4",
+          "num_measures": 16, "instruments": ["violin", "cello"]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(PARAMS, root=str(tmp_path))
+
+
+def test_params_key_ignores_order_case_and_derived_fields():
+    variant = dict(PARAMS, style=" romantic ", instruments=["cello", "violin"], structure={"form": "rondo"})
+    assert params_key(variant) == params_key(PARAMS)
+    assert params_key(dict(PARAMS, tempo=100)) != params_key(PARAMS)
+    assert len(params_key(PARAMS)) == 16
+
+
+def test_stage_round_trip(store):
+    path = store.save("plan", {"sections": [1, 2]})
+    assert os.path.dirname(path) == store.directory
+    assert store.load("plan") == {"sections": [1, 2]}
+    assert store.load("compose") is None
+    # 沒有留下暫存檔
+    assert os.listdir(store.directory) == ["plan.json"]
+
+
+def test_items_round_trip_and_discard(store):
+    store.save_item("compose", "violin", {"notes": []})
+    store.save_item("compose", "cello", {"notes": [1]})
+    assert store.load_items("compose") == {"cello": {"notes": [1]}, "violin": {"notes": []}}
+    store.discard("compose", "violin")
+    assert list(store.load_items("compose")) == ["cello"]
+    store.save("compose", "done")
+    store.discard("compose")
+    assert store.load("compose") is None
+    assert store.load_items("compose") == {}
+
+
+def test_corrupt_or_foreign_checkpoints_are_ignored(store, tmp_path):
+    path = store.save("plan", "ok")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"stage": "plan", "data": ')
+    assert store.load("plan") is None
+
+    other = CheckpointStore(dict(PARAMS, tempo=60), root=str(tmp_path))
+    # 內容屬於其他參數時即使放在同一個目錄也不載入
+    other.directory = store.directory
+    other.save("plan", "foreign")
+    assert store.load("plan") is None
+    assert other.load("plan") == "foreign"
+
+
+def test_failed_write_keeps_the_previous_checkpoint(store):
+    store.save("plan", "first")
+    with pytest.raises(TypeError):
+        store.save("plan", object())
+    assert store.load("plan") == "first"
+    assert os.listdir(store.directory) == ["plan.json"]
+
+
+def test_clear_removes_only_this_params_directory(store, tmp_path):
+    other = CheckpointStore(dict(PARAMS, tempo=60), root=str(tmp_path))
+    store.save("plan", 1)
+    other.save("plan", 2)
+    store.clear()
+    assert not os.path.exists(store.directory)
+    assert other.load("plan") == 2
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from src.music.compact import DEFAULT_VELOCITY, REST, CompactPart, CompactPartBuilder
+
+TECHNIQUES = ["arco", "pizz"]
+
+
+def make_part(notes, time_signature="4/4", key_fifths=0, pitch_range=None):
+    builder = CompactPartBuilder(TECHNIQUES, "treble", "Violin", pitch_range,
+                                 time_signature=time_signature, key_fifths=key_fifths)
+    for name, duration in notes:
+        builder.append({"pitch": name, "duration": duration, "technique": "arco"})
+    return builder.build()
+
+
+def summary(part):
+    return [(n["pitch"], n["duration"]) for n in part.to_json()["notes"]]
+
+
+def test_builder_tracks_onsets_chords_and_rests():
+    part = make_part([("C4", 1.0), ("E4 G4 C5", 2.0), ("rest", 1.0)])
+    assert part.notes["onset"].tolist() == [0.0, 1.0, 3.0]
+    assert part.pitches(1) == [64, 67, 72]
+    assert part.notes["pitch"][2] == REST
+    assert part.quarter_length == 4.0
+    assert summary(part) == [("C4", 1.0), ("E4 G4 C5", 2.0), ("rest", 1.0)]
+
+
+def test_builder_skips_out_of_range_notes_without_printing(capsys):
+    builder = CompactPartBuilder(TECHNIQUES, "treble", "Violin", ("G3", "A7"))
+    assert builder.append({"pitch": "C2", "duration": 1.0}) is None
+    assert len(builder) == 0 and builder.onset == 0.0
+    assert builder.skipped and "C2" in builder.skipped[0]
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("note_data,velocity", [
+    ({"dynamic": "p"}, 49),
+    ({"dynamic": "FF"}, 112),
+    ({"dynamic": "unknown"}, DEFAULT_VELOCITY),
+    ({"velocity": 100, "dynamic": "p"}, 100),
+    ({"velocity": 0}, DEFAULT_VELOCITY),
+])
+def test_velocity_from_number_or_dynamic(note_data, velocity):
+    builder = CompactPartBuilder(TECHNIQUES)
+    builder.append(dict({"pitch": "C4", "duration": 1.0}, **note_data))
+    assert builder.build().notes["velocity"][0] == velocity
+
+
+def test_measures_follow_the_time_signature():
+    part = make_part([("C4", 1.0)] * 7, time_signature="3/4")
+    assert part.bar_length == 3.0
+    assert part.measure_count == 3
+
+
+def test_fit_truncates_and_pads():
+    part = make_part([("C4", 2.0), ("D4", 2.0)])
+    assert summary(part.fit(3.0)) == [("C4", 2.0), ("D4", 1.0)]
+    assert summary(part.fit(6.0)) == [("C4", 2.0), ("D4", 2.0), ("rest", 2.0)]
+    assert summary(part.fit(2.0)) == [("C4", 2.0)]
+
+
+def test_concat_shifts_onsets_and_chord_indices():
+    first = make_part([("C4 E4", 1.0), ("G4", 1.0)])
+    second = make_part([("D4 F4 A4", 2.0)])
+    joined = CompactPart.concat([first, second, first])
+    assert joined.notes["onset"].tolist() == [0.0, 1.0, 2.0, 4.0, 5.0]
+    assert [joined.pitches(i) for i in range(len(joined))] == [[60, 64], [67], [62, 65, 69], [60, 64], [67]]
+
+
+def test_replace_span_keeps_length_and_cuts_held_notes():
+    part = make_part([("C4", 1.0), ("D4", 3.0), ("E4", 4.0)])
+    replacement = make_part([("G4 B4", 1.0), ("A4", 1.0)])
+    revised = part.replace_span(1.0, 3.0, replacement)
+    assert revised.quarter_length == part.quarter_length
+    # D4 原本延續到第 4 拍，範圍之後的部分改為休止符
+    assert summary(revised) == [("C4", 1.0), ("G4 B4", 1.0), ("A4", 1.0), ("rest", 1.0), ("E4", 4.0)]
+
+
+def test_replace_span_rejects_different_techniques():
+    part = make_part([("C4", 4.0)])
+    other = CompactPartBuilder(["legato"])
+    other.append({"pitch": "C4", "duration": 1.0})
+    with pytest.raises(ValueError):
+        part.replace_span(0.0, 1.0, other.build())
+
+
+def test_slice_and_transpose():
+    part = make_part([("C4", 2.0), ("D4 F4", 2.0), ("E4", 2.0)])
+    assert summary(part.slice(1.0, 5.0)) == [("C4", 1.0), ("D4 F4", 2.0), ("E4", 1.0)]
+    assert summary(part.slice(1.0, 5.0, carry_over=False))[0] == ("rest", 1.0)
+    assert summary(part.transpose(12)) == [("C5", 2.0), ("D5 F5", 2.0), ("E5", 2.0)]
+
+
+def test_to_json_rounds_float32_durations():
+    part = make_part([("C4", 1 / 3)] * 3)
+    assert [n["duration"] for n in part.to_json()["notes"]] == [0.333333] * 3
+
+
+@pytest.mark.parametrize("key_fifths,expected", [(-1, "B-4"), (2, "A#4"), (0, "B-4")])
+def test_pitches_are_spelled_from_the_key(key_fifths, expected):
+    part = make_part([("Bb4", 1.0)], key_fifths=key_fifths)
+    assert part.to_json()["notes"][0]["pitch"] == expected
+    exported = part.to_music21()
+    assert exported.recurse().notes[0].pitch.nameWithOctave == expected
+    assert exported.recurse().getElementsByClass("KeySignature")[0].sharps == key_fifths
+
+
+def test_digest_changes_with_content_and_metadata():
+    part = make_part([("C4", 1.0)])
+    assert part.digest() == make_part([("C4", 1.0)]).digest()
+    assert part.digest() != make_part([("D4", 1.0)]).digest()
+    assert part.digest() != make_part([("C4", 1.0)], time_signature="3/4").digest()
+
+
+def test_from_json_round_trip():
+    part = make_part([("C4", 1.0), ("E4 G4", 0.5), ("rest", 0.5)])
+    again = CompactPart.from_json(part.to_json(), TECHNIQUES, instrument_name="Violin")
+    assert np.array_equal(again.notes, part.notes)
@@ -0,0 +1,50 @@
+import pytest
+
+from src.composer.instruction_generator import InstructionGenerator
+from src.llm.tokens import count_tokens
+
+INSTRUMENTS = [f"inst{i}" for i in range(40)]
+PARAMS = {"structure": {
+    "form": "sonata",
+    "instrumentation_roles": {name: f"supporting line {i} with counter-melody" for i, name in enumerate(INSTRUMENTS)},
+}}
+
+
+def generator(budget):
+    return InstructionGenerator(None, PARAMS, {}, max_prompt_tokens=budget)
+
+
+def exact_tokens(gen, batch):
+    return count_tokens(gen._batch_prompt().format(**gen._batch_inputs(batch)))
+
+
+def test_no_budget_is_a_single_batch():
+    gen = generator(None)
+    assert gen._split_by_budget(gen._batch_prompt(), INSTRUMENTS) == [INSTRUMENTS]
+
+
+@pytest.mark.parametrize("extra", [40, 120, 400, 10 ** 6])
+def test_batches_fit_the_budget_and_keep_order(extra):
+    base = exact_tokens(generator(None), [])
+    gen = generator(base + extra)
+    batches = gen._split_by_budget(gen._batch_prompt(), INSTRUMENTS)
+    assert [inst for batch in batches for inst in batch] == INSTRUMENTS
+    for batch in batches:
+        assert exact_tokens(gen, batch) <= gen.max_prompt_tokens
+
+
+def test_instrument_larger_than_the_budget_is_left_for_single_requests():
+    params = {"structure": {"instrumentation_roles": {"violin": "short", "cello": "very long role " * 200}}}
+    gen = InstructionGenerator(None, params, {})
+    gen.max_prompt_tokens = exact_tokens(gen, ["violin"]) + 5
+    batches = gen._split_by_budget(gen._batch_prompt(), ["violin", "cello"])
+    assert batches == [["violin"]]
+
+
+def test_prompt_is_formatted_once_not_per_instrument(monkeypatch):
+    gen = generator(10 ** 6)
+    calls = []
+    original = gen._prompt_tokens
+    monkeypatch.setattr(gen, "_prompt_tokens", lambda prompt, batch: calls.append(batch) or original(prompt, batch))
+    gen._split_by_budget(gen._batch_prompt(), INSTRUMENTS)
+    assert calls == [[]]
@@ -0,0 +1,87 @@
+import struct
+
+import pytest
+from music21 import converter
+
+from src.music.compact import CompactPartBuilder
+from src.music.midi_writer import TICKS_PER_QUARTER, _vlq, encode_midi, write_midi
+
+
+def make_part(notes, key_fifths=0, time_signature="4/4"):
+    builder = CompactPartBuilder(["arco"], time_signature=time_signature, key_fifths=key_fifths)
+    for name, duration, dynamic in notes:
+        builder.append({"pitch": name, "duration": duration, "technique": "arco", "dynamic": dynamic})
+    return builder.build()
+
+
+def tracks(data):
+    """拆出每個 MTrk 區塊的內容"""
+    chunks, position = [], 14
+    while position < len(data):
+        assert data[position:position + 4] == b"MTrk"
+        length = struct.unpack(">I", data[position + 4:position + 8])[0]
+        chunks.append(data[position + 8:position + 8 + length])
+        position += 8 + length
+    return chunks
+
+
+@pytest.mark.parametrize("value,encoded", [
+    (0, b"\x00"), (0x7F, b"\x7f"), (0x80, b"\x81\x00"), (0x3FFF, b"\xff\x7f"), (0x200000, b"\x81\x80\x80\x00"),
+])
+def test_variable_length_quantities(value, encoded):
+    assert _vlq(value) == encoded
+
+
+def test_header_and_one_track_per_part():
+    parts = {"violin": make_part([("C4", 1.0, "p")]), "cello": make_part([("C3", 1.0, "f")])}
+    data = encode_midi(parts)
+    assert data[:4] == b"MThd"
+    assert struct.unpack(">IHHH", data[4:14]) == (6, 1, 3, TICKS_PER_QUARTER)
+    assert len(tracks(data)) == 3
+
+
+def test_round_trip_through_music21(tmp_path):
+    violin = make_part([("C4", 1.0, "p"), ("E4 G4", 2.0, "f"), ("rest", 0.5, "mf"), ("D5", 0.5, "ff")],
+                       key_fifths=-1, time_signature="3/4")
+    path = write_midi({"violin": violin}, str(tmp_path / "out.mid"), tempo=90)
+    score = converter.parse(path)
+    notes = list(score.flatten().notes)
+    assert [sorted(p.midi for p in n.pitches) for n in notes] == [[60], [64, 67], [74]]
+    assert [float(n.offset) for n in notes] == [0.0, 1.0, 3.5]
+    assert [n.volume.velocity for n in notes] == [49, 96, 112]
+    assert score.recurse().getElementsByClass("MetronomeMark")[0].number == 90
+    assert score.recurse().getElementsByClass("TimeSignature")[0].ratioString == "3/4"
+    assert score.recurse().getElementsByClass("KeySignature")[0].sharps == -1
+
+
+def test_percussion_uses_channel_ten():
+    parts = {"violin": make_part([("C4", 1.0, "mf")]), "percussion": make_part([("C4", 1.0, "mf")]),
+             "cello": make_part([("C3", 1.0, "mf")])}
+    violin, percussion, cello = tracks(encode_midi(parts))[1:]
+    assert b"\x99\x3c" in percussion
+    assert b"\x90\x3c" in violin
+    assert b"\x91\x30" in cello
+
+
+def test_repeated_notes_turn_off_before_turning_on():
+    data = encode_midi({"violin": make_part([("C4", 1.0, "mf"), ("C4", 1.0, "mf")])})
+    track = tracks(data)[1]
+    assert track.index(b"\x80\x3c\x00") < track.rindex(b"\x90\x3c")
+
+
+def test_track_cache_only_reencodes_changed_parts():
+    violin = make_part([("C4", 1.0, "mf")])
+    cello = make_part([("C3", 1.0, "mf")])
+    cache = {}
+    first = encode_midi({"violin": violin, "cello": cello}, track_cache=cache)
+    cached_violin = cache["violin"]
+    changed = encode_midi({"violin": violin, "cello": make_part([("D3", 1.0, "mf")])}, track_cache=cache)
+    assert cache["violin"] is cached_violin
+    assert tracks(changed)[1] == tracks(first)[1]
+    assert tracks(changed)[2] != tracks(first)[2]
+    assert encode_midi({"violin": violin, "cello": cello}, track_cache=cache) == first
+
+
+def test_empty_score_is_rejected():
+    with pytest.raises(ValueError):
+        encode_midi({})
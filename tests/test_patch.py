@@ -0,0 +1,95 @@
+import pytest
+
+from src.music.compact import CompactPartBuilder
+from src.music.patch import PatchError, apply_patch, part_by_measure
+
+TECHNIQUES = ["arco", "pizz"]
+VIOLIN_RANGE = ("G3", "A7")
+VIOLIN_MIDI = (55, 105)
+
+
+def new_builder():
+    return CompactPartBuilder(TECHNIQUES, "treble", "Violin", VIOLIN_RANGE)
+
+
+def make_part(pitches, duration=1.0):
+    builder = new_builder()
+    for name in pitches:
+        builder.append({"pitch": name, "duration": duration, "technique": "arco"})
+    return builder.build()
+
+
+def names(part):
+    return [n["pitch"] for n in part.to_json()["notes"]]
+
+
+@pytest.fixture
+def part():
+    # 三小節 4/4，每小節四個四分音符
+    return make_part(["C4", "D4", "E4", "F4"] * 3)
+
+
+def test_part_by_measure_groups_notes_by_starting_measure(part):
+    grouped = part_by_measure(part)
+    assert list(grouped) == ["1", "2", "3"]
+    assert [n["pitch"] for n in grouped["2"]] == ["C4", "D4", "E4", "F4"]
+
+
+def test_replace_exact_span(part):
+    patch = {"patches": [{"op": "replace", "start_measure": 2, "end_measure": 2,
+                          "notes": [{"pitch": "G4", "duration": 2.0, "technique": "arco"},
+                                    {"pitch": "A4", "duration": 2.0, "technique": "pizz"}]}]}
+    revised = apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+    assert names(revised) == ["C4", "D4", "E4", "F4", "G4", "A4", "C4", "D4", "E4", "F4"]
+    assert revised.quarter_length == part.quarter_length
+    # 原聲部不變
+    assert names(part)[4] == "C4"
+
+
+@pytest.mark.parametrize("durations", [[1.0, 1.0, 1.0], [2.0, 2.0, 1.0]])
+def test_replace_with_wrong_length_is_rejected_instead_of_padded_or_truncated(part, durations):
+    notes = [{"pitch": "G4", "duration": d, "technique": "arco"} for d in durations]
+    patch = {"patches": [{"op": "replace", "start_measure": 1, "end_measure": 1, "notes": notes}]}
+    with pytest.raises(PatchError, match="拍"):
+        apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+
+
+def test_replace_with_out_of_range_note_is_rejected(part):
+    patch = {"patches": [{"op": "replace", "start_measure": 1, "end_measure": 1,
+                          "notes": [{"pitch": "C2", "duration": 4.0, "technique": "arco"}]}]}
+    with pytest.raises(PatchError, match="音域"):
+        apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+
+
+def test_overlapping_ranges_are_rejected(part):
+    patch = {"patches": [
+        {"op": "transpose", "start_measure": 1, "end_measure": 2, "semitones": 2},
+        {"op": "transpose", "start_measure": 2, "end_measure": 3, "semitones": 2},
+    ]}
+    with pytest.raises(PatchError, match="重疊"):
+        apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+
+
+@pytest.mark.parametrize("first,last", [(0, 1), (2, 4), (3, 2)])
+def test_measure_range_outside_part_is_rejected(part, first, last):
+    patch = {"patches": [{"op": "transpose", "start_measure": first, "end_measure": last, "semitones": 2}]}
+    with pytest.raises(PatchError):
+        apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+
+
+def test_transpose_only_touches_the_range(part):
+    patch = {"patches": [{"op": "transpose", "start_measure": 3, "end_measure": 3, "semitones": 12}]}
+    revised = apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+    assert names(revised) == ["C4", "D4", "E4", "F4"] * 2 + ["C5", "D5", "E5", "F5"]
+
+
+def test_transpose_out_of_range_is_rejected(part):
+    patch = {"patches": [{"op": "transpose", "start_measure": 1, "end_measure": 1, "semitones": -12}]}
+    with pytest.raises(PatchError, match="音域"):
+        apply_patch(part, patch, new_builder, VIOLIN_MIDI)
+
+
+@pytest.mark.parametrize("patch", [{}, {"patches": []}, {"patches": [{"op": "delete"}]}, None])
+def test_malformed_patches_are_rejected(part, patch):
+    with pytest.raises(PatchError):
+        apply_patch(part, patch, new_builder, VIOLIN_MIDI)
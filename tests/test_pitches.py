@@ -0,0 +1,42 @@
+import pytest
+
+from src.music.pitches import HIGHEST_MIDI, LOWEST_MIDI, PITCH_TABLE, key_to_fifths, midi_to_name, pitch_to_midi
+
+
+@pytest.mark.parametrize("name", ["Bb4", "B-4", "B♭4", "A#4", "A♯4", "bb4", "Cbb5"])
+def test_enharmonic_spellings_share_one_number(name):
+    assert pitch_to_midi(name) == 70
+
+
+def test_table_covers_the_piano_range():
+    assert pitch_to_midi("A0") == LOWEST_MIDI
+    assert pitch_to_midi("C8") == HIGHEST_MIDI
+    assert "G#9" not in PITCH_TABLE
+
+
+def test_names_outside_the_table_fall_back_to_music21():
+    assert pitch_to_midi("C9") == 120
+    assert pitch_to_midi("E###4") == 67
+
+
+@pytest.mark.parametrize("midi,fifths,name", [
+    (70, 0, "B-4"), (70, -2, "B-4"), (70, 3, "A#4"),
+    (61, 0, "C#4"), (61, -4, "D-4"), (60, 5, "C4"), (21, 0, "A0"),
+])
+def test_midi_to_name_follows_the_key(midi, fifths, name):
+    assert midi_to_name(midi, fifths) == name
+    assert pitch_to_midi(name) == midi
+
+
+@pytest.mark.parametrize("key,fifths", [
+    ("C major", 0), ("A minor", 0), ("D major", 2), ("C minor", -3), ("Bb major", -2),
+    ("f# minor", 3), ("e", 1), ("E", 4), ("降B大調", -2), ("升F小調", 3), ("D小調", -1), ("Eb", -3),
+])
+def test_key_to_fifths(key, fifths):
+    assert key_to_fifths(key) == fifths
+
+
+@pytest.mark.parametrize("key", ["H major", "", "降Bb major", "major"])
+def test_unparseable_keys_raise(key):
+    with pytest.raises(ValueError):
+        key_to_fifths(key)
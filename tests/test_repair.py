@@ -0,0 +1,86 @@
+import pytest
+
+from src.music.repair import PartRepairer, UnrepairableScore
+
+
+@pytest.fixture
+def repairer():
+    return PartRepairer(("G3", "A7"), ["arco", "pizz"], "treble", "Violin")
+
+
+def note(pitch, duration=1.0, technique="arco"):
+    return {"pitch": pitch, "duration": duration, "technique": technique}
+
+
+@pytest.mark.parametrize("raw,expected", [
+    ("Bb4", "B-4"), ("bb4", "B-4"), ("C♯5", "C#5"), ("Db5", "C#5"),
+    ("C4 E4 G4", "C4 E4 G4"), ("C4,E4", "C4 E4"), (["G4", "B4"], "G4 B4"),
+])
+def test_pitch_spelling(repairer, raw, expected):
+    repaired, _ = repairer.repair_note(note(raw))
+    assert repaired["pitch"] == expected
+
+
+def test_correct_note_needs_no_fixes(repairer):
+    repaired, fixes = repairer.repair_note(note("G4"))
+    assert repaired == note("G4")
+    assert fixes == []
+
+
+def test_missing_octave_uses_the_middle_of_the_range(repairer):
+    # G3–A7 的中央為 G#5
+    repaired, fixes = repairer.repair_note(note("A"))
+    assert repaired["pitch"] == "A5"
+    assert fixes
+
+
+@pytest.mark.parametrize("raw,expected", [("C2", "C4"), ("C9", "C7"), ("F#3", "F#4")])
+def test_out_of_range_notes_are_folded_by_octaves(repairer, raw, expected):
+    repaired, _ = repairer.repair_note(note(raw))
+    assert repaired["pitch"] == expected
+
+
+def test_narrow_range_clamps_to_the_nearest_bound():
+    narrow = PartRepairer(("C4", "E4"), ["arco"], "treble")
+    assert narrow.repair_note(note("G4"))[0]["pitch"] == "E4"
+    assert narrow.repair_note(note("A3"))[0]["pitch"] == "C4"
+
+
+@pytest.mark.parametrize("raw,expected,fixed", [
+    (1.5, 1.5, False), (1 / 3, 1 / 3, False), (6, 6.0, False),
+    ("quarter", 1.0, True), ("1/3", 1 / 3, True), ("0.5", 0.5, True),
+    (0, 1.0, True), (-1, 1.0, True), ("long", 1.0, True), (None, 1.0, True), (True, 1.0, True),
+    (float("nan"), 1.0, True),
+])
+def test_duration_repair_only_touches_invalid_values(repairer, raw, expected, fixed):
+    repaired, fixes = repairer.repair_note(note("G4", raw))
+    assert repaired["duration"] == pytest.approx(expected)
+    assert bool(fixes) == fixed
+
+
+def test_rests_and_techniques(repairer):
+    assert repairer.repair_note(note("休止符", technique=None))[0] == note("rest", technique="none")
+    assert repairer.repair_note({"duration": 1.0})[0]["pitch"] == "rest"
+    assert repairer.repair_note(note("G4", technique="col legno"))[0]["technique"] == "arco"
+
+
+def test_unparseable_notes_are_dropped_and_reported(repairer):
+    data = {"notes": [note("G4"), note("H4"), "oops", note("A4")], "clef": "soprano"}
+    repaired, fixes = repairer.repair(data)
+    assert [n["pitch"] for n in repaired["notes"]] == ["G4", "A4"]
+    assert repaired["clef"] == "treble"
+    assert repaired["instrument"] == "Violin"
+    assert any("第 2 個音符" in fix for fix in fixes)
+    # 原資料不變
+    assert len(data["notes"]) == 4 and data["clef"] == "soprano"
+
+
+@pytest.mark.parametrize("data", [[], "notes", {}, {"notes": []}, {"notes": "C4"}, {"notes": [note("H4")]}])
+def test_structural_errors_are_unrepairable(repairer, data):
+    with pytest.raises(UnrepairableScore):
+        repairer.repair(data)
+
+
+def test_invalid_range_is_rejected():
+    with pytest.raises(ValueError):
+        PartRepairer(("G", "A7"), ["arco"], "treble")
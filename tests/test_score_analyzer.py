@@ -0,0 +1,93 @@
+import pytest
+
+from src.composer.score_analyzer import ScoreAnalyzer
+from src.music.compact import CompactPartBuilder
+
+
+def make_part(pitches, duration=1.0, time_signature="4/4", dynamics=None):
+    builder = CompactPartBuilder(["arco"], time_signature=time_signature)
+    for i, name in enumerate(pitches):
+        dynamic = dynamics[i % len(dynamics)] if dynamics else "mf"
+        builder.append({"pitch": name, "duration": duration, "technique": "arco", "dynamic": dynamic})
+    return builder.build()
+
+
+def parallels(upper, lower, **kwargs):
+    return ScoreAnalyzer(**kwargs)._check_parallels("cello", make_part(lower), "violin", make_part(upper))
+
+
+# 下聲部 C–D–E–F，上聲部在不同位置形成平行五度
+LOWER = ["C3", "D3", "E3", "F3", "G3", "A3", "B3", "C4"]
+
+
+def test_parallel_fifths_are_counted():
+    upper = ["G3", "A3", "B3", "C4", "E4", "F4", "D4", "E4"]
+    count, message = parallels(upper, LOWER)
+    # C–G → D–A → E–B → F–C 為三次平行五度
+    assert count == 3
+    assert "平行五度 3 次" in message and "Violin" in message
+
+
+def test_contrary_motion_and_oblique_motion_are_not_parallels():
+    upper = ["G4", "F4", "E4", "E4", "D4", "C4", "D4", "C4"]
+    assert parallels(upper, LOWER) == (0, "")
+
+
+def test_mostly_octave_motion_is_treated_as_doubling():
+    upper = [name[:-1] + str(int(name[-1]) + 1) for name in LOWER]
+    assert parallels(upper, LOWER) == (0, "")
+
+
+@pytest.mark.parametrize("ratio,expected", [(3 / 7, 0), (0.5, 3)])
+def test_doubling_ratio_boundary(ratio, expected):
+    # 七次共同移動中三次為平行八度；比例剛好達到時視為重疊，未達到時列為平行八度
+    upper = ["C4", "D4", "E4", "F4", "B4", "C5", "D5", "E5"]
+    count, _ = parallels(upper, LOWER, doubling_ratio=ratio)
+    assert count == expected
+
+
+def test_parallels_above_the_limit_are_issues_otherwise_warnings():
+    lower = make_part(LOWER, dynamics=["p", "f"])
+    few = make_part(["G3", "A3", "C4", "E4", "D4", "F4", "D4", "E4"], dynamics=["p", "f"])
+    many = make_part(["G3", "A3", "B3", "C4", "D4", "E4", "F#4", "G4"], dynamics=["p", "f"])
+    # 不在 instrument_configs 中的名稱不做音域檢查
+    analyzer = ScoreAnalyzer(min_notes=1, max_scale_run=20, max_parallels=2)
+
+    issues, warnings = analyzer.analyze({"low": lower, "high": few}, num_measures=2)
+    assert not issues
+    assert [w["target"] for w in warnings] == ["high"]
+
+    issues, warnings = analyzer.analyze({"low": lower, "high": many}, num_measures=2)
+    assert [i["target"] for i in issues] == ["high"]
+    assert not warnings
+
+
+def test_rests_break_parallel_motion():
+    upper = ["G3", "rest", "B3", "rest", "D4", "rest", "F#4", "rest"]
+    assert parallels(upper, LOWER) == (0, "")
+
+
+@pytest.mark.parametrize("num_measures,time_signature,found", [
+    (2, None, False),
+    (3, None, True),
+    (None, None, False),
+    (2, "3/4", True),
+])
+def test_measure_fill(num_measures, time_signature, found):
+    part = make_part(LOWER)
+    issues = ScoreAnalyzer()._check_measure_fill("cello", part, num_measures, time_signature)
+    assert bool(issues) == found
+
+
+def test_incomplete_last_measure_without_expected_count():
+    part = make_part(LOWER[:6], time_signature="4/4")
+    issues = ScoreAnalyzer()._check_measure_fill("cello", part, None, None)
+    assert "2 拍" in issues[0]["message"]
+
+
+def test_long_scale_run_and_flat_dynamics():
+    part = make_part(["C4", "D4", "E4", "F4", "G4", "A4", "B4", "C5", "D5"])
+    analyzer = ScoreAnalyzer(max_scale_run=8)
+    assert analyzer._check_scale_runs("violin", part)
+    assert analyzer._check_dynamics("violin", part)
+    assert not analyzer._check_scale_runs("violin", make_part(["C4", "E4", "D4", "G4"] * 3))
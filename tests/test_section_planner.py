@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.composer.music_theory_database import MusicTheoryDatabase
+from src.composer.section_planner import SectionPlanner
+from src.music.compact import CompactPartBuilder
+
+VIOLIN = SimpleNamespace(midi_range=(55, 105))
+
+
+def planner(num_measures=40, key="C major", time_signature="4/4", **structure):
+    params = {"num_measures": num_measures, "key": key, "time_signature": time_signature, "structure": structure}
+    return SectionPlanner(params, MusicTheoryDatabase())
+
+
+def layout(sections):
+    return [(s["name"], s["start"], s["measures"]) for s in sections]
+
+
+def test_form_proportions_and_splitting():
+    sections = planner(40, form="Sonata form").plan_sections(10)
+    assert layout(sections) == [
+        ("Exposition (1/2)", 1, 8), ("Exposition (2/2)", 9, 8),
+        ("Development (1/2)", 17, 6), ("Development (2/2)", 23, 6),
+        ("Recapitulation (1/2)", 29, 6), ("Recapitulation (2/2)", 35, 6),
+    ]
+    assert [s["index"] for s in sections] == list(range(6))
+
+
+def test_largest_remainder_keeps_the_total():
+    sections = planner(23, form="迴旋曲").plan_sections(100)
+    assert [s["measures"] for s in sections] == [5, 5, 5, 4, 4]
+    assert [s["name"] for s in sections] == ["A", "B", "A", "C", "A"]
+
+
+def test_framework_sections_take_priority():
+    structure = {"form": "sonata", "sections": [{"name": "Intro", "measures": 4}, {"name": "Main", "measures": 36}]}
+    sections = planner(40, **structure).plan_sections(20)
+    assert layout(sections) == [("Intro", 1, 4), ("Main (1/2)", 5, 18), ("Main (2/2)", 23, 18)]
+
+
+@pytest.mark.parametrize("sections", [
+    [{"name": "A", "measures": 10}],
+    [{"name": "A", "measures": 0}, {"name": "B", "measures": 40}],
+    [{"name": "A"}],
+    "A then B",
+])
+def test_invalid_framework_sections_fall_back(sections):
+    assert layout(planner(40, sections=sections).plan_sections(40)) == [("全曲", 1, 40)]
+
+
+def test_section_limit_must_be_positive():
+    with pytest.raises(ValueError):
+        planner().plan_sections(0)
+
+
+@pytest.mark.parametrize("key,tonic", [
+    ("C major", 0), ("Bb major", 10), ("f# minor", 6), ("降B大調", 10), ("升F小調", 6), ("E♭ major", 3), ("未定", None),
+])
+def test_tonic(key, tonic):
+    assert planner(key=key)._tonic() == tonic
+
+
+def test_boundary_anchors_use_the_dominant_inside_and_the_tonic_at_the_end():
+    plan = planner(40, key="D major", form="sonata")
+    sections = plan.plan_sections(40)
+    first, middle, last = (plan.section_instruction({"instruction": "x"}, s, sections, VIOLIN) for s in sections)
+    # 音域 G3–A7 的中央為 G#5，最接近的 A 與 D 分別為 A5、D5
+    assert first["section"]["boundary"]["start_pitch"] is None
+    assert first["section"]["boundary"]["end_pitch"] == "A5"
+    assert middle["section"]["boundary"]["start_pitch"] == "A5"
+    assert last["section"]["boundary"]["end_pitch"] == "D5"
+    assert "第 1-16 小節" in first["instruction"]
+    assert "D5 作為全曲的終止" in last["instruction"]
+
+
+def test_unknown_key_leaves_out_the_anchor_pitch():
+    plan = planner(40, key="自由調性", form="sonata")
+    sections = plan.plan_sections(40)
+    last = plan.section_instruction({}, sections[-1], sections, VIOLIN)
+    assert last["section"]["boundary"]["end_pitch"] is None
+    assert "None" not in last["instruction"]
+    assert "以主音作為全曲的終止" in last["instruction"]
+
+
+def test_stitch_aligns_every_section_to_its_length():
+    plan = planner(3, time_signature="3/4")
+    sections = [{"measures": 1}, {"measures": 2}]
+
+    def part(names):
+        builder = CompactPartBuilder(["arco"], time_signature="3/4")
+        for name in names:
+            builder.append({"pitch": name, "duration": 2.0, "technique": "arco"})
+        return builder.build()
+
+    stitched = plan.stitch([part(["C4", "D4"]), part(["E4"])], sections)
+    assert stitched.quarter_length == 9.0
+    assert [(n["pitch"], n["duration"]) for n in stitched.to_json()["notes"]] == [
+        ("C4", 2.0), ("D4", 1.0), ("E4", 2.0), ("rest", 4.0),
+    ]
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+
+from src.music.streaming import NoteStreamParser
+
+NOTES = [
+    {"pitch": "C4", "duration": 1.0, "technique": "arco"},
+    # 字串中的括號、跳脫字元與引號不可影響物件邊界
+    {"pitch": "E4 G4", "duration": 0.5, "technique": "legato", "comment": "a {brace} and ] \\\" quote"},
+    {"pitch": "rest", "duration": 1.5, "technique": "none", "extra": {"nested": [1, {"x": "}"}]}},
+]
+RESPONSE = "```json\n" + json.dumps({"notes": NOTES, "clef": "treble", "instrument": "Violin"}) + "\n```"
+
+
+def feed_in_chunks(text, size):
+    parser = NoteStreamParser()
+    seen = []
+    for i in range(0, len(text), size):
+        seen.extend(parser.feed(text[i:i + size]))
+    return parser, seen
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(RESPONSE)])
+def test_notes_are_parsed_across_any_chunk_split(size):
+    parser, seen = feed_in_chunks(RESPONSE, size)
+    assert seen == NOTES
+    assert parser.count == len(NOTES)
+    assert not parser.broken
+    assert parser.close()["clef"] == "treble"
+
+
+def test_notes_are_emitted_as_soon_as_they_close():
+    parser = NoteStreamParser()
+    first = json.dumps(NOTES[0])
+    assert parser.feed('{"notes": [' + first[:-1]) == []
+    assert parser.feed("}, ") == [NOTES[0]]
+
+
+def test_split_inside_the_notes_key():
+    parser = NoteStreamParser()
+    assert parser.feed('{"no') == []
+    assert parser.feed('tes"  :  [' + json.dumps(NOTES[0]) + "]}") == [NOTES[0]]
+
+
+def test_broken_note_stops_incremental_parsing():
+    parser = NoteStreamParser()
+    notes = parser.feed('{"notes": [{"pitch": "C4", "duration": 1.0,, }, {"pitch": "D4", "duration": 1.0}]}')
+    assert notes == []
+    assert parser.broken
+    with pytest.raises(OutputParserException):
+        parser.close()
+
+
+def test_text_after_the_array_is_ignored():
+    parser = NoteStreamParser()
+    notes = parser.feed('{"notes": [' + json.dumps(NOTES[0]) + '], "clef": "bass", "x": {"y": 1}}')
+    assert notes == [NOTES[0]]
+    assert parser.feed('{"pitch": "D4"}') == []
+    assert parser.count == 1
+
+
+# stream_score：串流組裝的聲部不完整時與非串流相同，交由 _parse_score 修正或重試
+
+GOOD = json.dumps({"notes": [{"pitch": "C4", "duration": 1.0, "technique": "arco"}] * 4,
+                   "clef": "treble", "instrument": "Violin"})
+PARAMS = {"style": "classical", "tempo": 120, "time_signature": "4/4", "key": "C major"}
+
+
+@pytest.fixture
+def violin():
+    from src.music.agent import ViolinAgent
+    return ViolinAgent("concertmaster", api_provider="mock", api_key=None)
+
+
+def stream_with(agent, *responses):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    agent.llm = FakeListChatModel(responses=list(responses))
+    return agent.stream_score(PARAMS, {"melody_position": "entire piece"})
+
+
+@pytest.mark.parametrize("first", [
+    '{"notes": [], "clef": "treble", "instrument": "Violin"}',
+    '{"notes": [{"pitch": "C4", "duration": 1.0,, }',
+])
+def test_empty_or_malformed_stream_is_retried(violin, first):
+    part = stream_with(violin, first, GOOD)
+    assert len(part) == 4
+
+
+def test_complete_stream_is_used_without_retry(violin):
+    part = stream_with(violin, GOOD)
+    assert len(part) == 4
+    assert violin.stream_metrics["notes"] == 4
@@ -0,0 +1,81 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.llm.cache import DiskLLMCache
+from src.llm.tokens import (TokenBudgetExceeded, TokenLedger, count_tokens, current_ledger,
+                            token_accounting_handler, use_ledger)
+from src.tracing import tracer
+
+
+def fake_llm(*responses, cache=None):
+    return FakeListChatModel(responses=list(responses), callbacks=[token_accounting_handler], cache=cache)
+
+
+def test_count_tokens_is_monotonic_and_zero_for_empty_text():
+    assert count_tokens("") == 0
+    assert 0 < count_tokens("hello") < count_tokens("hello " * 50)
+
+
+def test_totals_keep_first_call_order_and_add_a_total():
+    ledger = TokenLedger()
+    ledger.record("plan", None, 10, 5, "provider")
+    ledger.record("compose", "violin", 20, 30, "estimate")
+    ledger.record("plan", None, 1, 2, "provider")
+    ledger.record(None, None, 3, 3, "estimate")
+    totals = ledger.totals()
+    assert list(totals) == ["plan", "compose", "other", "total"]
+    assert totals["plan"] == {"calls": 2, "prompt_tokens": 11, "completion_tokens": 7}
+    assert totals["total"] == {"calls": 4, "prompt_tokens": 34, "completion_tokens": 40}
+    ledger.reset()
+    assert ledger.totals() == {}
+
+
+def test_budget_check_is_strictly_greater_than():
+    ledger = TokenLedger({"plan": 100})
+    ledger.check("plan", 100)
+    ledger.check("compose", 10 ** 6)
+    ledger.check(None, 10 ** 6)
+    with pytest.raises(TokenBudgetExceeded) as info:
+        ledger.check("plan", 101)
+    assert (info.value.stage, info.value.prompt_tokens, info.value.budget) == ("plan", 101, 100)
+
+
+def test_calls_are_recorded_with_the_span_stage_and_instrument():
+    ledger = TokenLedger()
+    with use_ledger(ledger), tracer.span("compose", stage="compose"), tracer.span("part", instrument="violin"):
+        fake_llm("la la la").invoke("write a melody")
+    assert current_ledger() is None
+    [call] = ledger.calls
+    assert (call["stage"], call["instrument"], call["source"]) == ("compose", "violin", "estimate")
+    assert call["prompt_tokens"] == count_tokens("write a melody")
+    assert call["completion_tokens"] == count_tokens("la la la")
+
+
+def test_calls_outside_use_ledger_are_neither_checked_nor_recorded():
+    ledger = TokenLedger({"plan": 1})
+    with tracer.span("plan", stage="plan"):
+        assert fake_llm("ok").invoke("a prompt that is longer than one token").content == "ok"
+    assert ledger.calls == []
+
+
+def test_over_budget_requests_fail_before_sending():
+    ledger = TokenLedger({"plan": 1})
+    llm = fake_llm("never")
+    with use_ledger(ledger), tracer.span("plan", stage="plan"):
+        with pytest.raises(TokenBudgetExceeded):
+            llm.invoke("a prompt that is longer than one token")
+    assert ledger.calls == []
+    assert llm.i == 0
+
+
+def test_cache_hits_are_not_recorded(tmp_path):
+    cache = DiskLLMCache(str(tmp_path / "llm_cache.sqlite"))
+    try:
+        ledger = TokenLedger()
+        llm = fake_llm("first", "second", cache=cache)
+        with use_ledger(ledger):
+            assert llm.invoke("same prompt").content == "first"
+            assert llm.invoke("same prompt").content == "first"
+        assert len(ledger.calls) == 1
+    finally:
+        cache.close()